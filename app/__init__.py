@@ -7,6 +7,8 @@ import os
 from flask import Flask, render_template
 from flask_sqlalchemy import SQLAlchemy
 from flask_socketio import SocketIO
+from app.database import configure_database, init_read_session
+from app.instrumentation import init_instrumentation
 
 # Configure app
 socketio = SocketIO()
@@ -14,8 +16,14 @@ app = Flask(__name__)
 app.config.from_object(os.environ["APP_SETTINGS"])
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = True
 
-# DB
+# DB (pooling, statement timeouts and the read replica: see database.py)
+configure_database(app)
 db = SQLAlchemy(app)
+init_read_session(app, db)
+
+# Request timing, SQL counts and the /metrics endpoint
+if app.config["METRICS_ENABLED"]:
+  init_instrumentation(app, db)
 # from .db_manage2 import populate_db, update_table, add_categorizations, \
 #  delimitDatabaseLists, filterLinks, uploadReviews
 # populate_db()
@@ -0,0 +1,111 @@
+"""
+Chunked maintenance jobs over the recipes table.
+
+A BatchJob streams the recipes batch_size rows at a time by keyset pagination
+on id, applies its transformation to each row and writes the changed rows back
+with one bulk update per batch. The id of the last row done is saved in
+job_progress in the same commit as the batch, so an interrupted job resumes
+where it stopped, and running a finished job again only visits newer recipes.
+"""
+import datetime
+import time
+from app import db
+from app.irsystem.models import Recipe, JobProgress
+
+
+"""
+Prints how many (of total, if known) items a loader has done, and how fast.
+"""
+def report_progress(name, done, total, started_at):
+  elapsed = max(time.time() - started_at, 1e-9)
+  count = done if total is None else "{}/{}".format(done, total)
+  print("{}: {} ({:.0f}/s)".format(name, count, done / elapsed), flush=True)
+
+
+"""
+Throughput of one run of a BatchJob.
+"""
+class JobStats(object):
+  def __init__(self, name):
+    self.name = name
+    self.rows_read = 0
+    self.rows_updated = 0
+    self.batches = 0
+    self.started_at = time.time()
+    self.elapsed = 0.0
+
+  @property
+  def rows_per_second(self):
+    return self.rows_read / max(self.elapsed, 1e-9)
+
+  def __repr__(self):
+    return "<JobStats {}: {} rows read, {} updated, {} batches, {:.1f}s, {:.0f} rows/s>".format(
+      self.name, self.rows_read, self.rows_updated, self.batches, self.elapsed,
+      self.rows_per_second)
+
+
+"""
+A resumable job that updates recipes row by row.
+
+  name: key of the job's progress in job_progress
+  columns: the Recipe columns transform reads (the id is always loaded)
+  transform: function of a row returning a dict of the columns to change, or
+    None to leave the row as is; anything it needs (patterns, lookup tables)
+    should be built once, before the job runs
+  criterion: optional filter on the rows to visit
+"""
+class BatchJob(object):
+  def __init__(self, name, columns, transform, criterion=None, batch_size=1000):
+    self.name = name
+    self.columns = list(columns)
+    self.transform = transform
+    self.criterion = criterion
+    self.batch_size = batch_size
+
+  def progress(self):
+    progress = db.session.query(JobProgress).filter_by(name=self.name).first()
+    if progress is None:
+      progress = JobProgress(name=self.name, last_id=0, rows_done=0)
+      db.session.add(progress)
+    return progress
+
+  def rows_after(self, last_id):
+    query = db.session.query(Recipe.id, *self.columns).filter(Recipe.id > last_id)
+    if self.criterion is not None:
+      query = query.filter(self.criterion)
+    return query.order_by(Recipe.id).limit(self.batch_size).all()
+
+  def run(self, restart=False):
+    """ Runs the job from its saved progress (from the start if restart) and
+        returns its JobStats.
+    """
+    stats = JobStats(self.name)
+    progress = self.progress()
+    if restart:
+      progress.last_id = 0
+      progress.rows_done = 0
+    while True:
+      rows = self.rows_after(progress.last_id)
+      if len(rows) == 0:
+        break
+      now = datetime.datetime.now()
+      updates = []
+      for row in rows:
+        changes = self.transform(row)
+        if changes:
+          changes["id"] = row.id
+          changes["updated_at"] = now
+          updates.append(changes)
+      if len(updates) > 0:
+        db.session.bulk_update_mappings(Recipe, updates)
+      progress.last_id = rows[-1].id
+      progress.rows_done += len(rows)
+      db.session.commit()
+      stats.rows_read += len(rows)
+      stats.rows_updated += len(updates)
+      stats.batches += 1
+      report_progress(self.name, stats.rows_read, None, stats.started_at)
+    db.session.commit()
+    stats.elapsed = time.time() - stats.started_at
+    print(stats, flush=True)
+    return stats
@@ -0,0 +1,160 @@
+"""
+Database access layer: engine and pool settings, read-replica routing and pool
+metrics, all configured from the DB_* settings of the Config class in use.
+
+configure_database(app) fills in Flask-SQLAlchemy's engine options before the
+first connection: pool size, overflow and checkout timeout, pre-ping and
+recycling, and on Postgres a per-statement timeout. Every pool is a
+TimedQueuePool, which records how long each checkout waited. When
+SQLALCHEMY_REPLICA_URI is set, read_query() runs the read-only search queries
+on the replica; otherwise on db.session.
+"""
+import threading
+import time
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.pool import QueuePool
+from app.green import patch_psycopg2
+
+# bind of the read replica in SQLALCHEMY_BINDS
+REPLICA_BIND = "replica"
+
+
+"""
+Checkout waits of one pool: how many checkouts, their total and longest wait
+in seconds, and how many gave up after the pool timeout.
+"""
+class PoolStats(object):
+  def __init__(self):
+    self.checkouts = 0
+    self.wait_seconds = 0.0
+    self.max_wait_seconds = 0.0
+    self.timeouts = 0
+    self._lock = threading.Lock()
+
+  def record(self, waited, timed_out=False):
+    with self._lock:
+      if timed_out:
+        self.timeouts += 1
+      else:
+        self.checkouts += 1
+        self.wait_seconds += waited
+        self.max_wait_seconds = max(self.max_wait_seconds, waited)
+
+  def as_dict(self):
+    with self._lock:
+      return {"checkouts": self.checkouts, "wait_seconds": self.wait_seconds,
+        "max_wait_seconds": self.max_wait_seconds, "timeouts": self.timeouts}
+
+
+"""
+A QueuePool that records the time each checkout waits for a connection,
+i.e. for a free slot once pool_size + max_overflow connections are in use.
+The stats outlive the pool when the engine recreates it.
+"""
+class TimedQueuePool(QueuePool):
+  def __init__(self, creator, **kw):
+    super(TimedQueuePool, self).__init__(creator, **kw)
+    self.stats = PoolStats()
+
+  def _do_get(self):
+    started_at = time.time()
+    try:
+      conn = super(TimedQueuePool, self)._do_get()
+    except Exception:
+      self.stats.record(time.time() - started_at, timed_out=True)
+      raise
+    self.stats.record(time.time() - started_at)
+    return conn
+
+  def recreate(self):
+    pool = super(TimedQueuePool, self).recreate()
+    pool.stats = self.stats
+    return pool
+
+
+"""
+Returns the engine options of the given config: pooling and, on Postgres,
+the statement timeout.
+"""
+def engine_options(config, uri):
+  url = make_url(uri)
+  options = {"pool_pre_ping": config["DB_POOL_PRE_PING"],
+    "pool_recycle": config["DB_POOL_RECYCLE"]}
+  if url.get_backend_name() == "sqlite":
+    # SQLite keeps its own single-connection pools
+    return options
+  options.update({"poolclass": TimedQueuePool,
+    "pool_size": config["DB_POOL_SIZE"],
+    "max_overflow": config["DB_MAX_OVERFLOW"],
+    "pool_timeout": config["DB_POOL_TIMEOUT"]})
+  if url.get_backend_name() == "postgresql" and config.get("DB_STATEMENT_TIMEOUT"):
+    options["connect_args"] = {"options": "-c statement_timeout={:d}".format(
+      config["DB_STATEMENT_TIMEOUT"])}
+  return options
+
+
+"""
+Sets Flask-SQLAlchemy's engine options and binds from the app's config. Call
+before the first connection is made.
+"""
+def configure_database(app):
+  config = app.config
+  if config["DB_GEVENT"]:
+    patch_psycopg2()
+  config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(config,
+    config["SQLALCHEMY_DATABASE_URI"])
+  if config.get("SQLALCHEMY_REPLICA_URI"):
+    binds = dict(config.get("SQLALCHEMY_BINDS") or {})
+    binds[REPLICA_BIND] = config["SQLALCHEMY_REPLICA_URI"]
+    config["SQLALCHEMY_BINDS"] = binds
+
+
+_read_session = None
+
+
+"""
+Creates the session read_query() uses when a replica is configured, scoped
+like db.session and removed with it at the end of each app context.
+"""
+def init_read_session(app, db):
+  global _read_session
+  if not app.config.get("SQLALCHEMY_REPLICA_URI"):
+    return
+  with app.app_context():
+    engine = db.get_engine(app, bind=REPLICA_BIND)
+  # Flask-SQLAlchemy maps every table to its default engine in binds, which
+  # takes precedence over bind: clear it so all tables read from the replica
+  _read_session = db.create_scoped_session({"bind": engine, "binds": {}})
+
+  @app.teardown_appcontext
+  def remove_read_session(exception=None):
+    _read_session.remove()
+
+
+"""
+Returns a query on the given entities for a read-only search query: on the
+replica when one is configured, else on db.session. The replica may lag
+behind the primary by a little.
+"""
+def read_query(*entities):
+  if _read_session is not None:
+    return _read_session.query(*entities)
+  from app import db
+  return db.session.query(*entities)
+
+
+"""
+Returns the checkout-wait stats and current usage of the pool of each of the
+app's engines (SQLite engines have none).
+"""
+def pool_stats(app, db):
+  stats = {}
+  for bind in [None] + list((app.config.get("SQLALCHEMY_BINDS") or {}).keys()):
+    pool = db.get_engine(app, bind=bind).pool
+    if not isinstance(pool, TimedQueuePool):
+      continue
+    entry = pool.stats.as_dict()
+    entry.update({"size": pool.size(), "checked_out": pool.checkedout(),
+      "overflow": pool.overflow()})
+    stats[bind or "default"] = entry
+  return stats
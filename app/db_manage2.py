@@ -1,297 +1,673 @@
 from app import db
-from app.irsystem.models import Recipe
+from app.irsystem.models import Recipe, Category, RecipeCategorization
+import datetime
+import hashlib
+import io
 import json
-from app.testdata import data
-from sqlalchemy import or_
-from sqlalchemy.exc import IntegrityError
+import os
+import time
+from sqlalchemy import func, or_
 from app.irsystem.controllers.search_controller import tokenize
-import pandas as pd
+from app.irsystem.models.helpers import recipe_content_hash
+from app.irsystem.models.allergens import compute_allergen_mask
+from app.irsystem.models.corpus_stats import invalidate_corpus_caches
+from app.batch_jobs import BatchJob, report_progress
 import numpy as np
+from collections import Counter
+from scipy import sparse
 from sklearn import ensemble
+import joblib
 import re
 
 """
 Populate Postgres database with complete dataset, found in app/full_format_recipes.json.
+Recipes and their categorizations are inserted chunk_size recipes at a time, with
+one commit per chunk. Ids are assigned here, from a category name -> id map kept
+in memory, so no row needs a round trip of its own. Records with the content of
+a recipe already loaded are skipped.
 """
-def populate_db():
+def populate_db(chunk_size=1000):
   recipes_exist = db.session.query(Recipe).filter_by(id=1).first()
   if recipes_exist:
     return
   with open("app/full_format_recipes.json") as f:
-    full_data = json.loads(f.readlines()[0])
-    for d in full_data:
-      if len(d) == 11:
-        # add main recipe information
-        directions = " ".join(d["directions"])
-        ingredients = " ".join(d["ingredients"])
-        recipe = Recipe(
-            directions = directions,
-            ingredients = ingredients,
-            fat = d["fat"],
-            date = d["date"],
-            calories = d["calories"],
-            description = d["desc"],
-            protein = d["protein"],
-            rating = d["rating"],
-            title = d["title"],
-            sodium = d["sodium"]
-        )
-        db.session.add(recipe)
-        db.session.flush()
-        db.session.commit()
+    full_data = [d for d in json.loads(f.readlines()[0]) if len(d) == 11]
 
-        # add categories
-        for category in d["categories"]:
-          category_id = None
-          try:
-            c = Category(name=category)
-            db.session.add(c)
-            db.session.flush()
-            db.session.commit()
-            category_id = c.id
-          except IntegrityError:
-            db.session.rollback()
-            existing_category = db.session.query(Category).filter_by(name=category).first()
-            category_id = existing_category.id
-          db.session.add(RecipeCategorization(
-            recipe_id = recipe.id,
-            category_id = category_id
-          ))
-          db.session.flush()
-          db.session.commit()
+  category_ids = CategoryIds()
+  hash_ids = load_content_hash_ids()
+  next_recipe_id = (db.session.query(func.max(Recipe.id)).scalar() or 0) + 1
+  started_at = time.time()
+  for start in range(0, len(full_data), chunk_size):
+    now = datetime.datetime.now()
+    recipes = []
+    categorizations = []
+    for d in full_data[start:start + chunk_size]:
+      content_hash = recipe_content_hash(d["title"], d["ingredients"], d["directions"])
+      if content_hash in hash_ids:
+        continue
+      # add main recipe information
+      directions = " ".join(d["directions"])
+      ingredients = " ".join(d["ingredients"])
+      recipe_id = next_recipe_id
+      next_recipe_id += 1
+      hash_ids[content_hash] = recipe_id
+      recipes.append({
+        "id": recipe_id,
+        "directions": directions,
+        "ingredients": ingredients,
+        "fat": d["fat"],
+        "date": d["date"],
+        "calories": d["calories"],
+        "description": d["desc"],
+        "protein": d["protein"],
+        "rating": d["rating"],
+        "title": d["title"],
+        "sodium": d["sodium"],
+        "allergen_mask": compute_allergen_mask(ingredients),
+        "content_hash": content_hash,
+        "created_at": now,
+        "updated_at": now
+      })
+
+      # add categories
+      categorizations += category_ids.categorizations(recipe_id, d["categories"], now)
+    bulk_insert(Category, category_ids.take_new_rows())
+    bulk_insert(Recipe, recipes)
+    bulk_insert(RecipeCategorization, categorizations)
+    db.session.commit()
+    report_progress("populate_db", min(start + chunk_size, len(full_data)), len(full_data),
+      started_at)
+  reset_id_sequence(Recipe)
+  reset_id_sequence(Category)
+  invalidate_corpus_caches()
+
+
+"""
+Returns the id of every recipe with a content hash, keyed by the hash.
+"""
+def load_content_hash_ids():
+  return dict(db.session.query(Recipe.content_hash, Recipe.id)
+    .filter(Recipe.content_hash.isnot(None)).all())
+
+
+"""
+Category name -> id map, loaded once from the categories table. Names not seen
+before get the next ids, and their rows are queued until take_new_rows.
+"""
+class CategoryIds(object):
+  def __init__(self):
+    self.ids = dict(db.session.query(Category.name, Category.id).all())
+    self.next_id = max(self.ids.values(), default=0) + 1
+    self.new_rows = []
+
+  def categorizations(self, recipe_id, names, now):
+    rows = []
+    for name in names:
+      if name not in self.ids:
+        self.ids[name] = self.next_id
+        self.new_rows.append({"id": self.next_id, "name": name,
+          "created_at": now, "updated_at": now})
+        self.next_id += 1
+      rows.append({"recipe_id": recipe_id, "category_id": self.ids[name],
+        "created_at": now, "updated_at": now})
+    return rows
+
+  def take_new_rows(self):
+    rows, self.new_rows = self.new_rows, []
+    return rows
+
+
+# NULL marker of the COPY rows written by copy_csv
+COPY_NULL = "\\N"
+
+
+"""
+Inserts rows (dicts with the same keys) into the table of model: with COPY on
+Postgres, with one executemany elsewhere. Runs in the session's transaction.
+"""
+def bulk_insert(model, rows):
+  if len(rows) == 0:
+    return
+  if db.engine.dialect.name != "postgresql":
+    db.session.bulk_insert_mappings(model, rows)
+    return
+  columns = list(rows[0].keys())
+  cursor = db.session.connection().connection.cursor()
+  cursor.copy_expert("COPY {} ({}) FROM STDIN WITH (FORMAT csv, NULL '{}')".format(
+    model.__tablename__, ", ".join(columns), COPY_NULL), copy_csv(rows, columns))
+
+
+"""
+Returns the given columns of rows as the CSV input of COPY ... WITH (FORMAT csv,
+NULL '\\N'): None as an unquoted \\N (NULL), numbers unquoted and anything else
+quoted, so no string (not even "" or "\\N") is read as NULL.
+"""
+def copy_csv(rows, columns):
+  buf = io.StringIO()
+  for row in rows:
+    buf.write(",".join(copy_csv_field(row[c]) for c in columns))
+    buf.write("\n")
+  buf.seek(0)
+  return buf
+
+
+def copy_csv_field(value):
+  if value is None:
+    return COPY_NULL
+  if isinstance(value, (int, float)):
+    return str(value)
+  return '"' + str(value).replace('"', '""') + '"'
+
+
+"""
+Moves the id sequence of the table of model past its largest id, after rows were
+inserted with explicit ids. Only needed on Postgres.
+"""
+def reset_id_sequence(model):
+  if db.engine.dialect.name != "postgresql":
+    return
+  db.session.execute("SELECT setval(pg_get_serial_sequence('{0}', 'id'), "
+    "coalesce(max(id), 0) + 1, false) FROM {0}".format(model.__tablename__))
+  db.session.commit()
+
+
+"""
+Yields the elements of the JSON array in file f one at a time, reading chunk_size
+characters at a time, so the file is never loaded whole. The elements must be
+objects or arrays (a number could be cut at a chunk boundary).
+"""
+def iter_json_array(f, chunk_size=1 << 20):
+  decoder = json.JSONDecoder()
+  buf = ""
+  pos = 0
+  opened = False
+  eof = False
+  while True:
+    # skip the opening bracket, separators and whitespace
+    while pos < len(buf) and (buf[pos].isspace() or buf[pos] == ","
+        or (buf[pos] == "[" and not opened)):
+      opened = opened or buf[pos] == "["
+      pos += 1
+    if pos < len(buf) and buf[pos] == "]":
+      return
+    if pos < len(buf):
+      try:
+        value, end = decoder.raw_decode(buf, pos)
+      except ValueError:
+        # the element continues in the next chunk
+        if eof:
+          raise
+      else:
+        yield value
+        pos = end
+        continue
+    elif eof:
+      return
+    chunk = f.read(chunk_size)
+    eof = len(chunk) == 0
+    buf = buf[pos:] + chunk
+    pos = 0
+
+
+# dysfunctional Epicurious links, and stray <p>/<a> tags, in descriptions
+EPI_LINK_RE = re.compile(r"(</?epi:?recip?elink id=\"[0-9]*\"\"?>)|(<epi: ?recipeLink ?=\"[0-9]*\">)|(</epi:?recipe[lL]ink>)|(</epi:recipe>)|(<epi:recipe link=\"\" id=\"[0-9]*\">)|(epi:recipeLink=\"?[0-9]*\")|(epi:recipelinka?)|(<epi:recipeLink id ?\"[0-9]*\">)|(</a?>)|(<epi:recieplink id=\"[0-9]*\">)|(</epi:reciep?link>)|(</?[pP]>)|(< id=\"[0-9]* \">)|(<epirecipe:link id=\"[0-9]*\")|(</epirecipe:link>)")
+
+"""
+Removes dysfunctional Epicurious links from a description.
+"""
+def clean_description(desc):
+  if desc is None:
+    return None
+  return EPI_LINK_RE.sub("", desc)
+
+
+"""
+Returns the review of each recipe in the review dataset, keyed by its content hash.
+"""
+def load_reviews(path="app/full_format_recipes_wrestrictedreview.json"):
+  reviews = {}
+  with open(path) as f:
+    for d in iter_json_array(f):
+      if "title" in d and "ingredients" in d and "directions" in d and "selected_review" in d:
+        content_hash = recipe_content_hash(d["title"], d["ingredients"], d["directions"])
+        reviews[content_hash] = d["selected_review"][0]
+  return reviews
+
+
+"""
+Returns the recipes table row of recipe record d, in its final form: lists joined
+with ";;;", description without Epicurious links, review attached.
+"""
+def recipe_row(d, recipe_id, content_hash, reviews, now):
+  ingredients = ";;;".join(d["ingredients"])
+  return {
+    "id": recipe_id,
+    "directions": ";;;".join(d["directions"]),
+    "ingredients": ingredients,
+    "fat": d["fat"],
+    "date": d["date"],
+    "calories": d["calories"],
+    "description": clean_description(d["desc"]),
+    "protein": d["protein"],
+    "rating": d["rating"],
+    "title": d["title"],
+    "sodium": d["sodium"],
+    "categories": ";;;".join(d["categories"]),
+    "review": reviews.get(content_hash),
+    "allergen_mask": compute_allergen_mask(ingredients),
+    "content_hash": content_hash,
+    "created_at": now,
+    "updated_at": now
+  }
+
+
+"""
+Loads the recipe dataset in one streaming pass, replacing populate_db,
+update_table, delimitDatabaseLists, filterLinks and uploadReviews: each recipe
+is parsed, joined with its review, cleaned and written once, with its
+categorizations, chunk_size recipes per commit.
+
+Recipe ids are the 1-based positions of the recipes in the file. Records whose
+content hash is already in the table are skipped, which drops duplicates and
+makes the committed chunks the checkpoint: if a load is interrupted, running it
+again resumes with the first recipe not written.
+"""
+def load_recipes(chunk_size=1000, path="app/full_format_recipes.json",
+    reviews_path="app/full_format_recipes_wrestrictedreview.json"):
+  reviews = load_reviews(reviews_path)
+  hash_ids = load_content_hash_ids()
+  category_ids = CategoryIds()
+  started_at = time.time()
+  written = 0
+  recipes = []
+  categorizations = []
+  recipe_id = 0
+  with open(path) as f:
+    for d in iter_json_array(f):
+      if len(d) != 11:
+        continue
+      recipe_id += 1
+      content_hash = recipe_content_hash(d["title"], d["ingredients"], d["directions"])
+      if content_hash in hash_ids:
+        continue
+      hash_ids[content_hash] = recipe_id
+      now = datetime.datetime.now()
+      recipes.append(recipe_row(d, recipe_id, content_hash, reviews, now))
+      categorizations += category_ids.categorizations(recipe_id, d["categories"], now)
+      if len(recipes) == chunk_size:
+        write_recipes(recipes, categorizations, category_ids)
+        written += len(recipes)
+        report_progress("load_recipes", written, None, started_at)
+        recipes = []
+        categorizations = []
+  if len(recipes) > 0:
+    write_recipes(recipes, categorizations, category_ids)
+    written += len(recipes)
+    report_progress("load_recipes", written, None, started_at)
+  reset_id_sequence(Recipe)
+  reset_id_sequence(Category)
+  invalidate_corpus_caches()
+
+
+"""
+Writes one chunk of load_recipes, with its new categories, in one transaction.
+"""
+def write_recipes(recipes, categorizations, category_ids):
+  bulk_insert(Category, category_ids.take_new_rows())
+  bulk_insert(Recipe, recipes)
+  bulk_insert(RecipeCategorization, categorizations)
+  db.session.commit()
 
 
 """
 Update recipes table to add recipe categories to recipes table and restore original capitalizations.
+Each record is matched to its row by content hash, not by position: populate_db
+skips duplicate records, so ids do not follow the file. Recipes loaded before
+content hashes existed need backfill_content_hashes first.
 """
-def update_table():
-  first_recipe = db.session.query(Recipe).filter_by(id=1).first()
-  if first_recipe.categories is not None:
+def update_table(chunk_size=1000, path="app/full_format_recipes.json"):
+  first_recipe = db.session.query(Recipe).order_by(Recipe.id).first()
+  if first_recipe is None or first_recipe.categories is not None:
     return
-  with open("app/full_format_recipes.json") as f:
-    full_data = json.loads(f.readlines()[0])
-    for i in range(3, len(full_data) + 1):
-      d = full_data[i - 1]
-      if len(d) == 11:
-        directions = " ".join(d["directions"])
-        ingredients = " ".join(d["ingredients"])
-        categories = " ".join(d["categories"])
-        recipe = db.session.query(Recipe).filter_by(id=i).first()
-
-        # updating
-        recipe.directions = directions
-        recipe.ingredients = ingredients
-        recipe.description = d["desc"]
-        recipe.title = d["title"]
-        recipe.categories = categories
-        db.session.flush()
+  hash_ids = load_content_hash_ids()
+  updates = []
+  with open(path) as f:
+    for d in iter_json_array(f):
+      if len(d) != 11:
+        continue
+      recipe_id = hash_ids.get(recipe_content_hash(d["title"], d["ingredients"], d["directions"]))
+      if recipe_id is None:
+        continue
+      ingredients = " ".join(d["ingredients"])
+      updates.append({
+        "id": recipe_id,
+        "directions": " ".join(d["directions"]),
+        "ingredients": ingredients,
+        "allergen_mask": compute_allergen_mask(ingredients),
+        "description": d["desc"],
+        "title": d["title"],
+        "categories": " ".join(d["categories"])
+      })
+      if len(updates) == chunk_size:
+        db.session.bulk_update_mappings(Recipe, updates)
         db.session.commit()
+        updates = []
+  if len(updates) > 0:
+    db.session.bulk_update_mappings(Recipe, updates)
+    db.session.commit()
+  invalidate_corpus_caches()
 
 
-unique_categories = [] # unique categories of all recipe titles
-title_words_set = [] # unique words in all recipe titles
-title_to_index = {}
-index_to_title = {}
-recipe_titles = []
-x_train = None # placeholder value
-x_test = None # placeholder value
-y_train = None # placeholder value
-y_test = None # placeholder value
 meal_dict = {"0" : "breakfast", "1": "lunch", "2": "dinner"}
 
+# trained meal type models are saved here as meal_type_<version>.joblib
+MEAL_MODEL_DIR = "app/meal_type_models"
+# bumped when the saved model layout changes; older files are not loaded
+MEAL_MODEL_FORMAT = 1
+
 """
 Update recipes table to include ML-determined meal type for each recipe, i.e.
-"breakfast," "lunch," or "dinner."
+"breakfast," "lunch," or "dinner." Trains a new model (see classify_recipes)
+and saves it for classify_new_recipes.
 """
 def add_categorizations():
   placeholder_exists = db.session.query(Category).filter_by(name="PLACEHOLDER XXX").first()
   if placeholder_exists is not None:
     return
-  x_train, x_test, y_train, y_test = classify_recipes()
+  model = classify_recipes()
+  save_meal_type_model(model)
   c = Category(name="PLACEHOLDER XXX")
   db.session.add(c)
   db.session.flush()
   db.session.commit()
-  i = 0
-  for j in x_train.index:
-    recipe = db.session.query(Recipe).filter_by(title=recipe_titles[j]).first()
-    if recipe:
-      recipe.meal_type = meal_dict[y_train[i]]
-      db.session.flush()
-      db.session.commit()
-    i += 1
-  i = 0
-  for j in x_test.index:
-    recipe = db.session.query(Recipe).filter_by(title=recipe_titles[j]).first()
-    if recipe:
-      recipe.meal_type = meal_dict[y_test[i]]
-      db.session.flush()
-      db.session.commit()
-    i += 1
-
-
-def classify_recipes():
+  classify_meal_types(model)
+  invalidate_corpus_caches()
+
+
+"""
+Sets the meal type of the recipes added since the last run (those whose meal_type
+is NULL) with the latest saved model, without retraining.
+"""
+def classify_new_recipes():
+  classify_meal_types(load_meal_type_model(), only_missing=True)
+  invalidate_corpus_caches()
+
+
+"""
+Predicts the meal type of every recipe (or only of those with no meal_type) from
+its title and categories, batch_size recipes at a time, and writes them back by
+id with one bulk update and commit per batch. Categories are read from the
+recipe_categorizations written with the recipes, not from recipes.categories,
+which populate_db only fills in later (see update_table).
+"""
+def classify_meal_types(model, only_missing=False, batch_size=1000):
+  started_at = time.time()
+  done = 0
+  last_id = 0
+  while True:
+    query = db.session.query(Recipe.id, Recipe.title).filter(Recipe.id > last_id)
+    if only_missing:
+      query = query.filter(Recipe.meal_type.is_(None))
+    rows = query.order_by(Recipe.id).limit(batch_size).all()
+    if len(rows) == 0:
+      break
+    categories = load_recipe_categories([recipe_id for recipe_id, _ in rows])
+    recipes = [(title or "", categories.get(recipe_id, [])) for recipe_id, title in rows]
+    _, title_tf, category_tf, _, _ = build_features(recipes, model["title_vocab"],
+      model["category_vocab"])
+    predictions = model["classifier"].predict(meal_type_features(model, title_tf, category_tf))
+    db.session.bulk_update_mappings(Recipe, [{"id": row[0], "meal_type": meal_dict[m_class]}
+      for row, m_class in zip(rows, predictions)])
+    db.session.commit()
+    last_id = rows[-1][0]
+    done += len(rows)
+    report_progress("classify_meal_types", done, None, started_at)
+
+
+"""
+Returns the category names of each of the given recipes, keyed by recipe id.
+"""
+def load_recipe_categories(recipe_ids):
+  categories = {}
+  rows = db.session.query(RecipeCategorization.recipe_id, Category.name)\
+    .join(Category, Category.id == RecipeCategorization.category_id)\
+    .filter(RecipeCategorization.recipe_id.in_(recipe_ids))\
+    .order_by(RecipeCategorization.id)
+  for recipe_id, name in rows:
+    categories.setdefault(recipe_id, []).append(name)
+  return categories
+
+
+"""
+Trains a meal type classifier on the recipes whose categories name a meal, in
+parallel on n_jobs cores (-1: all). Returns the model: the classifier with the
+vocabularies and idf weights its features were built with.
+"""
+def classify_recipes(n_jobs=-1):
   with open("app/full_format_recipes.json") as f:
-    data = json.loads(f.readlines()[0])
-    fill_data_structures(data)
-
-    data_df1 = pd.DataFrame(columns = title_words_set, index = index_to_title.keys())
-    data_df2 = pd.DataFrame(columns = unique_categories, index = index_to_title.keys())
-    populate_matrices(data, data_df1, data_df2)
-
-    breakfast_inds = np.where(data_df2["breakfast"] > 0)[0]
-    lunch_inds = np.where(data_df2["lunch"] > 0)[0]
-    dinner_inds = np.where(data_df2["dinner"] > 0)[0]
-    breakfast_inds = [ind for ind in list(breakfast_inds) if ind not in lunch_inds and ind not in dinner_inds]
-    lunch_inds = [ind for ind in list(lunch_inds) if ind not in breakfast_inds and ind not in dinner_inds]
-    dinner_inds = [ind for ind in list(dinner_inds) if ind not in lunch_inds and ind not in breakfast_inds]
-
-    del data_df2['breakfast']
-    del data_df2['lunch']
-    del data_df2['dinner']
-    y_train = pd.DataFrame(columns = ["CLASS"], index = index_to_title.keys())
-    y_train.loc[breakfast_inds,"CLASS"] = "0"
-    y_train.loc[lunch_inds,"CLASS"] = "1"
-    y_train.loc[dinner_inds,"CLASS"] = "2"
-    y_train = y_train.dropna()
-
-    data_df = pd.concat([data_df1, data_df2], axis=1)
-    inds_train = breakfast_inds + lunch_inds + dinner_inds
-    inds_train.sort()
-    inds_train = data_df.index.isin(inds_train)
-    x_train = data_df.iloc[inds_train,:]
-    x_test = data_df.iloc[~inds_train,:]
-
-    clf = ensemble.RandomForestClassifier(n_estimators = 100)
-    clf.fit(x_train, y_train["CLASS"])
-    y_train_pred = clf.predict(x_train)
-    y_test_pred = clf.predict(x_test)
-    return x_train, x_test, y_train_pred, y_test_pred
-
-
-def fill_data_structures(data):
-  j = 0
-  for i in range(len(data)):
-    if len(data[i]) == 11:
-        title = data[i]['title']
-        if title not in title_to_index:
-            title_to_index[title] = []
-            title_to_index[title].append(j)
-        else:
-            title_to_index[title].append(j)
-        index_to_title[j] = title
-        
-        # add any new categories to set
-        categs = data[i]['categories']
-        for c in categs:
-            c_l = c.lower()
-            if c_l not in unique_categories:
-                unique_categories.append(c_l)
-                
-        # add any new titles to set
-        title_words = tokenize(title)
-        for w in title_words:
-            if w not in title_words_set:
-                title_words_set.append(w)
-        recipe_titles.append(title)
-        j = j + 1
-
-
-def populate_matrices(data, data_df1, data_df2):
-  N = len(index_to_title) # number of total recipes
-  for col in data_df1.columns:
-      data_df1[col].values[:] = 0
-  for col in data_df2.columns:
-      data_df2[col].values[:] = 0
-
-  # for each recipe
-  i = 0
-  for r in data:
-      if len(r) == 11:
-          title_words = tokenize(r['title'])
-          category_words = r['categories']
-          for word in title_words:
-              data_df1[word][i] = data_df1[word][i] + 1
-          for word in category_words:
-              word = word.lower()
-              data_df2[word][i] += 1
-          if len(category_words) > 0:
-              data_df2.iloc[i,:] = data_df2.iloc[i,:]/len(category_words)
-          data_df1.iloc[i,:] = data_df1.iloc[i,:]/len(title_words)
-          i += 1
-          
-  data_df1 = data_df1 * np.log(N / np.count_nonzero(data_df1, axis = 0) )
-  data_df2 = data_df2 * np.log(N / np.count_nonzero(data_df2, axis = 0) )
+    recipes = ((d['title'], d['categories']) for d in iter_json_array(f) if len(d) == 11)
+    recipe_titles, title_tf, category_tf, title_vocab, category_vocab = build_features(recipes)
+
+  # a recipe tagged with several meals is labeled with the last of
+  # breakfast, lunch, dinner
+  labels = np.full(len(recipe_titles), "", dtype=object)
+  for m_class, meal in sorted(meal_dict.items()):
+    if meal in category_vocab:
+      tagged = category_tf.getcol(category_vocab[meal]).toarray().ravel() > 0
+      labels[tagged] = m_class
+  train_rows = np.flatnonzero(labels != "")
+
+  # the meal categories are the labels, not features
+  meal_cols = {category_vocab[meal] for meal in meal_dict.values() if meal in category_vocab}
+  model = {
+    "format": MEAL_MODEL_FORMAT,
+    "version": datetime.datetime.utcnow().strftime("%Y%m%d%H%M%S"),
+    "title_vocab": title_vocab,
+    "category_vocab": category_vocab,
+    "category_cols": [j for j in range(len(category_vocab)) if j not in meal_cols],
+    "title_idf": compute_idf(title_tf),
+    "category_idf": compute_idf(category_tf)
+  }
+  features = meal_type_features(model, title_tf, category_tf)
+  clf = ensemble.RandomForestClassifier(n_estimators = 100, n_jobs = n_jobs)
+  clf.fit(features[train_rows], labels[train_rows].astype(str))
+  model["classifier"] = clf
+  return model
+
+
+"""
+Builds the classifier features of recipes, an iterable of (title, categories)
+pairs: the term frequencies of the title words (counts over the number of words)
+and of the lowercased categories (counts over the number of categories), as CSR
+matrices with one row per recipe. Words outside the given vocabularies are
+ignored; without vocabularies, they are built from recipes. Returns the titles,
+both matrices and both word -> column dicts.
+"""
+def build_features(recipes, title_vocab=None, category_vocab=None):
+  fixed_vocab = title_vocab is not None
+  title_vocab = {} if title_vocab is None else title_vocab
+  category_vocab = {} if category_vocab is None else category_vocab
+  recipe_titles = []
+  title_entries = ([], [], [])
+  category_entries = ([], [], [])
+  for title, categories in recipes:
+    i = len(recipe_titles)
+    recipe_titles.append(title)
+    title_words = tokenize(title)
+    category_words = [c.lower() for c in categories]
+    for words, vocab, entries in ((title_words, title_vocab, title_entries),
+        (category_words, category_vocab, category_entries)):
+      for word, count in Counter(words).items():
+        if fixed_vocab and word not in vocab:
+          continue
+        entries[0].append(i)
+        entries[1].append(vocab.setdefault(word, len(vocab)))
+        entries[2].append(count / len(words))
+  shape = len(recipe_titles)
+  title_tf = sparse.csr_matrix((title_entries[2], (title_entries[0], title_entries[1])),
+    shape=(shape, len(title_vocab)))
+  category_tf = sparse.csr_matrix((category_entries[2], (category_entries[0], category_entries[1])),
+    shape=(shape, len(category_vocab)))
+  return recipe_titles, title_tf, category_tf, title_vocab, category_vocab
+
+
+"""
+Returns the log(N / df) of each term of the term frequency matrix tf (CSR, one
+row per document).
+"""
+def compute_idf(tf):
+  df = np.bincount(tf.indices, minlength=tf.shape[1])
+  return np.log(tf.shape[0] / np.maximum(df, 1))
+
+
+"""
+Returns the TF-IDF features of the model for the given term frequency matrices.
+"""
+def meal_type_features(model, title_tf, category_tf):
+  cols = model["category_cols"]
+  return sparse.hstack([
+    title_tf.multiply(model["title_idf"].reshape(1, -1)),
+    category_tf[:, cols].multiply(model["category_idf"][cols].reshape(1, -1))
+  ]).tocsr()
+
+
+"""
+Saves a model from classify_recipes as MEAL_MODEL_DIR/meal_type_<version>.joblib.
+"""
+def save_meal_type_model(model):
+  os.makedirs(MEAL_MODEL_DIR, exist_ok=True)
+  path = os.path.join(MEAL_MODEL_DIR, "meal_type_{}.joblib".format(model["version"]))
+  joblib.dump(model, path)
+  return path
+
+
+"""
+Loads the latest saved model (or the given version) from MEAL_MODEL_DIR.
+"""
+def load_meal_type_model(version=None):
+  if version is None:
+    names = sorted(n for n in os.listdir(MEAL_MODEL_DIR)
+      if n.startswith("meal_type_") and n.endswith(".joblib"))
+    if len(names) == 0:
+      raise FileNotFoundError("no meal type model in " + MEAL_MODEL_DIR)
+    name = names[-1]
+  else:
+    name = "meal_type_{}.joblib".format(version)
+  model = joblib.load(os.path.join(MEAL_MODEL_DIR, name))
+  if model.get("format") != MEAL_MODEL_FORMAT:
+    raise ValueError("{} has model format {}, expected {}".format(
+      name, model.get("format"), MEAL_MODEL_FORMAT))
+  return model
 
 """
 Updates recipe table in database, such that for each recipe, the list of 
 ingredients, the list of directions, and the list of categories are each stored
-as a string, with ";;;" separating each item of the list.
+as a string, with ";;;" separating each item of the list. Recipes are matched
+to the dataset by their content hash, so run backfill_content_hashes first on
+recipes loaded before it existed.
 """
-def delimitDatabaseLists():
-  placeholder = db.session.query(Recipe).filter_by(title="PLACEHOLDER XY").first()
-  if placeholder is not None:
-    return
-  r = Recipe(title="PLACEHOLDER XY")
-  db.session.add(r)
-  db.session.flush()
-  db.session.commit()
+def delimitDatabaseLists(restart=False):
+  lists = {}
   with open("app/full_format_recipes.json") as f:
-    data = json.loads(f.readlines()[0])
-    for i in range(len(data)):
-      d = data[i]
+    for d in iter_json_array(f):
       if len(d) == 11:
-        ingredients = " ".join(d["ingredients"])
-        recipe = db.session.query(Recipe).filter_by(ingredients=ingredients).first()
-        if recipe:
-          updated_ingredients = ";;;".join(d["ingredients"])
-          updated_directions = ";;;".join(d["directions"])
-          updated_categories = ";;;".join(d["categories"])
+        content_hash = recipe_content_hash(d["title"], d["ingredients"], d["directions"])
+        lists[content_hash] = (";;;".join(d["ingredients"]),
+          ";;;".join(d["directions"]), ";;;".join(d["categories"]))
 
-          # updating recipe fields
-          recipe.ingredients = updated_ingredients
-          recipe.directions = updated_directions
-          recipe.categories = updated_categories
-          db.session.flush()
-          db.session.commit()
+  def delimit(row):
+    if row.content_hash not in lists:
+      return None
+    updated_ingredients, updated_directions, updated_categories = lists[row.content_hash]
+    return {"ingredients": updated_ingredients,
+      "allergen_mask": compute_allergen_mask(updated_ingredients),
+      "directions": updated_directions, "categories": updated_categories}
+
+  BatchJob("delimit_database_lists", [Recipe.content_hash], delimit,
+    criterion=Recipe.content_hash.isnot(None)).run(restart)
+  invalidate_corpus_caches()
 
 """
 Cleans data to remove dysfunctional Epicurious links.
 """
-def filterLinks():
-  recipes_to_filter = Recipe.query.filter(
-    or_(
-      Recipe.description.like("%<epi%"),
-      Recipe.description.like("%</epi%")
-    )
-  ).all()
-  for r in recipes_to_filter:
-    desc = r.description
-    desc = re.sub(r"(</?epi:?recip?elink id=\"[0-9]*\"\"?>)|(<epi: ?recipeLink ?=\"[0-9]*\">)|(</epi:?recipe[lL]ink>)|(</epi:recipe>)|(<epi:recipe link=\"\" id=\"[0-9]*\">)|(epi:recipeLink=\"?[0-9]*\")|(epi:recipelinka?)|(<epi:recipeLink id ?\"[0-9]*\">)|(</a?>)|(<epi:recieplink id=\"[0-9]*\">)|(</epi:reciep?link>)|(</?[pP]>)|(< id=\"[0-9]* \">)|(<epirecipe:link id=\"[0-9]*\")|(</epirecipe:link>)", 
-      "", desc)
-    r.description = desc
-    db.session.flush()
-    db.session.commit()
+def filterLinks(restart=False):
+  def filter_links(row):
+    description = clean_description(row.description)
+    if description == row.description:
+      return None
+    return {"description": description}
+
+  BatchJob("filter_links", [Recipe.description], filter_links, criterion=or_(
+    Recipe.description.like("%<epi%"),
+    Recipe.description.like("%</epi%")
+  )).run(restart)
 
 
 """
 Uploads user reviews (if available) for each recipe.
 """
-def uploadReviews():
-  placeholder = db.session.query(Recipe).filter_by(title="PLACEHOLDER XY").first()
-  if placeholder is not None:
-    return
-  r = Recipe(title="PLACEHOLDER XY")
-  db.session.add(r)
-  db.session.flush()
-  db.session.commit()
-  with open("app/full_format_recipes_wrestrictedreview.json") as f:
-    data = json.loads(f.readlines()[0])
-  for d in data:
-      if "ingredients" in d and "selected_review" in d:
-        ingredients = ";;;".join(d["ingredients"])
-        recipe = db.session.query(Recipe).filter_by(ingredients=ingredients).first()
-        if recipe:
-          recipe.review = d["selected_review"][0]
-          db.session.flush()
-          db.session.commit()
\ No newline at end of file
+def uploadReviews(restart=False):
+  reviews = load_reviews()
+
+  def upload_review(row):
+    if row.content_hash not in reviews:
+      return None
+    return {"review": reviews[row.content_hash]}
+
+  BatchJob("upload_reviews", [Recipe.content_hash], upload_review,
+    criterion=Recipe.content_hash.isnot(None)).run(restart)
+
+
+"""
+Recomputes the allergen bitmask of every recipe. Run after allergy_map changes.
+"""
+def recompute_allergen_masks(batch_size=1000):
+  BatchJob("recompute_allergen_masks", [Recipe.ingredients],
+    lambda row: {"allergen_mask": compute_allergen_mask(row.ingredients)},
+    batch_size=batch_size).run(restart=True)
+  invalidate_corpus_caches()
+
+
+"""
+Sets the content hash of the recipes loaded before recipes.content_hash existed,
+whichever way their lists were joined (" " by populate_db and update_table, ";;;"
+by delimitDatabaseLists), by finding their record in the dataset. Run it before
+delimitDatabaseLists and uploadReviews, which match recipes by hash. A recipe
+not in the dataset is hashed from its ";;;"-split lists. A recipe with the same
+content as one already hashed is a duplicate and keeps a NULL hash.
+"""
+def backfill_content_hashes(restart=False, path="app/full_format_recipes.json"):
+  hash_ids = load_content_hash_ids()
+  dataset_hashes = {}
+  with open(path) as f:
+    for d in iter_json_array(f):
+      if len(d) != 11:
+        continue
+      content_hash = recipe_content_hash(d["title"], d["ingredients"], d["directions"])
+      for sep in (" ", ";;;"):
+        dataset_hashes[stored_recipe_key(d["title"], sep.join(d["ingredients"]),
+          sep.join(d["directions"]))] = content_hash
+
+  def backfill(row):
+    content_hash = dataset_hashes.get(stored_recipe_key(row.title, row.ingredients,
+      row.directions))
+    if content_hash is None:
+      content_hash = recipe_content_hash(row.title,
+        row.ingredients.split(";;;") if row.ingredients else [],
+        row.directions.split(";;;") if row.directions else [])
+    if content_hash in hash_ids:
+      return None
+    hash_ids[content_hash] = row.id
+    return {"content_hash": content_hash}
+
+  BatchJob("backfill_content_hashes", [Recipe.title, Recipe.ingredients, Recipe.directions],
+    backfill, criterion=Recipe.content_hash.is_(None)).run(restart)
+
+
+"""
+Returns a digest of a recipe's title and joined ingredients and directions as
+stored in the recipes table, to find it among the dataset records.
+"""
+def stored_recipe_key(title, ingredients, directions):
+  payload = json.dumps([title, ingredients, directions])
+  return hashlib.sha1(payload.encode("utf-8")).digest()
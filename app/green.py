@@ -0,0 +1,98 @@
+"""
+Cooperative I/O under gevent.
+
+app/__init__.py monkey-patches the standard library, but psycopg2 talks to
+Postgres from C and would still block the whole worker for as long as a query
+runs. patch_psycopg2() installs a wait callback that hands the connection's
+socket to the gevent hub instead, so other greenlets run while a query waits.
+iter_concurrently() runs the independent parts of a request on a bounded,
+process-wide greenlet pool.
+
+A greenlet only gives way when it waits on I/O or calls cooperate(), so its
+timeout cannot cut a CPU-bound stage short: CPU-bound work calls cooperate()
+between stages, where a timeout can take effect.
+"""
+import logging
+import threading
+import gevent
+from gevent.pool import Pool
+from gevent.socket import wait_read, wait_write
+
+logger = logging.getLogger(__name__)
+
+
+"""
+psycopg2 wait callback: polls the connection, yielding to other greenlets
+while its socket is not ready.
+"""
+def gevent_wait_callback(conn, timeout=None):
+  from psycopg2 import extensions, OperationalError
+  while True:
+    state = conn.poll()
+    if state == extensions.POLL_OK:
+      break
+    elif state == extensions.POLL_READ:
+      wait_read(conn.fileno(), timeout=timeout)
+    elif state == extensions.POLL_WRITE:
+      wait_write(conn.fileno(), timeout=timeout)
+    else:
+      raise OperationalError("Bad result from poll: %r" % state)
+
+
+"""
+Makes psycopg2 cooperative with gevent. Returns False if psycopg2 is not
+installed (e.g. on SQLite).
+"""
+def patch_psycopg2():
+  try:
+    from psycopg2 import extensions
+  except ImportError:
+    return False
+  extensions.set_wait_callback(gevent_wait_callback)
+  return True
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+"""
+Returns the process-wide greenlet pool, of the given size on first use. It
+bounds how many concurrent tasks all requests of a worker run at once.
+"""
+def get_pool(size):
+  global _pool
+  if _pool is None:
+    with _pool_lock:
+      if _pool is None:
+        _pool = Pool(size)
+  return _pool
+
+
+"""
+Runs each of calls (a dict of key to function of no arguments) in its own
+greenlet of the process-wide pool, and yields (key, result) for each as soon
+as it finishes, for up to timeout seconds in all.
+
+The calls not done in time are left to finish in the background and their
+results dropped. An exception raised by a call is raised again here.
+"""
+def iter_concurrently(calls, timeout, pool_size):
+  pool = get_pool(pool_size)
+  keys = {}
+  for key, call in calls.items():
+    keys[pool.spawn(call)] = key
+  for greenlet in gevent.iwait(list(keys), timeout=timeout):
+    if not greenlet.successful():
+      raise greenlet.exception
+    yield keys.pop(greenlet), greenlet.value
+  for key in keys.values():
+    logger.warning("%s not done after %ss, returning without it", key, timeout)
+
+
+"""
+Lets the other greenlets of the worker run, and an iter_concurrently timeout
+expire, before going on.
+"""
+def cooperate():
+  gevent.sleep(0)
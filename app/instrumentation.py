@@ -0,0 +1,267 @@
+"""
+Request instrumentation, exported at /metrics in the Prometheus text format.
+
+init_instrumentation(app) times every request and counts, through SQLAlchemy
+cursor events, the SQL statements it runs, their duration and the rows they
+return. span(stage) times a stage of the search (matching, ranking, loading,
+rendering, cache builds) both per request and in a histogram per stage. A
+request is recorded when its response is closed, so streamed pages count in
+full.
+
+Metrics are kept per process; with several gunicorn workers each /metrics
+scrape sees the worker that served it. /metrics is not found unless
+METRICS_ENDPOINT_ENABLED, since anyone can reach it.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from flask import Response, abort, g, has_app_context, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+ROW_BUCKETS = (0, 10, 100, 1000, 10000, 100000, 1000000)
+
+# key of a request's RequestStats in its WSGI environ, which outlives the
+# app context for streamed responses
+STATS_KEY = "app.request_stats"
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value):
+  return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+  pairs = list(zip(names, values)) + list(extra)
+  if not pairs:
+    return ""
+  return "{" + ",".join('{}="{}"'.format(name, _escape(value)) for name, value in pairs) + "}"
+
+
+def _number(value):
+  if value == float("inf"):
+    return "+Inf"
+  return repr(float(value))
+
+
+"""
+A Prometheus histogram with the given label names, one series per label
+values.
+"""
+class Histogram(object):
+  def __init__(self, name, help, label_names=(), buckets=LATENCY_BUCKETS):
+    self.name = name
+    self.help = help
+    self.label_names = tuple(label_names)
+    self.buckets = tuple(buckets) + (float("inf"),)
+    self._series = {}
+    self._lock = threading.Lock()
+
+  def observe(self, value, **labels):
+    key = tuple(labels[name] for name in self.label_names)
+    with self._lock:
+      counts, total = self._series.get(key, ([0] * len(self.buckets), 0.0))
+      for i, bound in enumerate(self.buckets):
+        if value <= bound:
+          counts[i] += 1
+      self._series[key] = (counts, total + value)
+
+  def render(self):
+    lines = ["# HELP {} {}".format(self.name, self.help),
+      "# TYPE {} histogram".format(self.name)]
+    with self._lock:
+      series = sorted(self._series.items())
+    for key, (counts, total) in series:
+      for bound, count in zip(self.buckets, counts):
+        lines.append("{}_bucket{} {}".format(self.name,
+          _labels(self.label_names, key, [("le", _number(bound))]), count))
+      lines.append("{}_sum{} {}".format(self.name, _labels(self.label_names, key), _number(total)))
+      lines.append("{}_count{} {}".format(self.name, _labels(self.label_names, key), counts[-1]))
+    return lines
+
+
+request_seconds = Histogram("http_request_duration_seconds",
+  "Time to serve a request, until its response is closed.",
+  ("endpoint", "method", "status"))
+stage_seconds = Histogram("search_stage_duration_seconds",
+  "Time spent in each stage of a search.", ("stage",))
+sql_statements = Histogram("http_request_sql_statements",
+  "SQL statements run per request.", ("endpoint",), COUNT_BUCKETS)
+sql_seconds = Histogram("http_request_sql_duration_seconds",
+  "Time spent running SQL statements per request.", ("endpoint",))
+sql_rows = Histogram("http_request_sql_rows",
+  "Rows returned by SQL queries per request.", ("endpoint",), ROW_BUCKETS)
+
+HISTOGRAMS = [request_seconds, stage_seconds, sql_statements, sql_seconds, sql_rows]
+
+
+"""
+What one request did: its stage spans, and the number, total duration and
+rows of its SQL statements. Greenlets working for the request share it.
+"""
+class RequestStats(object):
+  def __init__(self):
+    self.started_at = time.time()
+    self.spans = []
+    self.sql_statements = 0
+    self.sql_seconds = 0.0
+    self.rows = 0
+    self._lock = threading.Lock()
+
+  def add_span(self, stage, seconds):
+    with self._lock:
+      self.spans.append((stage, seconds))
+
+  def add_statement(self, seconds, rows):
+    with self._lock:
+      self.sql_statements += 1
+      self.sql_seconds += seconds
+      self.rows += rows
+
+
+"""
+Returns the RequestStats of the current request (or of the request a
+greenlet works for, see bind_request_stats), or None outside of one.
+"""
+def current_request_stats():
+  if has_request_context():
+    return request.environ.get(STATS_KEY)
+  if has_app_context():
+    return g.get("request_stats")
+  return None
+
+
+"""
+Makes the current app context (e.g. that of a greenlet working for a request)
+record into stats.
+"""
+def bind_request_stats(stats):
+  g.request_stats = stats
+
+
+"""
+Times the enclosed block as the given search stage.
+"""
+@contextmanager
+def span(stage):
+  started_at = time.time()
+  try:
+    yield
+  finally:
+    elapsed = time.time() - started_at
+    stage_seconds.observe(elapsed, stage=stage)
+    stats = current_request_stats()
+    if stats is not None:
+      stats.add_span(stage, elapsed)
+
+
+# start times of the statements running on a connection, by cursor, in its
+# info dict
+STARTED_AT_KEY = "query_started_at"
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+  conn.info.setdefault(STARTED_AT_KEY, {})[id(cursor)] = time.time()
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+  started_at = conn.info.get(STARTED_AT_KEY, {}).pop(id(cursor), None)
+  if started_at is None:
+    return
+  elapsed = time.time() - started_at
+  stats = current_request_stats()
+  if stats is None:
+    return
+  rows = 0
+  # drivers report the rows of a SELECT in rowcount, or -1 if they do not know
+  if context is not None and not (context.isinsert or context.isupdate or context.isdelete):
+    rows = max(cursor.rowcount, 0)
+  stats.add_statement(elapsed, rows)
+
+
+def handle_error(exception_context):
+  # after_cursor_execute does not run for a failed statement: drop its start
+  # time, so it is not left behind for a later statement on the connection
+  # (SQLAlchemy 1.3 leaves exception_context.cursor unset; the failed cursor
+  # is the execution context's)
+  conn = exception_context.connection
+  context = exception_context.execution_context
+  if conn is not None and context is not None and context.cursor is not None:
+    conn.info.get(STARTED_AT_KEY, {}).pop(id(context.cursor), None)
+
+
+def start_request():
+  request.environ[STATS_KEY] = RequestStats()
+
+
+def finish_request(response):
+  stats = request.environ.get(STATS_KEY)
+  if stats is None:
+    return response
+  endpoint = request.endpoint or "unknown"
+  method = request.method
+  status = response.status_code
+
+  def record():
+    request_seconds.observe(time.time() - stats.started_at, endpoint=endpoint,
+      method=method, status=status)
+    sql_statements.observe(stats.sql_statements, endpoint=endpoint)
+    sql_seconds.observe(stats.sql_seconds, endpoint=endpoint)
+    sql_rows.observe(stats.rows, endpoint=endpoint)
+
+  response.call_on_close(record)
+  return response
+
+
+"""
+Returns the connection pool metrics of database.pool_stats, in the text
+format.
+"""
+def pool_metric_lines(pools):
+  metrics = (("db_pool_checkouts_total", "counter", "checkouts", "Connections checked out."),
+    ("db_pool_checkout_wait_seconds_total", "counter", "wait_seconds",
+      "Time spent waiting for a connection."),
+    ("db_pool_checkout_wait_max_seconds", "gauge", "max_wait_seconds",
+      "Longest wait for a connection."),
+    ("db_pool_checkout_timeouts_total", "counter", "timeouts",
+      "Checkouts that gave up after the pool timeout."),
+    ("db_pool_checked_out", "gauge", "checked_out", "Connections in use."),
+    ("db_pool_overflow", "gauge", "overflow", "Connections open beyond the pool size."))
+  lines = []
+  for name, kind, key, help in metrics:
+    lines += ["# HELP {} {}".format(name, help), "# TYPE {} {}".format(name, kind)]
+    for pool, stats in sorted(pools.items()):
+      lines.append("{}{} {}".format(name, _labels(("pool",), (pool,)), _number(stats[key])))
+  return lines
+
+
+def render_metrics(pools=None):
+  lines = []
+  for histogram in HISTOGRAMS:
+    lines += histogram.render()
+  if pools:
+    lines += pool_metric_lines(pools)
+  return "\n".join(lines) + "\n"
+
+
+"""
+Times every request of app, counts its SQL statements and serves /metrics.
+"""
+def init_instrumentation(app, db):
+  from app.database import pool_stats
+  if not event.contains(Engine, "before_cursor_execute", before_cursor_execute):
+    event.listen(Engine, "before_cursor_execute", before_cursor_execute)
+    event.listen(Engine, "after_cursor_execute", after_cursor_execute)
+    event.listen(Engine, "handle_error", handle_error)
+  app.before_request(start_request)
+  app.after_request(finish_request)
+
+  def metrics():
+    if not app.config["METRICS_ENDPOINT_ENABLED"]:
+      abort(404)
+    return Response(render_metrics(pool_stats(app, db)), content_type=PROMETHEUS_CONTENT_TYPE)
+
+  app.add_url_rule("/metrics", "metrics", metrics)
@@ -4,4 +4,5 @@ from flask import Blueprint
 irsystem = Blueprint('irsystem', __name__, url_prefix='/',static_folder='static',template_folder='templates')
 
 # Import all controllers
-from .controllers.search_controller import *
\ No newline at end of file
+from .controllers.search_controller import *
+from .controllers.api_controller import *
\ No newline at end of file
@@ -0,0 +1,142 @@
+from . import *
+from flask import current_app
+from app.database import pool_stats
+from app.irsystem.models.helpers import http_compact_json, http_compact_resource
+from app.irsystem.controllers.search_controller import parse_search_args, \
+    search_params_of, get_ranked_ids, ranked_count, score_recipe_ids, \
+    load_ranked_recipes, slice_of, is_limit, RESULTS_PER_PAGE
+from app.irsystem.models import RecipeSchema
+from app.irsystem.models.allergens import allergy_map
+from app.irsystem.models.vector_space import RANKING_MODES
+import base64
+import binascii
+import json
+
+# fields returned for each recipe unless the request selects others
+API_DEFAULT_FIELDS = ("id", "title", "calories", "fat", "protein", "sodium", "rating")
+
+# most recipes returned per meal by one request
+API_MAX_LIMIT = 50
+
+# keys of the search parameters a cursor carries (see search_params_of)
+CURSOR_PARAMS = {"fav_foods", "omit_foods", "cal_limit", "fat_limit", "sodium_limit",
+    "meal_types", "drink_included", "allergies", "ranking"}
+
+
+def api_fields(fields):
+    """ Returns the recipe fields selected by a comma-separated list, always
+        including the id; unknown fields are ignored.
+    """
+    if not fields:
+        return API_DEFAULT_FIELDS
+    known = RecipeSchema.Meta.fields
+    selected = {field.strip() for field in fields.split(",")} & set(known)
+    return ("id",) + tuple(field for field in known if field in selected and field != "id")
+
+
+def encode_cursor(search_params, offset):
+    """ Returns the opaque cursor of the results of a search from offset on. """
+    payload = json.dumps([search_params, offset], separators=(",", ":"), sort_keys=True)
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor):
+    """ Returns the (search_params, offset) of a cursor made by encode_cursor.
+
+        Raises ValueError if the cursor is malformed.
+    """
+    try:
+        search_params, offset = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except (binascii.Error, UnicodeError, TypeError, ValueError):
+        raise ValueError("Invalid cursor")
+    if not isinstance(offset, int) or isinstance(offset, bool) or offset < 0 \
+        or not valid_search_params(search_params):
+        raise ValueError("Invalid cursor")
+    return search_params, offset
+
+
+def valid_search_params(search_params):
+    """ Returns whether search_params (decoded from a cursor, so sent by the
+        client) could have been made by search_params_of.
+    """
+    if not isinstance(search_params, dict) or set(search_params) != CURSOR_PARAMS:
+        return False
+    meal_types = search_params["meal_types"]
+    allergies = search_params["allergies"]
+    return (isinstance(search_params["fav_foods"], str)
+        and isinstance(search_params["omit_foods"], str)
+        and all(is_limit(search_params[limit])
+            for limit in ("cal_limit", "fat_limit", "sodium_limit"))
+        and isinstance(meal_types, list) and len(meal_types) > 0
+        and len(set(meal_types)) == len(meal_types)
+        and all(m_type in ("breakfast", "lunch", "dinner") for m_type in meal_types)
+        and isinstance(search_params["drink_included"], bool)
+        and isinstance(allergies, list)
+        and all(isinstance(a, str) and a in allergy_map for a in allergies)
+        and (search_params["ranking"] == "boolean" or search_params["ranking"] in RANKING_MODES))
+
+
+def api_error(message, status=400):
+    return http_compact_json({ "data": { "errors": [message] }}, False), status
+
+
+@irsystem.route('/api/search', methods=['GET'])
+def api_search():
+    """ Runs the search of search() (same parameters) and returns the results
+        as compact JSON: for each meal, the recipes with their selected
+        fields and ranking score, and a cursor for the next page.
+
+        Params (besides those of search()): {fields: comma-separated recipe
+                 fields (default: API_DEFAULT_FIELDS)
+                 limit: recipes per meal (default: RESULTS_PER_PAGE, at most
+                 API_MAX_LIMIT)
+                 cursor: next_cursor of a previous response; replaces the
+                 search parameters and page
+                }
+    """
+    limit = request.args.get('limit')
+    if limit is not None and limit.isnumeric() and int(limit) > 0:
+        limit = min(int(limit), API_MAX_LIMIT)
+    else:
+        limit = RESULTS_PER_PAGE
+    fields = api_fields(request.args.get('fields'))
+
+    cursor = request.args.get('cursor')
+    if cursor:
+        try:
+            search_params, offset = decode_cursor(cursor)
+        except ValueError as e:
+            return api_error(str(e))
+    else:
+        inputs = parse_search_args(request.args)
+        search_params = search_params_of(inputs)
+        offset = (inputs["page"] - 1) * limit
+        if search_params is None:
+            return api_error("No search parameters given")
+
+    # later cursors hit the cached ranked ids instead of ranking again
+    ranked_ids = get_ranked_ids(search_params, ranked_count(offset, limit))
+    page_ids = slice_of(ranked_ids, offset, limit)
+    meal_data = load_ranked_recipes(page_ids, fields)
+    for m_type, recipes in meal_data.items():
+        if recipes:
+            scores = score_recipe_ids([r["id"] for r in recipes], search_params)
+            for r, score in zip(recipes, scores):
+                r["score"] = score
+
+    next_offset = offset + limit
+    has_more = any(ids is not None and len(ids) > next_offset for ids in ranked_ids.values())
+    return http_compact_resource({ "meals": meal_data,
+        "next_cursor": encode_cursor(search_params, next_offset) if has_more else None },
+        "results")
+
+
+@irsystem.route('/api/db-pool', methods=['GET'])
+def api_db_pool():
+    """ Returns the checkout waits and usage of each connection pool of this
+        worker (see database.pool_stats). Not found unless
+        DB_POOL_ENDPOINT_ENABLED, as it exposes the database setup.
+    """
+    if not current_app.config["DB_POOL_ENDPOINT_ENABLED"]:
+        abort(404)
+    return http_compact_resource(pool_stats(current_app._get_current_object(), db), "pools")
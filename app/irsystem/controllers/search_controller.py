@@ -1,171 +1,95 @@
 from . import *
 from app.irsystem.models.helpers import *
-from app.irsystem.models.helpers import NumpyEncoder as NumpyEncoder
-from flask import request, jsonify
-from sqlalchemy import and_, or_, func
-from itertools import combinations
-import re
+from flask import request, current_app, Response, stream_with_context, url_for
 import math
 import html
-from collections import Counter
-from app import db
-from app.irsystem.models import Recipe, RecipeSchema
+from functools import partial
+import heapq
+from app.database import read_query
+from app.green import cooperate, iter_concurrently
+from app.instrumentation import span, current_request_stats, bind_request_stats
+from app.irsystem.models import Recipe, RecipeSchema, RECIPE_VIEWS, view_schema, \
+    load_view
+from app.irsystem.models.corpus_index import get_corpus_index
+from app.irsystem.models.allergens import allergy_map, allergens_mask
+from app.irsystem.models.nutrition_store import get_nutrition_store, clean_rating
+from app.irsystem.models.search_planner import SearchPlan
+from app.irsystem.models.search_backend import FULL_TEXT_FIELDS, get_search_backend
+from app.irsystem.models.corpus_stats import get_corpus_stats, check_corpus_version
+from app.irsystem.models.result_cache import get_search_cache
+from app.irsystem.models.vector_space import RANKING_MODES, get_vector_space_model
+from app.irsystem.models.postings import as_postings, intersect_all, union_all, \
+    difference, EMPTY
 
 recipe_schema = RecipeSchema(many=True)
 
-# defining allergy to associated foods mapping
-allergy_map = {
-    "Dairy": ["brie", "Brie", "butter", "Butter", "cheddar", "Cheddar", "cheese", 
-        "Cheese", "cream", "Cream", "custard", "Custard", "feta", "Feta", "milk", 
-        "Milk", "mozzarella", "Mozzarella", "parmesan", "Parmesan", "Parmigiano", 
-        "parmigiano", "provolone", "Provolone", "ricotta", "Ricotta", "whey", 
-        "yogurt", "Yogurt"],
-    "Egg": ["egg", "Egg"],
-    "Fish": ["albacore", "anchov", "Anchov", "carp", "Carp", 
-        "cod", "Cod", "fish", "Fish", "herring", "mackerel", 
-        "pollock", "salmon", "Salmon", "sardine", "tilapia", 
-        "salmon", "Salmon", "trout", "tuna", "Tuna", "yellowfin", "yellowtail"],
-    "Peanut": ["peanut", "Peanut"],
-    "Shellfish": ["clam", "Clam", "crab", "Crab", "crawfish", "Crawfish", 
-        "crayfish", "lobster", "mussel",  "oyster", "Oyster", "prawn", "scallop", "shrimp", 
-        "Shrimp", "squid"],
-    "Soybean": ["soy", "Soy", "soybean", "Soybean", "soy bean"],
-    "Tree Nut": ["almond", "Almond", "cashew", "Cashew", "chestnut", 
-        "Chestnut", "hazelnut", "Hazelnut", "hickory", "macadamia", "pecan", 
-        "Pecan", "pine", "Pine", "pistachio", "Pistachio", "walnut", "Walnut"],
-    "Wheat": ["wheat", "Wheat"]
-}
-
-
-def tokenize(text):
-    """Returns a list of words that make up the text.
-        
-    We lowercase everything.
-    Regex is used to satisfy this function
-        
-    Params: {text: String}
-    Returns: List
-    """
-    return re.findall('[a-z]+',text.lower())
-
-
-def build_inverted_index(rcps,field):
-    """ Builds an inverted index from the recipe field.
-    Field can be "title", "desc", "categories", "ingredients", or
-    "directions", "meal_type".
-    Arguments
-    =========
-    rcps: list of dicts.
-    field: a key in the dicts.
-    Returns
-    =======
-    inverted_index: dict
-        For each term, the index contains 
-        a sorted list of tuples (doc_id, count_of_term_in_doc)
-        such that tuples with smaller doc_ids appear first:
-        inverted_index[term] = [(d1, tf1), (d2, tf2), ...]
-    """
-    bofw = set()
-    # handling set case of meal_type
-    if field == "meal_type":
-        bofw = {"breakfast", "lunch", "dinner"}
-    else:
-        for rec in rcps:
-            if rec:
-                if rec[field] is not None:
-                    words = tokenize(rec[field])
-                    for w in words:
-                        bofw.add(w)
-    
-    # initialize inverted index
-    inverted_index = dict.fromkeys(bofw,list())
-    for k, _ in inverted_index.items():
-        inverted_index[k] = list()
-
-    # build inverted index
-    for d_id, recipe in enumerate(rcps):
-        if recipe[field] is not None:
-            words = tokenize(recipe[field])
-            for w in set(words):
-                inverted_index[w].append((d_id, words.count(w)))
-    return inverted_index
+# number of recipes shown per meal on a results page
+RESULTS_PER_PAGE = 10
 
 
 def combine_AND_boolean_terms(terms, inverted_index):
     """ Returns the recipe ids that contain 
-        all the words in terms.
+        all the words in terms, as Postings.
     """
     if len(terms) == 0:
-        return []
+        return EMPTY
     term_to_postings = {}
     for term in terms:
         if term in inverted_index:
             term_l = term.lower()
-            term_to_postings[term_l] = [tup[0] for tup in inverted_index[term]]
+            term_to_postings[term_l] = as_postings(inverted_index[term])
     
     if len(term_to_postings) == 0:
-        return []
-    # most efficient run-time, order by number of postings ascending
-    terms_in_order = [k for k in sorted(term_to_postings, key=lambda k: len(term_to_postings[k]), reverse=False)] 
-    postings = term_to_postings[terms_in_order[0]]
-    for i in range(1, len(terms_in_order)):
-        postings = merge_postings_ANDAND(postings,term_to_postings[terms_in_order[i]])
-    return postings
+        return EMPTY
+    # intersect_all orders by number of postings ascending
+    return intersect_all(term_to_postings.values())
 
 
 def combine_NOT_boolean_terms(terms_not,inverted_index):
-    """ Returns the recipe ids that contain any of the words in terms.
+    """ Returns the recipe ids that contain any of the words in terms,
+        as Postings.
     """
     if len(terms_not) == 0:
-        return []
+        return EMPTY
     term_to_postings = {}
     for term in terms_not:
         if term in inverted_index:
             term_l = term.lower()
-            term_to_postings[term_l] = [tup[0] for tup in inverted_index[term]]
+            term_to_postings[term_l] = as_postings(inverted_index[term])
     
     if len(term_to_postings) == 0:
-        return []
-    # most efficient run-time, order by largest document id, ascending
-    terms_in_order = [k for k in sorted(term_to_postings, key=lambda k: max(term_to_postings[k]), reverse=False) ]
-    postings = term_to_postings[terms_in_order[0]]
-    for i in range(1, len(terms_in_order)):
-        postings = merge_postings_OROR(postings,term_to_postings[terms_in_order[i]])
-    return postings
+        return EMPTY
+    # one k-way merge instead of pairwise unions
+    return union_all(term_to_postings.values())
 
 
 def merge_postings_ANDAND(postings1, postings2):
     """ Returns the documents in postings1 and postings2.
     """
-    merged_postings = [p for p in postings1 if p in postings2]
-    return merged_postings
+    return as_postings(postings1) & as_postings(postings2)
 
 
 def merge_postings_OROR(postings1, postings2):
     """ Returns the documents in postings1 or postings2.
     """
-    merged_postings = postings1
-    for p in postings2:
-        if p not in merged_postings:
-            merged_postings.append(p)
-    return sorted(merged_postings)
+    return as_postings(postings1) | as_postings(postings2)
 
 
 def merge_postings_ANDNOT(postings1, postings2):
     """ Returns the documents in postings1 and not in postings2.
         
     """
-    merged_postings = [p for p in postings1 if p not in postings2]
-    return merged_postings
+    return difference(as_postings(postings1), as_postings(postings2))
 
 
-def rank_recipes_boolean(fav_foods,omit_foods,inv_idx,rcps):
+def rank_recipes_boolean(fav_foods,omit_foods,inv_idx,rcps,k=None):
     """ Returns the matching recipes in order of best rating
 
         Params: {fav_foods: List of str
                 omit_foods: List of str
-                inv_idx: List of tuples
-                rcps: List of Dicts
+                inv_idx: Dict of term to Postings or List of tuples
+                rcps: Dict of recipe id to Dict
+                k: int, return only the k best recipes (default: all)
                 }
 
         Returns: recipes: List of Dicts
@@ -173,34 +97,73 @@ def rank_recipes_boolean(fav_foods,omit_foods,inv_idx,rcps):
     rec_ids = merge_postings_ANDNOT(combine_AND_boolean_terms(fav_foods,inv_idx), combine_NOT_boolean_terms(omit_foods,inv_idx))
     if len(rec_ids) == 0:
         return []
-    recipes = [rcps[i] for i in rec_ids]
+    recipes = [rcps[i] for i in rec_ids if i in rcps]
     for r in recipes:
-        if r['rating'] is None or r['rating'] > 5:
-            r['rating'] = 0
-    recipes = sorted(recipes, key=lambda k: k['rating'], reverse=True)
+        r['rating'] = clean_rating(r['rating'])
+    if k is not None:
+        # bounded heap; same order as sorted(...)[:k], ties included
+        return heapq.nlargest(k, recipes, key=lambda r: r['rating'])
+    recipes = sorted(recipes, key=lambda r: r['rating'], reverse=True)
     return recipes
 
 
-def combine_rank_recipes_ORAND(or_results,fav_foods):
-    """ Returns the matching recipes in order of best match
-        Params: {fav_foods: List of str
-                 or_results: List of Dicts
+def score_tokens_ORAND(title_words, ingredient_words, rating, fav_foods):
+    """ Returns the match score of a recipe for the boolean ranking: the
+        clean rating / 10, plus 1/2 per food in the title, 1/4 per food in
+        the ingredients and 1 per food in both.
+
+        Params: {title_words, ingredient_words: sets of str
+                 rating: clean rating (see clean_rating)
+                 fav_foods: List of str
                 }
-        Returns: recipes: List of Dicts
     """
-    ranked_rcps = []
-    
-    for r in or_results:
-        if r['rating'] is None or r['rating'] > 5:
-            r['rating'] = 0
-        r['count_matches_title'] = len([food for food in fav_foods if food in tokenize(r['title']) ] )
-        r['count_matches_ingr'] = len([food for food in fav_foods if food in tokenize(r['ingredients']) ] )
-        r['count_matches_both'] = len([food for food in fav_foods if food in tokenize(r['title']) and food in tokenize(r['ingredients']) ] )
-    
-    ranked_rcps = sorted(or_results, key=lambda k: (k['rating']/10 + 
-        k['count_matches_title']/2 + k['count_matches_ingr']/4 + 
-        k['count_matches_both']), reverse=True)
-    return ranked_rcps
+    count_matches_title = len([food for food in fav_foods if food in title_words])
+    count_matches_ingr = len([food for food in fav_foods if food in ingredient_words])
+    count_matches_both = len([food for food in fav_foods 
+        if food in title_words and food in ingredient_words])
+    return (rating/10 + count_matches_title/2 + count_matches_ingr/4 + 
+        count_matches_both)
+
+
+def rank_recipe_ids_ORAND(recipe_ids, fav_foods, k):
+    """ Returns the ids of the k best matching recipes, best first, scored
+        by score_tokens_ORAND without loading them.
+        Token sets and clean ratings come precomputed from the corpus index
+        and nutrition store, so scoring is only set lookups.
+        Ties keep the input order, as with a stable sort.
+
+        Params: {recipe_ids: Postings or List of int
+                 fav_foods: List of str
+                 k: int
+                }
+        Returns: List of int
+    """
+    corpus_index = get_corpus_index()
+    recipe_ids = as_postings(recipe_ids).tolist()
+    ratings = get_nutrition_store().clean_ratings(recipe_ids).tolist()
+    scored = ((score_tokens_ORAND(corpus_index.tokens("title", recipe_id), 
+        corpus_index.tokens("ingredients", recipe_id), rating, fav_foods), recipe_id)
+        for recipe_id, rating in zip(recipe_ids, ratings))
+    return [recipe_id for _, recipe_id in heapq.nlargest(k, scored, key=lambda t: t[0])]
+
+
+def rank_recipe_ids_vector(recipe_ids, query_words, mode, k):
+    """ Returns the ids of the k best matching recipes, best first, by
+        the vector-space score of the given mode ("cosine" for TF-IDF cosine
+        similarity or "bm25"). Ties go to the smaller id.
+
+        Params: {recipe_ids: Postings or List of int
+                 query_words: List of str
+                 mode: str, one of RANKING_MODES
+                 k: int
+                }
+        Returns: List of int
+    """
+    candidates = as_postings(recipe_ids)
+    if len(candidates) == 0:
+        return []
+    model = get_vector_space_model()
+    return model.top_k(model.scores(mode, query_words), k, candidates)
 
 
 project_name = "Fitness Dream Team"
@@ -213,29 +176,29 @@ def version_1_search(query, output_message, data):
         query_words = [word.strip() for word in query_words]
         if len(query_words) == 1:
             query_words = query_words[0].split(";")
-        recipes = Recipe.query.filter(
-            or_(
-                or_(Recipe.title.like("%{}%".format(word)) for word in query_words),
-                or_(Recipe.description.like("%{}%".format(word)) for word in query_words),
-                or_(Recipe.ingredients.like("%{}%".format(word)) for word in query_words),
-                or_(Recipe.directions.like("%{}%".format(word)) for word in query_words)
-            )
-        ).all()
+        # only recipes with every query word in their ingredients can rank, so
+        # fetch just those instead of scanning every field with LIKE
+        inv_idx_ingredients = get_corpus_index().inverted_index("ingredients")
+        rec_ids = combine_AND_boolean_terms(query_words, inv_idx_ingredients)
+        recipes = []
+        if len(rec_ids) > 0:
+            recipes = read_query(Recipe).options(load_view(RECIPE_VIEWS["summary"]))\
+                .filter(Recipe.id.in_(rec_ids.tolist())).all()
         if not recipes:
             output_message = "No Results Found :("
             data = []
         else:
-            recipes_out = recipe_schema.dump(recipes)
-            inv_idx_ingredients = build_inverted_index(recipes_out, "ingredients")
+            recipes_out = {r["id"]: r for r in view_schema(RECIPE_VIEWS["summary"]).dump(recipes)}
 
             # hardcoding []; will replace after input for "foods to omit" is added
-            ranked_results = rank_recipes_boolean(query_words, [], inv_idx_ingredients, recipes_out)
+            ranked_results = rank_recipes_boolean(query_words, [], inv_idx_ingredients, recipes_out,
+                k=RESULTS_PER_PAGE)
             if len(ranked_results) == 0:
                 output_message = "No Results Found :(("
                 data = []
             else:
                 output_message = "Your search: " + query
-                data = ranked_results[:10]
+                data = ranked_results[:RESULTS_PER_PAGE]
     return output_message, data
 
 
@@ -258,18 +221,21 @@ def version_2_search_helper(query_words, omit_words, recipes):
         """
     else:
         # boolean search
-        recipes_out = recipe_schema.dump(recipes)
-        inv_idx_ingredients = build_inverted_index(recipes_out, "ingredients")
-        inv_idx_title = build_inverted_index(recipes_out, "title")
-        ranked_results = rank_recipes_boolean(query_words, omit_words, inv_idx_ingredients, recipes_out)
+        recipes_out = {r["id"]: r for r in view_schema(RECIPE_VIEWS["summary"]).dump(recipes)}
+        corpus_index = get_corpus_index()
+        inv_idx_ingredients = corpus_index.inverted_index("ingredients")
+        inv_idx_title = corpus_index.inverted_index("title")
+        ranked_results = rank_recipes_boolean(query_words, omit_words, inv_idx_ingredients, recipes_out,
+            k=RESULTS_PER_PAGE)
         if len(ranked_results) == 0:
-            ranked_results = rank_recipes_boolean(query_words, omit_words, inv_idx_title, recipes_out)
+            ranked_results = rank_recipes_boolean(query_words, omit_words, inv_idx_title, recipes_out,
+                k=RESULTS_PER_PAGE)
             if len(ranked_results) == 0:
                 all_data = []
             else:
-                all_data = ranked_results[:10]
+                all_data = ranked_results
         else:
-            all_data = ranked_results[:10]
+            all_data = ranked_results
     return all_data
 
 
@@ -281,8 +247,8 @@ def version_2_search(fav_foods, omit_foods, breakfast_selected, lunch_selected,
     lunch_data = None
     dinner_data = None
     cal_limit = request.args.get('cal-limit')
-    if not cal_limit:
-        cal_limit = db.session.query(func.max(Recipe.calories)).one()
+    if not is_limit(cal_limit):
+        cal_limit = get_corpus_stats().max_calories
 
     if fav_foods:
         output_message = "Your search: " + fav_foods
@@ -300,6 +266,14 @@ def version_2_search(fav_foods, omit_foods, breakfast_selected, lunch_selected,
         if len(omit_words) == 1:
             omit_words = omit_words[0].split(";") # accounting for semicolon-separated queries
 
+        # recipes with any of the query words in any of their text fields
+        backend = get_search_backend(current_app.config)
+        matching_ids = union_all([backend.match_any(field_name, query_words)
+            for field_name in FULL_TEXT_FIELDS]).tolist()
+        # the results show only the summary fields
+        matching = read_query(Recipe).options(load_view(RECIPE_VIEWS["summary"]))\
+            .filter(Recipe.id.in_(matching_ids))
+
         if breakfast_selected is None and lunch_selected is None and dinner_selected is None:
             breakfast_selected = "on"
             lunch_selected = "on"
@@ -307,71 +281,23 @@ def version_2_search(fav_foods, omit_foods, breakfast_selected, lunch_selected,
         if breakfast_selected:
             breakfast_recipes = None # placeholder initialization
             if drink_included:
-                breakfast_recipes = Recipe.query.filter(
-                    or_(
-                        or_(Recipe.title.like("%{}%".format(word)) for word in query_words),
-                        or_(Recipe.description.like("%{}%".format(word)) for word in query_words),
-                        or_(Recipe.ingredients.like("%{}%".format(word)) for word in query_words),
-                        or_(Recipe.directions.like("%{}%".format(word)) for word in query_words),
-                        or_(Recipe.categories.like("%{}%".format(word)) for word in query_words),
-                    )
-                ).filter_by(calories<cal_limit).filter_by(meal_type="breakfast").all()
+                breakfast_recipes = matching.filter(Recipe.calories < cal_limit).filter_by(meal_type="breakfast").all()
             else:
-                breakfast_recipes = Recipe.query.filter(
-                    or_(
-                        or_(Recipe.title.like("%{}%".format(word)) for word in query_words),
-                        or_(Recipe.description.like("%{}%".format(word)) for word in query_words),
-                        or_(Recipe.ingredients.like("%{}%".format(word)) for word in query_words),
-                        or_(Recipe.directions.like("%{}%".format(word)) for word in query_words),
-                        or_(Recipe.categories.like("%{}%".format(word)) for word in query_words),
-                    )
-                ).filter(Recipe.calories < cal_limit).filter(~Recipe.categories.like("%Drink%")).filter_by(meal_type="breakfast").all()
+                breakfast_recipes = matching.filter(Recipe.calories < cal_limit).filter(~Recipe.categories.like("%Drink%")).filter_by(meal_type="breakfast").all()
             breakfast_data = version_2_search_helper(query_words, omit_words, breakfast_recipes)
         if lunch_selected:
             lunch_recipes = None # placeholder initialization
             if drink_included:
-                lunch_recipes = Recipe.query.filter(
-                    or_(
-                        or_(Recipe.title.like("%{}%".format(word)) for word in query_words),
-                        or_(Recipe.description.like("%{}%".format(word)) for word in query_words),
-                        or_(Recipe.ingredients.like("%{}%".format(word)) for word in query_words),
-                        or_(Recipe.directions.like("%{}%".format(word)) for word in query_words),
-                        or_(Recipe.categories.like("%{}%".format(word)) for word in query_words),
-                    )
-                ).filter_by(meal_type="lunch").all()
+                lunch_recipes = matching.filter_by(meal_type="lunch").all()
             else:
-                lunch_recipes = Recipe.query.filter(
-                    or_(
-                        or_(Recipe.title.like("%{}%".format(word)) for word in query_words),
-                        or_(Recipe.description.like("%{}%".format(word)) for word in query_words),
-                        or_(Recipe.ingredients.like("%{}%".format(word)) for word in query_words),
-                        or_(Recipe.directions.like("%{}%".format(word)) for word in query_words),
-                        or_(Recipe.categories.like("%{}%".format(word)) for word in query_words),
-                    )
-                ).filter(~Recipe.categories.like("%Drink%")).filter_by(meal_type="lunch").all()
+                lunch_recipes = matching.filter(~Recipe.categories.like("%Drink%")).filter_by(meal_type="lunch").all()
             lunch_data = version_2_search_helper(query_words, omit_words, lunch_recipes)
         if dinner_selected:
             dinner_recipes = None # placeholder initialization
             if drink_included:
-                dinner_recipes = Recipe.query.filter(
-                    or_(
-                        or_(Recipe.title.like("%{}%".format(word)) for word in query_words),
-                        or_(Recipe.description.like("%{}%".format(word)) for word in query_words),
-                        or_(Recipe.ingredients.like("%{}%".format(word)) for word in query_words),
-                        or_(Recipe.directions.like("%{}%".format(word)) for word in query_words),
-                        or_(Recipe.categories.like("%{}%".format(word)) for word in query_words),
-                    )
-                ).filter_by(meal_type="dinner").all()
+                dinner_recipes = matching.filter_by(meal_type="dinner").all()
             else:
-                dinner_recipes = Recipe.query.filter(
-                    or_(
-                        or_(Recipe.title.like("%{}%".format(word)) for word in query_words),
-                        or_(Recipe.description.like("%{}%".format(word)) for word in query_words),
-                        or_(Recipe.ingredients.like("%{}%".format(word)) for word in query_words),
-                        or_(Recipe.directions.like("%{}%".format(word)) for word in query_words),
-                        or_(Recipe.categories.like("%{}%".format(word)) for word in query_words),
-                    )
-                ).filter(~Recipe.categories.like("%Drink%")).filter_by(meal_type="dinner").all()
+                dinner_recipes = matching.filter(~Recipe.categories.like("%Drink%")).filter_by(meal_type="dinner").all()
             dinner_data = version_2_search_helper(query_words, omit_words, dinner_recipes)
         result_success = False
         for data in [breakfast_data, lunch_data, dinner_data]:
@@ -383,101 +309,179 @@ def version_2_search(fav_foods, omit_foods, breakfast_selected, lunch_selected,
     return output_message, breakfast_data, lunch_data, dinner_data
 
 
-def final_search(query_words, omit_words, recipes_by_title, recipes_by_ingredients):
-    all_data = []
-    if not recipes_by_title and not recipes_by_ingredients:
-        all_data = []
-    else:
-        # boolean search
-        recipes_title_out = recipe_schema.dump(recipes_by_title)
-        ranked_results = combine_rank_recipes_ORAND(recipes_title_out, query_words)
-        if len(ranked_results) < 10:
-            recipes_ingredients_out = recipe_schema.dump(recipes_by_ingredients)
-            ranked_ingredient_results = combine_rank_recipes_ORAND(recipes_ingredients_out, query_words)
-            if len(ranked_ingredient_results) == 0:
-                all_data = []
-            else:
-                i = 0
-                while len(ranked_results) < 10 and i < len(ranked_ingredient_results):
-                    ranked_results.append(ranked_ingredient_results[i])
-                    i += 1
-                all_data = ranked_results
-        else:
-            all_data = ranked_results[:10]
-    return all_data
+def final_search(query_words, omit_words, title_stage, ingredient_stage, 
+    k=RESULTS_PER_PAGE):
+    """ Returns the ids of the k best recipes, best first: the ranked title
+        matches, topped up with the ranked ingredient matches. Only ids and
+        scores are handled here; load_ranked_recipes loads the winners.
 
+        Each stage is a function of no arguments returning its candidate ids
+        (Postings). The ingredient stage only runs when the title matches
+        cannot fill the k places, and leaves out the ids already ranked.
+    """
+    # boolean search
+    ranked_ids = rank_recipe_ids_ORAND(title_stage(), query_words, k)
+    if len(ranked_ids) < k:
+        # ranking is CPU-bound: give the other meals and the timeout a turn
+        cooperate()
+        ingredient_ids = difference(ingredient_stage(), as_postings(ranked_ids))
+        ranked_ids += rank_recipe_ids_ORAND(ingredient_ids, query_words, 
+            k - len(ranked_ids))
+    return ranked_ids
+
+
+def load_ranked_recipes(ranked_ids, fields=RECIPE_VIEWS["card"]):
+    """ Returns the recipes of each meal as dicts, in ranked order. Only
+        these recipes are fetched, with one query loading just the given
+        fields, and serialized.
+
+        Params: {ranked_ids: Dict of meal type to List of recipe ids or None
+                 fields: tuple of RecipeSchema fields (see RECIPE_VIEWS)
+                }
+        Returns: Dict of meal type to List of Dicts or None
+    """
+    all_ids = list({i for ids in ranked_ids.values() if ids for i in ids})
+    recipes = []
+    with span("load"):
+        if len(all_ids) > 0:
+            recipes = read_query(Recipe).options(load_view(fields))\
+                .filter(Recipe.id.in_(all_ids)).all()
+    with span("serialize"):
+        recipes_by_id = {r["id"]: r for r in view_schema(fields).dump(recipes)}
+        for r in recipes_by_id.values():
+            if 'rating' in r:
+                r['rating'] = clean_rating(r['rating'])
+    return {m_type: None if ids is None else
+        [recipes_by_id[i] for i in ids if i in recipes_by_id]
+        for m_type, ids in ranked_ids.items()}
+
+
+def slice_of(ranked_ids, start, count):
+    """ Returns the count ids of each meal from position start on. """
+    return {m_type: None if ids is None else ids[start:start + count]
+        for m_type, ids in ranked_ids.items()}
+
+
+def page_of(ranked_ids, page):
+    """ Returns the ids on the given (1-based) results page of each meal. """
+    return slice_of(ranked_ids, (page - 1) * RESULTS_PER_PAGE, RESULTS_PER_PAGE)
+
+
+def has_next_page(ids, page):
+    """ Returns whether a meal's ranked ids go on past the given page. """
+    return ids is not None and len(ids) > page * RESULTS_PER_PAGE
+
+
+def page_urls(args, page, has_next):
+    """ Returns the URLs of the previous and next results pages (None where
+        there is none), with the same search parameters as args, ranking
+        included.
+    """
+    params = args.to_dict(flat=False)
+    urls = {"previous": None, "next": None}
+    if page > 1:
+        params["page"] = [str(page - 1)]
+        urls["previous"] = url_for("irsystem.search", **params)
+    if has_next:
+        params["page"] = [str(page + 1)]
+        urls["next"] = url_for("irsystem.search", **params)
+    return urls
+
+
+@irsystem.before_app_first_request
+def warm_corpus_index():
+    """ Builds the corpus index, nutrition store and vector-space model once,
+        before the first search is served.
+    """
+    get_corpus_index()
+    get_nutrition_store()
+    get_vector_space_model()
 
-"""
-Returns a list of recipes such that each recipe...
-1) is categorized as the specified meal type, m_type;
-2) contains (in the field specified by field_name) at least one of the words in 
-    query_words_with_caps;
-3) contains (in the field specified by field_name) none of the words in
-    omit_words_with_caps;
-4) has a number of calories less than or equal to cal_limit;
-and 5) is not categorized as "Drink" if drink_included is None
-"""
-def get_recipes_by_OR(m_type, query_words_with_caps, omit_words_with_caps, 
-    cal_limit, fat_limit, sodium_limit, drink_included, allergy_lst, field_name):
-    recipes = None # temporary initialization
-    if field_name == "title":
-        if drink_included:
-            recipes = Recipe.query.filter(
-                        and_(
-                            or_(Recipe.title.like("%{}%".format(word)) for word in query_words_with_caps),
-                            and_(~Recipe.title.like("%{}%".format(word)) for word in omit_words_with_caps),
-                            and_(~Recipe.ingredients.like("%{}%".format(word)) for word in allergy_lst)
-                        )).filter(Recipe.calories <= cal_limit).filter(Recipe.fat <= fat_limit)\
-                            .filter(Recipe.sodium <= sodium_limit).filter_by(meal_type=m_type).all()
-        else:
-            recipes = Recipe.query.filter(
-                        and_(
-                            or_(Recipe.title.like("%{}%".format(word)) for word in query_words_with_caps),
-                            and_(~Recipe.title.like("%{}%".format(word)) for word in omit_words_with_caps),
-                            and_(~Recipe.ingredients.like("%{}%".format(word)) for word in allergy_lst)
-                        )).filter(Recipe.calories <= cal_limit).filter(Recipe.fat <= fat_limit)\
-                            .filter(Recipe.sodium <= sodium_limit).filter(~Recipe.categories.like("%Drink%"))\
-                                .filter_by(meal_type=m_type).all()
-    if field_name == "ingredients":
-        if drink_included:
-            recipes = Recipe.query.filter(
-                        and_(
-                            or_(Recipe.ingredients.like("%{}%".format(word)) for word in query_words_with_caps),
-                            and_(~Recipe.ingredients.like("%{}%".format(word)) for word in omit_words_with_caps),
-                            and_(~Recipe.ingredients.like("%{}%".format(word)) for word in allergy_lst)
-                        )).filter(Recipe.calories <= cal_limit).filter(Recipe.fat <= fat_limit)\
-                            .filter(Recipe.sodium <= sodium_limit).filter_by(meal_type=m_type).all()
-        else:
-            recipes = Recipe.query.filter(
-                        and_(
-                            or_(Recipe.ingredients.like("%{}%".format(word)) for word in query_words_with_caps),
-                            and_(~Recipe.ingredients.like("%{}%".format(word)) for word in omit_words_with_caps),
-                            and_(~Recipe.ingredients.like("%{}%".format(word)) for word in allergy_lst)
-                        )).filter(Recipe.calories <= cal_limit).filter(Recipe.fat <= fat_limit)\
-                            .filter(~Recipe.categories.like("%Drink%"))\
-                                .filter(Recipe.sodium <= sodium_limit).filter_by(meal_type=m_type).all()
-    return recipes
 
+@irsystem.before_request
+def refresh_corpus_caches():
+    """ Drops the corpus caches if another process changed the recipes. """
+    check_corpus_version(current_app.config["CORPUS_CHECK_INTERVAL"])
 
-@irsystem.route('/', methods=['GET'])
-def search():
+
+def split_foods(foods, lowercase=True):
+    """ Splits a comma (or, failing that, semicolon) separated list of foods,
+        lowercased unless lowercase is False.
+
+        Returns: (words_with_caps, words_with_spaces): each food as input,
+                 capitalized and, if it has several words, with each word
+                 capitalized; and every word of the foods, split by space
+    """
+    words_with_caps = []
+    words_with_spaces = []
+    if not foods:
+        return words_with_caps, words_with_spaces
+
+    # basic query splitting
+    words = foods.lower() if lowercase else foods
+    words = words.split(",") # accounting for comma-separated queries
+    words = [word.strip() for word in words]
+    if len(words) == 1:
+        words = words[0].split(";") # accounting for semicolon-separated queries
+
+    for word in words:
+        multi_word_lst = word.split(" ")
+        multi_word = "" # placeholder initialization
+        for w in multi_word_lst:
+            words_with_spaces.append(w)
+        if len(multi_word_lst) > 1:
+            for w in multi_word_lst:
+                multi_word += w.capitalize() + " "
+        if len(multi_word) > 0:
+            words_with_caps.append(multi_word.strip())
+        words_with_caps.append(word)
+        words_with_caps.append(word.capitalize())
+    return words_with_caps, words_with_spaces
+
+
+def is_limit(value):
+    """ Returns whether value is a nutrition limit as given in a request: a
+        str of a finite, non-negative number.
+    """
+    if not isinstance(value, str):
+        return False
+    try:
+        return 0 <= float(value) < math.inf
+    except ValueError:
+        return False
+
+
+def parse_search_args(args):
+    """ Returns the sanitized inputs of a search request as a dict. Limits
+        that are not given default to the corpus maxima (max_calories,
+        max_fat, max_sodium).
+    """
     # obtaining query inputs
-    query = request.args.get('search') # for version 1 only
-    fav_foods = request.args.get('fav-foods')
-    omit_foods = request.args.get('res-foods')
-    cal_limit = request.args.get('cal-limit')
-    fat_limit = request.args.get('fat-limit')
-    sodium_limit = request.args.get('sodium-limit')
-    version = request.args.get('version')
-    breakfast_selected = request.args.get('breakfast')
-    lunch_selected = request.args.get('lunch')
-    dinner_selected = request.args.get('dinner')
-    drink_included = request.args.get('include-drink')
-    allergies = request.args.getlist('allergies')
+    query = args.get('search') # for version 1 only
+    fav_foods = args.get('fav-foods')
+    omit_foods = args.get('res-foods')
+    cal_limit = args.get('cal-limit')
+    fat_limit = args.get('fat-limit')
+    sodium_limit = args.get('sodium-limit')
+    version = args.get('version')
+    breakfast_selected = args.get('breakfast')
+    lunch_selected = args.get('lunch')
+    dinner_selected = args.get('dinner')
+    drink_included = args.get('include-drink')
+    allergies = args.getlist('allergies')
+    page = args.get('page')
+    ranking = args.get('ranking')
 
     # user input sanitization
     if version is not None and not version.isnumeric():
         version = None
+    if page is not None and page.isnumeric() and int(page) > 0:
+        page = int(page)
+    else:
+        page = 1
+    # boolean ranking unless a vector-space mode is asked for
+    if ranking not in RANKING_MODES:
+        ranking = None
     if fav_foods:
         fav_foods = html.escape(fav_foods.strip())
     if omit_foods:
@@ -490,9 +494,15 @@ def search():
         dinner_selected = html.escape(dinner_selected.strip())
     if drink_included:
         drink_included = html.escape(drink_included.strip())
+    # limits that are not numbers are ignored, like limits not given
+    if not is_limit(cal_limit):
+        cal_limit = None
+    if not is_limit(fat_limit):
+        fat_limit = None
+    if not is_limit(sodium_limit):
+        sodium_limit = None
     
     # handling allergy input
-    allergy_lst = []
     selected_allergies = []
     if len(allergies) > 0:
         for i in range(len(allergies)):
@@ -500,7 +510,6 @@ def search():
             current = html.escape(current)
             if current in allergy_map:
                 selected_allergies.append(current)
-                allergy_lst += allergy_map[current]
     
     # check if user specifies any meal types or not
     no_meal_type_specified = (breakfast_selected is None 
@@ -508,132 +517,255 @@ def search():
 
     # if calorie limit is not provided, the limit is set to maximum number of
     # calories for any recipe in the database, so that all recipes are allowed
-    max_calories = int(db.session.query(func.max(Recipe.calories)).one()[0])
+    corpus_stats = get_corpus_stats()
+    max_calories = int(corpus_stats.max_calories)
     if not cal_limit:
         cal_limit = max_calories
     
-    # if calorie limit is not provided, the limit is set to maximum number of
-    # calories for any recipe in the database, so that all recipes are allowed
-    max_fat = int(db.session.query(func.max(Recipe.fat)).one()[0])
+    # likewise for the fat limit
+    max_fat = int(corpus_stats.max_fat)
     if not fat_limit:
         fat_limit = max_fat
     
-    # if calorie limit is not provided, the limit is set to maximum number of
-    # calories for any recipe in the database, so that all recipes are allowed
-    max_sodium = int(db.session.query(func.max(Recipe.sodium)).one()[0])
+    # likewise for the sodium limit
+    max_sodium = int(corpus_stats.max_sodium)
     if not sodium_limit:
         sodium_limit = max_sodium
 
+    return {"query": query, "version": version, "page": page, "ranking": ranking,
+        "fav_foods": fav_foods, "omit_foods": omit_foods, 
+        "cal_limit": cal_limit, "fat_limit": fat_limit, "sodium_limit": sodium_limit,
+        "max_calories": max_calories, "max_fat": max_fat, "max_sodium": max_sodium,
+        "breakfast_selected": breakfast_selected, "lunch_selected": lunch_selected,
+        "dinner_selected": dinner_selected, "no_meal_type_specified": no_meal_type_specified,
+        "drink_included": drink_included, "selected_allergies": selected_allergies}
+
+
+def search_params_of(inputs):
+    """ Returns the normalized parameters of the search described by inputs
+        (see parse_search_args), which key the result cache, or None if
+        nothing was asked for.
+    """
+    if not (inputs["fav_foods"] or inputs["omit_foods"] 
+        or inputs["cal_limit"] != inputs["max_calories"] 
+        or inputs["fat_limit"] != inputs["max_fat"] 
+        or inputs["sodium_limit"] != inputs["max_sodium"] 
+        or not inputs["no_meal_type_specified"] 
+        or inputs["drink_included"] or len(inputs["selected_allergies"]) > 0):
+        return None
+    meal_types = [m_type for m_type in ("breakfast", "lunch", "dinner") 
+        if inputs["no_meal_type_specified"] or inputs[m_type + "_selected"]]
+    return {"fav_foods": inputs["fav_foods"] or "", "omit_foods": inputs["omit_foods"] or "",
+        "cal_limit": str(inputs["cal_limit"]), "fat_limit": str(inputs["fat_limit"]),
+        "sodium_limit": str(inputs["sodium_limit"]), "meal_types": meal_types,
+        "drink_included": bool(inputs["drink_included"]),
+        "allergies": sorted(inputs["selected_allergies"]),
+        "ranking": inputs["ranking"] or "boolean"}
+
+
+def meal_rankers(search_params, max_results):
+    """ Returns, for each meal of a search (see search_params_of), the
+        function of no arguments ranking its recipes: it returns a List of up
+        to max_results recipe ids, best first. Ranking needs only ids, so no
+        recipe rows are fetched. A database search backend returns at most
+        SEARCH_CANDIDATES_PER_RESULT candidates per result asked for.
+    """
+    query_words_with_caps, query_words_with_spaces = split_foods(search_params["fav_foods"])
+    # foods to omit have always been matched as typed
+    omit_words_with_caps, omit_words_with_spaces = split_foods(search_params["omit_foods"],
+        lowercase=False)
+    ranking = search_params["ranking"] if search_params["ranking"] in RANKING_MODES else None
+    app = current_app._get_current_object()
+    request_stats = current_request_stats()
+
+    # term matching is shared by the meals, so it is planned once
+    plan = SearchPlan(search_params["meal_types"], query_words_with_caps, 
+        omit_words_with_caps, search_params["cal_limit"], search_params["fat_limit"], 
+        search_params["sodium_limit"], search_params["drink_included"], 
+        allergens_mask(search_params["allergies"]), 
+        backend=get_search_backend(app.config), 
+        limit=max_results * app.config["SEARCH_CANDIDATES_PER_RESULT"])
+
+    def rank_meal(m_type):
+        # each greenlet gets its own app context, hence its own DB session
+        with app.app_context(), span("rank"):
+            bind_request_stats(request_stats)
+            if ranking:
+                candidate_ids = plan.candidate_ids(m_type, "title") \
+                    | plan.candidate_ids(m_type, "ingredients")
+                cooperate()
+                return rank_recipe_ids_vector(candidate_ids, query_words_with_spaces, 
+                    ranking, max_results)
+            return final_search(query_words_with_spaces, omit_words_with_spaces, 
+                partial(plan.candidate_ids, m_type, "title"), 
+                partial(plan.candidate_ids, m_type, "ingredients"), k=max_results)
+
+    return {m_type: partial(rank_meal, m_type) for m_type in search_params["meal_types"]}
+
+
+def ranked_count(start, count):
+    """ Returns how many ids of each meal to rank to serve count results
+        from position start on and tell whether more follow, at most
+        SEARCH_MAX_RESULTS.
+    """
+    return min(start + count + 1, current_app.config["SEARCH_MAX_RESULTS"])
+
+
+def iter_ranked_ids(search_params, max_results):
+    """ Yields (meal type, ranked ids) for each meal of a search, as soon as
+        it is ranked: up to max_results ids, best first (see ranked_count).
+        The meals are ranked concurrently, and a meal not done within
+        SEARCH_TIMEOUT seconds is left out. The ids are cached, so a later
+        page needing no more of them is served from the result cache without
+        ranking again; results missing a meal are not cached.
+    """
+    config = current_app.config
+    search_cache = get_search_cache(config)
+    cached = search_cache.get(search_params)
+    if cached is not None and cached["max_results"] >= max_results:
+        for m_type in search_params["meal_types"]:
+            yield m_type, cached["ids"][m_type]
+        return
+
+    ranked_ids = {"breakfast": None, "lunch": None, "dinner": None}
+    for m_type, ids in iter_concurrently(meal_rankers(search_params, max_results), 
+        timeout=config["SEARCH_TIMEOUT"], pool_size=config["SEARCH_POOL_SIZE"]):
+        ranked_ids[m_type] = ids
+        yield m_type, ids
+    if all(ranked_ids[m_type] is not None for m_type in search_params["meal_types"]):
+        search_cache.set(search_params, {"max_results": max_results, "ids": ranked_ids})
+
+
+def get_ranked_ids(search_params, max_results):
+    """ Returns the ranked ids of each meal of a search (see iter_ranked_ids),
+        as a Dict of meal type to List of ids or None (for meals not searched
+        or left out).
+    """
+    ranked_ids = {"breakfast": None, "lunch": None, "dinner": None}
+    ranked_ids.update(iter_ranked_ids(search_params, max_results))
+    return ranked_ids
+
+
+_recipe_partial = None
+
+
+def get_recipe_partial():
+    """ Returns the macros of _recipe.html, compiled once per process and
+        passed to the result templates, which render them for every recipe.
+    """
+    global _recipe_partial
+    if _recipe_partial is None or current_app.templates_auto_reload:
+        _recipe_partial = current_app.jinja_env.get_template("_recipe.html").module
+    return _recipe_partial
+
+
+def stream_search(search_params, page, template_inputs):
+    """ Returns the streamed results page of a search: the form is sent at
+        once, then the results of each meal as soon as they are ranked and
+        loaded.
+    """
+    search_state = {"found": False, "pages": None}
+    args = request.args.copy()
+
+    def sections():
+        has_next = False
+        for m_type, ids in iter_ranked_ids(search_params, 
+            ranked_count((page - 1) * RESULTS_PER_PAGE, RESULTS_PER_PAGE)):
+            has_next = has_next or has_next_page(ids, page)
+            meal_data = load_ranked_recipes(page_of({m_type: ids}, page))[m_type]
+            if meal_data:
+                search_state["found"] = True
+                yield m_type, meal_data
+        search_state["pages"] = page_urls(args, page, has_next)
+
+    context = {"output_message": "Query successful", "inputs": template_inputs, 
+        "sections": sections(), "search_state": search_state, 
+        "rank_offset": (page - 1) * RESULTS_PER_PAGE, "recipe": get_recipe_partial()}
+    current_app.update_template_context(context)
+    template = current_app.jinja_env.get_template("search_stream.html")
+    return Response(stream_with_context(template.generate(context)))
+
+
+def score_recipe_ids(recipe_ids, search_params):
+    """ Returns the ranking score of each of recipe_ids for a search, as a
+        list aligned with them.
+    """
+    _, query_words_with_spaces = split_foods(search_params["fav_foods"])
+    if search_params["ranking"] in RANKING_MODES:
+        return get_vector_space_model().score_ids(search_params["ranking"], 
+            query_words_with_spaces, recipe_ids)
+    corpus_index = get_corpus_index()
+    ratings = get_nutrition_store().clean_ratings(recipe_ids).tolist()
+    return [score_tokens_ORAND(corpus_index.tokens("title", recipe_id), 
+        corpus_index.tokens("ingredients", recipe_id), rating, query_words_with_spaces)
+        for recipe_id, rating in zip(recipe_ids, ratings)]
+
+
+def search_template_inputs(inputs):
+    """ Returns the inputs search.html fills the form in with: limits at the
+        corpus maxima and unselected meals are left blank.
+    """
+    form = {"fav_foods": inputs["fav_foods"], "omit_foods": inputs["omit_foods"], 
+        "breakfast_selected": inputs["breakfast_selected"], 
+        "lunch_selected": inputs["lunch_selected"], 
+        "dinner_selected": inputs["dinner_selected"], 
+        "drink_included": inputs["drink_included"], 
+        "cal_limit": inputs["cal_limit"], "fat_limit": inputs["fat_limit"], 
+        "sodium_limit": inputs["sodium_limit"], 
+        "allergies": inputs["selected_allergies"], "ranking": inputs["ranking"]}
+    if inputs["cal_limit"] == inputs["max_calories"]:
+        form["cal_limit"] = ""
+    if inputs["fat_limit"] == inputs["max_fat"]:
+        form["fat_limit"] = ""
+    if inputs["sodium_limit"] == inputs["max_sodium"]:
+        form["sodium_limit"] = ""
+    if inputs["no_meal_type_specified"]:
+        form["breakfast_selected"] = ""
+        form["lunch_selected"] = ""
+        form["dinner_selected"] = ""
+    return form
+
+
+@irsystem.route('/', methods=['GET'])
+def search():
+    with span("parse"):
+        inputs = parse_search_args(request.args)
+    version = inputs["version"]
+
     # default initialization of output
     output_message = ''
     breakfast_data = None
     lunch_data = None
     dinner_data = None
+    pages = None
 
     # rendering template for Prototype 1
     if version is not None and int(version) == 1:
-        output_message, data = version_1_search(query, output_message, [])
+        output_message, data = version_1_search(inputs["query"], output_message, [])
         return render_template('search-v1.html', name=project_name, netid=net_ids, output_message=output_message, data=data)
     elif version is not None and int(version) == 2:
         output_message, breakfast_data, lunch_data, dinner_data = version_2_search(
-            fav_foods, omit_foods, breakfast_selected, lunch_selected, dinner_selected, 
-            drink_included)
+            inputs["fav_foods"], inputs["omit_foods"], inputs["breakfast_selected"], 
+            inputs["lunch_selected"], inputs["dinner_selected"], inputs["drink_included"])
         return render_template('search-v2.html', name=project_name, 
             netid=net_ids, output_message=output_message, breakfast_data=breakfast_data, 
             lunch_data=lunch_data, dinner_data=dinner_data)
     else:
-        if fav_foods or omit_foods or cal_limit != max_calories or fat_limit != max_fat \
-            or sodium_limit != max_sodium or not no_meal_type_specified \
-                or drink_included or len(selected_allergies) > 0:
-
-            # initializations
+        search_params = search_params_of(inputs)
+        template_inputs = search_template_inputs(inputs)
+        if search_params is not None and current_app.config["SEARCH_STREAMING"]:
+            return stream_search(search_params, inputs["page"], template_inputs)
+        if search_params is not None:
             output_message = "Query successful"
-
-            # list of query/omit words, both in original form (as input by user) and capitalized
-            query_words_with_caps = []
-            omit_words_with_caps = []
-
-            # list of query/omit words, with multi-word inputs split by space
-            query_words_with_spaces = []
-            omit_words_with_spaces = []
-
-            if fav_foods:
-                # basic query splitting
-                fav_words = fav_foods.lower()
-                query_words = fav_words.split(",") # accounting for comma-separated queries
-                query_words = [word.strip() for word in query_words]
-                if len(query_words) == 1:
-                    query_words = query_words[0].split(";") # accounting for semicolon-separated queries
-                
-                for word in query_words:
-                    multi_word_lst = word.split(" ")
-                    multi_word = "" # placeholder initialization
-                    for w in multi_word_lst:
-                        query_words_with_spaces.append(w)
-                    if len(multi_word_lst) > 1:
-                        for w in multi_word_lst:
-                            multi_word += w.capitalize() + " "
-                    if len(multi_word) > 0:
-                        query_words_with_caps.append(multi_word.strip())
-                    query_words_with_caps.append(word)
-                    query_words_with_caps.append(word.capitalize())
-            
-            if omit_foods:
-                # basic query splitting
-                omit_words = omit_foods.lower()
-                omit_words = omit_foods.split(",") # accounting for comma-separated queries
-                omit_words = [word.strip() for word in omit_words]
-                if len(omit_words) == 1:
-                    omit_words = omit_words[0].split(";") # accounting for semicolon-separated queries
-
-                for word in omit_words:
-                    multi_word_lst = word.split(" ")
-                    multi_word = "" # placeholder initialization
-                    for w in multi_word_lst:
-                        omit_words_with_spaces.append(w)
-                    if len(multi_word_lst) > 1:
-                        for w in multi_word_lst:
-                            multi_word += w.capitalize() + " "
-                    if len(multi_word) > 0:
-                        omit_words_with_caps.append(multi_word.strip())
-                    omit_words_with_caps.append(word)
-                    omit_words_with_caps.append(word.capitalize())
-
-            if no_meal_type_specified:
-                breakfast_selected = "on"
-                lunch_selected = "on"
-                dinner_selected = "on"
-
-            if breakfast_selected:
-                breakfast_recipes_by_title = get_recipes_by_OR("breakfast",
-                    query_words_with_caps, omit_words_with_caps, cal_limit, 
-                    fat_limit, sodium_limit, drink_included, allergy_lst, "title")
-                breakfast_recipes_by_ingredients = get_recipes_by_OR("breakfast",
-                    query_words_with_caps, omit_words_with_caps, cal_limit, 
-                    fat_limit, sodium_limit, drink_included, allergy_lst, "ingredients")
-                breakfast_data = final_search(query_words_with_spaces, 
-                    omit_words_with_spaces, breakfast_recipes_by_title, 
-                    breakfast_recipes_by_ingredients)
-            if lunch_selected:
-                lunch_recipes_by_title = get_recipes_by_OR("lunch",
-                    query_words_with_caps, omit_words_with_caps, cal_limit,
-                    fat_limit, sodium_limit, drink_included, allergy_lst, "title")
-                lunch_recipes_by_ingredients = get_recipes_by_OR("lunch",
-                    query_words_with_caps, omit_words_with_caps, cal_limit, 
-                    fat_limit, sodium_limit, drink_included, allergy_lst, "ingredients")
-                lunch_data = final_search(query_words_with_spaces, 
-                    omit_words_with_spaces, lunch_recipes_by_title, 
-                    lunch_recipes_by_ingredients)
-            if dinner_selected:
-                dinner_recipes_by_title = get_recipes_by_OR("dinner",
-                    query_words_with_caps, omit_words_with_caps, cal_limit,
-                    fat_limit, sodium_limit, drink_included, allergy_lst, "title")
-                dinner_recipes_by_ingredients = get_recipes_by_OR("dinner",
-                    query_words_with_caps, omit_words_with_caps, cal_limit, 
-                    fat_limit, sodium_limit, drink_included, allergy_lst, "ingredients")
-                dinner_data = final_search(query_words_with_spaces, 
-                    omit_words_with_spaces, dinner_recipes_by_title, 
-                    dinner_recipes_by_ingredients)
+            # ranked ids are cached per normalized search, across workers
+            ranked_ids = get_ranked_ids(search_params, ranked_count(
+                (inputs["page"] - 1) * RESULTS_PER_PAGE, RESULTS_PER_PAGE))
+            meal_data = load_ranked_recipes(page_of(ranked_ids, inputs["page"]))
+            pages = page_urls(request.args, inputs["page"], 
+                any(has_next_page(ids, inputs["page"]) for ids in ranked_ids.values()))
+            breakfast_data = meal_data["breakfast"]
+            lunch_data = meal_data["lunch"]
+            dinner_data = meal_data["dinner"]
             result_success = False
             for data in [breakfast_data, lunch_data, dinner_data]:
                 if data is not None and len(data) > 0:
@@ -641,21 +773,9 @@ def search():
                     break
             if not result_success:
                 output_message = "No Results Found:("
-        inputs = {"fav_foods": fav_foods, "omit_foods": omit_foods, 
-            "breakfast_selected": breakfast_selected, "lunch_selected": lunch_selected, 
-            "dinner_selected": dinner_selected, "drink_included": drink_included, 
-            "cal_limit": cal_limit, "fat_limit": fat_limit, "sodium_limit": sodium_limit, 
-            "allergies": selected_allergies}
-        if cal_limit == max_calories:
-            inputs["cal_limit"] = ""
-        if fat_limit == max_fat:
-            inputs["fat_limit"] = ""
-        if sodium_limit == max_sodium:
-            inputs["sodium_limit"] = ""
-        if no_meal_type_specified:
-            inputs["breakfast_selected"] = ""
-            inputs["lunch_selected"] = ""
-            inputs["dinner_selected"] = ""
-        return render_template('search.html', output_message=output_message, 
-            breakfast_data=breakfast_data, lunch_data=lunch_data, 
-            dinner_data=dinner_data, inputs=inputs)
+        with span("render"):
+            return render_template('search.html', output_message=output_message, 
+                breakfast_data=breakfast_data, lunch_data=lunch_data, 
+                dinner_data=dinner_data, inputs=template_inputs, pages=pages, 
+                rank_offset=(inputs["page"] - 1) * RESULTS_PER_PAGE, 
+                recipe=get_recipe_partial())
@@ -10,6 +10,8 @@ from sqlalchemy import (
     Float
 )
 from marshmallow import fields, Schema
+from sqlalchemy.orm import load_only
+from functools import lru_cache
 from werkzeug import check_password_hash, generate_password_hash  # Hashing
 import hashlib  # For session_token generation (session-based auth. flow)
 import datetime  # For handling dates
@@ -20,7 +22,8 @@ class Base(db.Model):
     __abstract__ = True
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
-    updated_at = db.Column(db.DateTime, default=db.func.current_timestamp())
+    updated_at = db.Column(db.DateTime, default=db.func.current_timestamp(),
+                           onupdate=db.func.current_timestamp())
 
 
 class Recipe(Base):
@@ -40,6 +43,10 @@ class Recipe(Base):
     sodium = Column(Float)
     categories = Column(String())
     review = Column(String())
+    # bitwise OR of allergens.allergen_bits for the allergens in ingredients
+    allergen_mask = Column(Integer, index=True)
+    # helpers.recipe_content_hash of the title, ingredients and directions
+    content_hash = Column(String(40), index=True, unique=True)
 
 
 class Category(Base):
@@ -54,6 +61,14 @@ class RecipeCategorization(Base):
     category_id = Column(Integer, ForeignKey("categories.id"))
 
 
+class JobProgress(Base):
+    # how far each maintenance job in app/batch_jobs.py has got, so it can resume
+    __tablename__ = "job_progress"
+    name = Column(String(80), unique=True)
+    last_id = Column(Integer)
+    rows_done = Column(Integer)
+
+
 class RecipeSchema(Schema):
     id = fields.Integer(dump_only=True)
 
@@ -74,4 +89,30 @@ class RecipeSchema(Schema):
             "sodium",
             "categories",
             "review"
-        )
\ No newline at end of file
+        )
+
+
+# the fields each view of a recipe needs, so that queries load only those
+# columns (see load_view) and schemas dump only those fields (see view_schema)
+RECIPE_VIEWS = {
+    # a result of search-v1.html and search-v2.html
+    "summary": ("id", "title", "description", "fat", "calories", "protein",
+        "rating", "sodium"),
+    # a result card of search.html
+    "card": ("id", "title", "description", "directions", "ingredients", "fat",
+        "calories", "protein", "rating", "sodium", "review"),
+    "full": RecipeSchema.Meta.fields,
+}
+
+
+@lru_cache(maxsize=32)
+def view_schema(fields):
+    """Returns a RecipeSchema(many=True) dumping only fields (a tuple of
+    RecipeSchema fields, e.g. a RECIPE_VIEWS entry), cached per tuple."""
+    return RecipeSchema(many=True, only=fields)
+
+
+def load_view(fields):
+    """Returns the query option loading only the given Recipe columns; the
+    others are deferred until accessed."""
+    return load_only(*fields)
@@ -0,0 +1,80 @@
+"""
+Allergen bitmasks. Each recipe stores, in recipes.allergen_mask, one bit per
+allergy in allergy_map whose foods appear in its ingredients, so filtering
+out any set of allergies is a single bitwise predicate.
+"""
+from functools import lru_cache
+from app.irsystem.models.multi_pattern import PatternMatcher
+
+# defining allergy to associated foods mapping
+allergy_map = {
+    "Dairy": ["brie", "Brie", "butter", "Butter", "cheddar", "Cheddar", "cheese",
+        "Cheese", "cream", "Cream", "custard", "Custard", "feta", "Feta", "milk",
+        "Milk", "mozzarella", "Mozzarella", "parmesan", "Parmesan", "Parmigiano",
+        "parmigiano", "provolone", "Provolone", "ricotta", "Ricotta", "whey",
+        "yogurt", "Yogurt"],
+    "Egg": ["egg", "Egg"],
+    "Fish": ["albacore", "anchov", "Anchov", "carp", "Carp",
+        "cod", "Cod", "fish", "Fish", "herring", "mackerel",
+        "pollock", "salmon", "Salmon", "sardine", "tilapia",
+        "salmon", "Salmon", "trout", "tuna", "Tuna", "yellowfin", "yellowtail"],
+    "Peanut": ["peanut", "Peanut"],
+    "Shellfish": ["clam", "Clam", "crab", "Crab", "crawfish", "Crawfish",
+        "crayfish", "lobster", "mussel",  "oyster", "Oyster", "prawn", "scallop", "shrimp",
+        "Shrimp", "squid"],
+    "Soybean": ["soy", "Soy", "soybean", "Soybean", "soy bean"],
+    "Tree Nut": ["almond", "Almond", "cashew", "Cashew", "chestnut",
+        "Chestnut", "hazelnut", "Hazelnut", "hickory", "macadamia", "pecan",
+        "Pecan", "pine", "Pine", "pistachio", "Pistachio", "walnut", "Walnut"],
+    "Wheat": ["wheat", "Wheat"]
+}
+
+# bit assigned to each allergy. Append new allergies at the end, and run
+# `python manage.py recompute_allergen_masks` whenever allergy_map changes.
+allergen_bits = {allergy: 1 << i for i, allergy in enumerate(allergy_map)}
+
+
+@lru_cache(maxsize=64)
+def allergen_matcher(allergies=None):
+    """ Returns a PatternMatcher over the foods of the given allergies (a
+        sorted tuple of names; default: all of allergy_map), cached per set.
+    """
+    if allergies is None:
+        allergies = tuple(allergy_map)
+    return PatternMatcher(food for allergy in allergies for food in allergy_map[allergy])
+
+
+def food_bits():
+    """ Returns the bits of the allergies each food of allergy_map belongs to. """
+    bits = {}
+    for allergy, foods in allergy_map.items():
+        for food in foods:
+            bits[food] = bits.get(food, 0) | allergen_bits[allergy]
+    return bits
+
+
+_food_bits = food_bits()
+
+
+def compute_allergen_mask(ingredients):
+    """ Returns the allergen bitmask for a recipe's ingredients text, or None
+        if the recipe has no ingredients.
+
+        A bit is set when any of the allergy's foods occurs in the text,
+        matching the (case-sensitive) ingredients LIKE '%food%' filter it
+        replaces. The text is scanned once for all foods.
+    """
+    if ingredients is None:
+        return None
+    mask = 0
+    for food in allergen_matcher().findall(ingredients):
+        mask |= _food_bits[food]
+    return mask
+
+
+def allergens_mask(allergies):
+    """ Returns the bitmask covering the given allergy names. """
+    mask = 0
+    for allergy in allergies:
+        mask |= allergen_bits.get(allergy, 0)
+    return mask
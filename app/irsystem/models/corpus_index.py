@@ -0,0 +1,179 @@
+"""
+Process-wide inverted index over the whole recipes table.
+
+The index is built once per process (see warm_corpus_index in the search
+controller) and answers the term lookups that used to be served by
+LIKE '%word%' scans and by an inverted index built afresh on every request.
+"""
+import threading
+from collections import Counter
+import numpy as np
+from app import db
+from app.irsystem.models import Recipe
+from app.irsystem.models.helpers import tokenize
+from app.irsystem.models.postings import Postings, intersect_all, union_all, EMPTY
+from app.irsystem.models.multi_pattern import PatternMatcher
+from app.instrumentation import span
+
+# recipe fields covered by the corpus index, in the order they are queried
+INDEXED_FIELDS = ("title", "ingredients", "categories", "meal_type")
+
+# fields whose per-recipe token sets are kept for ranking
+TOKEN_SET_FIELDS = ("title", "ingredients")
+
+# maximum number of cached substring expansions per field
+EXPANSION_CACHE_SIZE = 4096
+
+NO_TOKENS = frozenset()
+
+
+class CorpusIndex(object):
+    """Inverted indexes for the title, ingredients, categories and meal_type
+    fields of every recipe, keyed by recipe id.
+
+    For each field, inverted_indexes[field][term] is the Postings of the
+    recipes containing term, and term_counts[field][term] the aligned int32
+    array of how often term occurs in each of them. For the title and
+    ingredients, token_sets[field][recipe_id] is the set of words of the
+    field, so ranking never has to tokenize again.
+    """
+
+    def __init__(self, rows):
+        """ rows: iterable of (id, title, ingredients, categories, meal_type)
+            tuples, ordered by id.
+        """
+        all_ids = []
+        self.texts = {field: {} for field in INDEXED_FIELDS}
+        self.inverted_indexes = {field: {} for field in INDEXED_FIELDS}
+        self.term_counts = {field: {} for field in INDEXED_FIELDS}
+        self.token_sets = {field: {} for field in TOKEN_SET_FIELDS}
+        self._expansions = {field: {} for field in INDEXED_FIELDS}
+        postings_lists = {field: {} for field in INDEXED_FIELDS}
+        for row in rows:
+            recipe_id = row[0]
+            all_ids.append(recipe_id)
+            for field, text in zip(INDEXED_FIELDS, row[1:]):
+                if text is None:
+                    continue
+                text = text.lower()
+                self.texts[field][recipe_id] = text
+                # meal_type is a single label, not free text
+                words = [text] if field == "meal_type" else tokenize(text)
+                field_postings = postings_lists[field]
+                counts = Counter(words)
+                if field in self.token_sets:
+                    self.token_sets[field][recipe_id] = frozenset(counts)
+                for w, count in counts.items():
+                    if w not in field_postings:
+                        field_postings[w] = []
+                    field_postings[w].append((recipe_id, count))
+
+        # rows arrive ordered by id, so every list is already sorted
+        self.all_ids = Postings.from_sorted(all_ids)
+        self._present = {field: Postings.from_sorted(list(self.texts[field]))
+            for field in INDEXED_FIELDS}
+        for field, field_postings in postings_lists.items():
+            for w, tups in field_postings.items():
+                self.inverted_indexes[field][w] = Postings.from_sorted([tup[0] for tup in tups])
+                self.term_counts[field][w] = np.array([tup[1] for tup in tups], dtype=np.int32)
+
+    def inverted_index(self, field):
+        """ Returns the corpus-wide inverted index for field. """
+        return self.inverted_indexes[field]
+
+    def tokens(self, field, recipe_id):
+        """ Returns the set of words in the field of a recipe (empty if the
+            field is NULL or the recipe is unknown).
+        """
+        return self.token_sets[field].get(recipe_id, NO_TOKENS)
+
+    def present(self, field):
+        """ Returns the ids of recipes whose field is not NULL. """
+        return self._present[field]
+
+    def meal_type_ids(self, m_type):
+        """ Returns the ids of recipes categorized as m_type. """
+        return self.inverted_indexes["meal_type"].get(m_type.lower(), EMPTY)
+
+    def lookup(self, field, term):
+        """ Returns the ids of recipes whose field contains term.
+
+        Matches the semantics of Recipe.<field>.like('%term%'), ignoring case:
+        a single alphabetic word matches any indexed word containing it (so
+        "anchov" matches "anchovies"), and anything else (multi-word terms
+        like "soy bean", punctuation) is checked against the field text of
+        the recipes containing all of its words.
+        """
+        term = term.lower()
+        texts = self.texts[field]
+        words = tokenize(term)
+        self._expand(field, words)
+        if not words:
+            candidates = self._present[field]
+        else:
+            candidates = intersect_all([self._ids_containing(field, w) for w in words])
+        if words == [term]:
+            return candidates
+        return Postings.from_sorted([i for i in candidates if term in texts[i]])
+
+    def match_any(self, field, terms):
+        """ Returns the ids of recipes whose field contains any of terms. """
+        terms = set(t.lower() for t in terms)
+        self._expand(field, [w for term in terms for w in tokenize(term)])
+        return union_all([self.lookup(field, term) for term in terms])
+
+    def _expand(self, field, words):
+        """ Caches the expansion of every word not expanded yet, matching all
+            of them against the field vocabulary in a single pass.
+        """
+        expansions = self._expansions[field]
+        missing = set(w for w in words if w not in expansions)
+        if not missing:
+            return
+        if len(expansions) + len(missing) > EXPANSION_CACHE_SIZE:
+            expansions.clear()
+        matcher = PatternMatcher(missing)
+        matches = {word: [] for word in missing}
+        for term, postings in self.inverted_indexes[field].items():
+            for word in matcher.findall(term):
+                matches[word].append(postings)
+        for word, postings_lists in matches.items():
+            expansions[word] = union_all(postings_lists)
+
+    def _ids_containing(self, field, word):
+        """ Returns the ids of recipes with an indexed word containing word,
+            caching the expansion over the field vocabulary.
+        """
+        self._expand(field, [word])
+        return self._expansions[field][word]
+
+
+_corpus_index = None
+_corpus_index_lock = threading.Lock()
+
+
+def load_corpus_index():
+    """ Builds a CorpusIndex from the recipes table. """
+    rows = db.session.query(Recipe.id, Recipe.title, Recipe.ingredients,
+        Recipe.categories, Recipe.meal_type).order_by(Recipe.id).all()
+    return CorpusIndex(rows)
+
+
+def get_corpus_index():
+    """ Returns the process-wide CorpusIndex, building it on first use. """
+    global _corpus_index
+    if _corpus_index is None:
+        with _corpus_index_lock:
+            if _corpus_index is None:
+                with span("build_corpus_index"):
+                    _corpus_index = load_corpus_index()
+    return _corpus_index
+
+
+def invalidate_corpus_index():
+    """ Drops the process-wide CorpusIndex so the next lookup rebuilds it.
+        Called after the recipes table has been changed.
+    """
+    global _corpus_index
+    with _corpus_index_lock:
+        _corpus_index = None
@@ -0,0 +1,116 @@
+"""
+Corpus-wide aggregates (maxima, row counts) used as search defaults, and the
+invalidation of every per-process corpus cache when the recipes change.
+
+The aggregates are derived from the nutrition store, so serving them issues
+no queries. Caches are dropped explicitly by the db_manage2 loaders, and in
+other processes (e.g. the other gunicorn workers) by check_corpus_version,
+which compares the recipe count and latest updated_at at most once every
+CORPUS_CHECK_INTERVAL seconds.
+"""
+import threading
+import time
+import numpy as np
+from sqlalchemy import func
+from app import db
+from app.irsystem.models import Recipe
+from app.irsystem.models.corpus_index import invalidate_corpus_index
+from app.irsystem.models.nutrition_store import MEAL_TYPES, get_nutrition_store, \
+    invalidate_nutrition_store
+
+
+def _column_max(column):
+    """ Returns the largest non-NULL value of column, or None, like MAX(). """
+    if np.all(np.isnan(column)):
+        return None
+    return float(np.nanmax(column))
+
+
+class CorpusStats(object):
+    """ Aggregates over the recipes table: recipe_count, meal_counts (per
+    meal type) and the max_* of each nutrition column (None when every
+    value is NULL).
+    """
+
+    def __init__(self, nutrition_store):
+        self.recipe_count = len(nutrition_store.ids)
+        self.meal_counts = {m_type: int(np.count_nonzero(nutrition_store.meal_type == code))
+            for code, m_type in enumerate(MEAL_TYPES)}
+        self.max_calories = _column_max(nutrition_store.calories)
+        self.max_fat = _column_max(nutrition_store.fat)
+        self.max_sodium = _column_max(nutrition_store.sodium)
+        self.max_protein = _column_max(nutrition_store.protein)
+
+
+_corpus_stats = None
+_corpus_stats_lock = threading.Lock()
+
+
+def get_corpus_stats():
+    """ Returns the process-wide CorpusStats, computing it on first use. """
+    global _corpus_stats
+    if _corpus_stats is None:
+        with _corpus_stats_lock:
+            if _corpus_stats is None:
+                _corpus_stats = CorpusStats(get_nutrition_store())
+    return _corpus_stats
+
+
+def invalidate_corpus_caches():
+    """ Drops every per-process corpus cache (index, nutrition store and
+        statistics) so they are rebuilt on next use. Called by the loaders
+        after they change the recipes table.
+    """
+    global _corpus_stats
+    invalidate_corpus_index()
+    invalidate_nutrition_store()
+    with _corpus_stats_lock:
+        _corpus_stats = None
+    for callback in _invalidation_callbacks:
+        callback()
+
+
+_invalidation_callbacks = []
+
+
+def on_corpus_invalidated(callback):
+    """ Registers callback to be called by invalidate_corpus_caches, for
+        caches derived from the corpus that live outside this module.
+        Usable as a decorator.
+    """
+    _invalidation_callbacks.append(callback)
+    return callback
+
+
+_corpus_version = None
+_corpus_version_checked_at = 0
+
+
+def load_corpus_version():
+    """ Returns (number of recipes, latest updated_at) of the recipes table. """
+    return tuple(db.session.query(func.count(Recipe.id), func.max(Recipe.updated_at)).one())
+
+
+def check_corpus_version(interval):
+    """ Invalidates the corpus caches if the recipes table changed since the
+        last check. Queries the table at most once every interval seconds.
+    """
+    global _corpus_version, _corpus_version_checked_at
+    now = time.time()
+    if now - _corpus_version_checked_at < interval:
+        return
+    _corpus_version_checked_at = now
+    version = load_corpus_version()
+    if _corpus_version is not None and version != _corpus_version:
+        invalidate_corpus_caches()
+    _corpus_version = version
+
+
+def current_corpus_version():
+    """ Returns the corpus version seen by the last check, as a string that
+        is the same in every process looking at the same recipes table.
+    """
+    global _corpus_version
+    if _corpus_version is None:
+        _corpus_version = load_corpus_version()
+    return "{}:{}".format(*_corpus_version)
@@ -1,9 +1,37 @@
 # Methods to compose HTTP response JSON 
-from flask import jsonify
+from flask import jsonify, Response
 import base64
+import hashlib
 import json
+import re
 import numpy as np
 
+def tokenize(text):
+    """Returns a list of words that make up the text.
+        
+    We lowercase everything.
+    Regex is used to satisfy this function
+        
+    Params: {text: String}
+    Returns: List
+    """
+    return re.findall('[a-z]+',text.lower())
+
+
+def recipe_content_hash(title, ingredients, directions):
+    """Returns the content hash of a recipe, stored in recipes.content_hash.
+
+    It depends only on the title and the ingredient and direction lists, not
+    on how the lists are joined, so it stays the same through the loaders.
+
+    Params: {title: String
+             ingredients, directions: List of String}
+    Returns: String (40 hex digits)
+    """
+    payload = json.dumps([title, list(ingredients), list(directions)])
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
 def http_json(result, bool):
 	result.update({ "success": bool })
 	return jsonify(result)
@@ -14,6 +42,20 @@ def http_resource(result, name, bool=True):
 	return http_json(resp, bool)
 
 
+def http_compact_json(result, bool):
+	""" Like http_json, but encoded without whitespace by NumpyEncoder, so
+	numpy scalars and arrays need no conversion first.
+	"""
+	result.update({ "success": bool })
+	body = json.dumps(result, cls=NumpyEncoder, separators=(",", ":"))
+	return Response(body, mimetype="application/json")
+
+
+def http_compact_resource(result, name, bool=True):
+	resp = { "data": { name : result }}
+	return http_compact_json(resp, bool)
+
+
 def http_errors(result): 
 	errors = { "data" : { "errors" : result.errors["_schema"] }}
 	return http_json(errors, False)
@@ -35,8 +77,11 @@ class NumpyEncoder(json.JSONEncoder):
             return dict(__ndarray__=data_b64,
                         dtype=str(obj.dtype),
                         shape=obj.shape)
+        if isinstance(obj, np.generic):
+            # numpy scalars (e.g. scores) as the equivalent Python number
+            return obj.item()
         # Let the base class default method raise the TypeError
-        return json.JSONEncoder(self, obj)
+        return json.JSONEncoder.default(self, obj)
         
 def json_numpy_obj_hook(dct):
     """Decodes a previously encoded numpy ndarray with proper shape and dtype.
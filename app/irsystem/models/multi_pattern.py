@@ -0,0 +1,62 @@
+"""
+Aho-Corasick multi-pattern matching: finds every occurrence of any of a set
+of patterns in one left-to-right scan of a text, so the cost of a scan does
+not grow with the number of patterns.
+"""
+from collections import deque
+
+
+class PatternMatcher(object):
+    """ An automaton over patterns (non-empty strings, matched as substrings,
+    case-sensitively; multi-word patterns like "soy bean" and prefixes like
+    "anchov" need nothing special).
+    """
+
+    def __init__(self, patterns):
+        self.patterns = sorted(set(p for p in patterns if p))
+        # state 0 is the root; each state has its transitions, its failure
+        # link and the patterns ending there (including through failure links)
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [()]
+        for pattern in self.patterns:
+            state = 0
+            for char in pattern:
+                if char not in self._goto[state]:
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append(())
+                    self._goto[state][char] = len(self._goto) - 1
+                state = self._goto[state][char]
+            self._out[state] = (pattern,)
+
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, child in self._goto[state].items():
+                queue.append(child)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(char, 0)
+                self._out[child] = self._out[child] + self._out[self._fail[child]]
+
+    def scan(self, text):
+        """ Yields (end, pattern) for every occurrence of a pattern in text,
+            end being the index just past it.
+        """
+        goto, fail, out = self._goto, self._fail, self._out
+        state = 0
+        for i, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for pattern in out[state]:
+                yield i + 1, pattern
+
+    def findall(self, text):
+        """ Returns the set of patterns occurring in text. """
+        return {pattern for _, pattern in self.scan(text)}
+
+    def __len__(self):
+        return len(self.patterns)
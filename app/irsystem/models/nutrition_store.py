@@ -0,0 +1,129 @@
+"""
+In-memory columnar store of the numeric recipe fields used by the search
+filters, so nutrition limits, meal types and allergies are evaluated as
+vectorized NumPy masks instead of per-request SQL predicates.
+"""
+import threading
+import numpy as np
+from app import db
+from app.irsystem.models import Recipe
+from app.irsystem.models.postings import Postings
+from app.instrumentation import span
+
+# meal_type labels, in the order of their codes in NutritionStore.meal_type
+MEAL_TYPES = ("breakfast", "lunch", "dinner")
+
+
+def clean_rating(rating):
+    """ Returns rating, or 0 if it is missing or out of the 0-5 scale. """
+    if rating is None or rating > 5:
+        return 0
+    return rating
+
+
+class NutritionStore(object):
+    """ Columns of calories, fat, sodium, protein, rating, meal_type and
+    allergen_mask for every recipe, aligned with the sorted int32 array ids.
+
+    NULLs are stored as NaN in the float columns, as -1 in meal_type, and
+    flagged by has_allergen_mask, so every comparison against a NULL is
+    False, as it is in SQL. clean_rating holds the ratings already passed
+    through clean_rating(), for ranking.
+    """
+
+    def __init__(self, rows):
+        """ rows: list of (id, calories, fat, sodium, protein, rating,
+            meal_type, allergen_mask) tuples, ordered by id.
+        """
+        columns = list(zip(*rows)) if len(rows) > 0 else [()] * 8
+        self.ids = np.array(columns[0], dtype=np.int32)
+        self.calories = self._float_column(columns[1])
+        self.fat = self._float_column(columns[2])
+        self.sodium = self._float_column(columns[3])
+        self.protein = self._float_column(columns[4])
+        self.rating = self._float_column(columns[5])
+        self.clean_rating = np.array([clean_rating(v) for v in columns[5]], dtype=np.float64)
+        self.meal_type = np.array([MEAL_TYPES.index(m) if m in MEAL_TYPES else -1
+            for m in columns[6]], dtype=np.int8)
+        self.has_allergen_mask = np.array([m is not None for m in columns[7]], dtype=bool)
+        self.allergen_mask = np.array([m or 0 for m in columns[7]], dtype=np.int64)
+
+    @staticmethod
+    def _float_column(values):
+        return np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+
+    def positions(self, postings):
+        """ Returns the row positions of the ids in postings that are in
+            the store.
+        """
+        positions = np.searchsorted(self.ids, postings.ids)
+        found = positions < len(self.ids)
+        found[found] = self.ids[positions[found]] == postings.ids[found]
+        return positions[found]
+
+    def clean_ratings(self, recipe_ids):
+        """ Returns the clean ratings of recipe_ids, as a float array aligned
+            with them (0 for ids not in the store).
+        """
+        recipe_ids = np.asarray(recipe_ids, dtype=np.int32)
+        if len(self.ids) == 0:
+            return np.zeros(len(recipe_ids))
+        positions = np.searchsorted(self.ids, recipe_ids)
+        np.minimum(positions, len(self.ids) - 1, out=positions)
+        found = self.ids[positions] == recipe_ids
+        return np.where(found, self.clean_rating[positions], 0.0)
+
+    def filter(self, postings, cal_limit=None, fat_limit=None, sodium_limit=None,
+        m_type=None, allergy_mask=0):
+        """ Returns the ids in postings whose recipe has calories, fat and
+            sodium at most the given limits, is categorized as m_type and
+            contains none of the allergens in allergy_mask, as Postings.
+            Limits and m_type left as None are not checked.
+        """
+        positions = self.positions(postings)
+        keep = np.ones(len(positions), dtype=bool)
+        for column, limit in ((self.calories, cal_limit), (self.fat, fat_limit),
+            (self.sodium, sodium_limit)):
+            if limit is not None:
+                # NaN (NULL) compares False, which is meant: no warning
+                with np.errstate(invalid="ignore"):
+                    keep &= column[positions] <= float(limit)
+        if m_type is not None:
+            code = MEAL_TYPES.index(m_type) if m_type in MEAL_TYPES else -2
+            keep &= self.meal_type[positions] == code
+        if allergy_mask:
+            keep &= self.has_allergen_mask[positions]
+            keep &= (self.allergen_mask[positions] & allergy_mask) == 0
+        return Postings.from_sorted(self.ids[positions[keep]])
+
+
+_nutrition_store = None
+_nutrition_store_lock = threading.Lock()
+
+
+def load_nutrition_store():
+    """ Builds a NutritionStore from the recipes table. """
+    rows = db.session.query(Recipe.id, Recipe.calories, Recipe.fat, Recipe.sodium,
+        Recipe.protein, Recipe.rating, Recipe.meal_type, Recipe.allergen_mask)\
+            .order_by(Recipe.id).all()
+    return NutritionStore(rows)
+
+
+def get_nutrition_store():
+    """ Returns the process-wide NutritionStore, building it on first use. """
+    global _nutrition_store
+    if _nutrition_store is None:
+        with _nutrition_store_lock:
+            if _nutrition_store is None:
+                with span("build_nutrition_store"):
+                    _nutrition_store = load_nutrition_store()
+    return _nutrition_store
+
+
+def invalidate_nutrition_store():
+    """ Drops the process-wide NutritionStore so the next lookup rebuilds it.
+        Called after the recipes table has been changed.
+    """
+    global _nutrition_store
+    with _nutrition_store_lock:
+        _nutrition_store = None
@@ -0,0 +1,151 @@
+"""
+Compact postings lists: sorted, duplicate-free recipe ids stored in int32
+NumPy arrays, with linear-time merge operations.
+"""
+import numpy as np
+
+# use galloping intersection once one list is this many times longer
+GALLOP_RATIO = 16
+
+
+class Postings(object):
+    """ An immutable, sorted set of recipe ids backed by an int32 array.
+
+    Supports len(), iteration (as python ints), membership tests and the
+    set operators & (intersection), | (union) and - (difference).
+    """
+    __slots__ = ("ids",)
+
+    def __init__(self, ids=()):
+        """ ids: any iterable of ints, in any order, possibly repeated. """
+        if not isinstance(ids, np.ndarray):
+            ids = list(ids)
+        self.ids = np.unique(np.asarray(ids, dtype=np.int32))
+
+    @classmethod
+    def from_sorted(cls, ids):
+        """ Wraps ids, which must already be sorted and duplicate-free,
+            without re-sorting them.
+        """
+        postings = cls.__new__(cls)
+        postings.ids = np.asarray(ids, dtype=np.int32)
+        return postings
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        return iter(self.ids.tolist())
+
+    def __contains__(self, recipe_id):
+        i = np.searchsorted(self.ids, recipe_id)
+        return i < len(self.ids) and self.ids[i] == recipe_id
+
+    def __eq__(self, other):
+        return isinstance(other, Postings) and np.array_equal(self.ids, other.ids)
+
+    def __repr__(self):
+        return "Postings({})".format(self.ids.tolist())
+
+    def __and__(self, other):
+        return intersect(self, as_postings(other))
+
+    def __or__(self, other):
+        return union_all([self, as_postings(other)])
+
+    def __sub__(self, other):
+        return difference(self, as_postings(other))
+
+    def tolist(self):
+        return self.ids.tolist()
+
+
+EMPTY = Postings.from_sorted(np.empty(0, dtype=np.int32))
+
+
+def as_postings(ids):
+    """ Returns ids as Postings. Accepts Postings, arrays and iterables of ids,
+        including the (doc_id, tf) tuples of an inverted index.
+    """
+    if isinstance(ids, Postings):
+        return ids
+    if isinstance(ids, np.ndarray):
+        return Postings(ids)
+    ids = list(ids)
+    if len(ids) > 0 and isinstance(ids[0], tuple):
+        ids = [tup[0] for tup in ids]
+    return Postings(ids)
+
+
+def intersect_merge(postings1, postings2):
+    """ Returns the ids in both postings, by merging the two sorted runs.
+        O(n + m).
+    """
+    merged = np.concatenate((postings1.ids, postings2.ids))
+    # timsort merges the two pre-sorted runs in linear time
+    merged.sort(kind="mergesort")
+    return Postings.from_sorted(merged[:-1][merged[1:] == merged[:-1]])
+
+
+def intersect_galloping(small, large):
+    """ Returns the ids in both postings, probing each id of the small postings
+        into the large one by binary search. O(n log m), for n << m.
+    """
+    if len(small) == 0 or len(large) == 0:
+        return EMPTY
+    positions = np.searchsorted(large.ids, small.ids)
+    np.minimum(positions, len(large.ids) - 1, out=positions)
+    return Postings.from_sorted(small.ids[large.ids[positions] == small.ids])
+
+
+def intersect(postings1, postings2):
+    """ Returns the ids in both postings, picking the cheaper algorithm. """
+    if len(postings1) > len(postings2):
+        postings1, postings2 = postings2, postings1
+    if len(postings1) == 0:
+        return EMPTY
+    if len(postings1) * GALLOP_RATIO < len(postings2):
+        return intersect_galloping(postings1, postings2)
+    return intersect_merge(postings1, postings2)
+
+
+def intersect_all(postings_list):
+    """ Returns the ids in every postings, intersecting shortest first. """
+    postings_list = sorted(postings_list, key=len)
+    if len(postings_list) == 0:
+        return EMPTY
+    result = postings_list[0]
+    for postings in postings_list[1:]:
+        if len(result) == 0:
+            break
+        result = intersect(result, postings)
+    return result
+
+
+def union_all(postings_list):
+    """ Returns the ids in any of the postings, as one k-way merge.
+        O(N log k) for N ids over k postings.
+    """
+    postings_list = [p for p in postings_list if len(p) > 0]
+    if len(postings_list) == 0:
+        return EMPTY
+    if len(postings_list) == 1:
+        return postings_list[0]
+    merged = np.concatenate([p.ids for p in postings_list])
+    # timsort merges the k pre-sorted runs
+    merged.sort(kind="mergesort")
+    keep = np.empty(len(merged), dtype=bool)
+    keep[0] = True
+    np.not_equal(merged[1:], merged[:-1], out=keep[1:])
+    return Postings.from_sorted(merged[keep])
+
+
+def difference(postings1, postings2):
+    """ Returns the ids in postings1 and not in postings2.
+        O(n log m), vectorized.
+    """
+    if len(postings1) == 0 or len(postings2) == 0:
+        return postings1
+    positions = np.searchsorted(postings2.ids, postings1.ids)
+    np.minimum(positions, len(postings2.ids) - 1, out=positions)
+    return Postings.from_sorted(postings1.ids[postings2.ids[positions] != postings1.ids])
@@ -0,0 +1,140 @@
+"""
+Two-tier cache of ranked search results: a per-process LRU with TTL in front
+of a Redis tier shared by every gunicorn worker.
+
+Entries hold the ranked recipe ids of each meal (never rendered HTML) and
+are keyed on the normalized search parameters plus the corpus version, so a
+change to the recipes table makes every old entry unreachable. The local
+tier is also cleared whenever the corpus caches are invalidated.
+"""
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+import redis
+from app.irsystem.models.corpus_stats import current_corpus_version, \
+    on_corpus_invalidated
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "search:v1:"
+
+
+class LRUCache(object):
+    """ A bounded, thread-safe mapping that evicts the least recently used
+    entry when full and expires entries ttl seconds after they were set.
+    """
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """ Returns the value cached for key, or None. """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.time() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SearchResultCache(object):
+    """ Ranked search results, looked up first in the local LRU, then in
+    Redis (if a client is given). Redis errors degrade to a cache miss.
+    """
+
+    def __init__(self, local, redis_client=None, ttl=300):
+        self.local = local
+        self.redis = redis_client
+        self.ttl = ttl
+
+    @staticmethod
+    def key(params):
+        """ Returns the cache key of a dict of normalized search parameters. """
+        payload = json.dumps([current_corpus_version(), params], sort_keys=True)
+        return KEY_PREFIX + hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+    def get(self, params):
+        """ Returns the cached results for params, or None. """
+        key = self.key(params)
+        value = self.local.get(key)
+        if value is not None or self.redis is None:
+            return value
+        try:
+            raw = self.redis.get(key)
+        except redis.RedisError:
+            logger.warning("search cache: Redis get failed", exc_info=True)
+            return None
+        if raw is None:
+            return None
+        value = json.loads(raw)
+        self.local.set(key, value)
+        return value
+
+    def set(self, params, value):
+        """ Caches value, which must be JSON-serializable, for params. """
+        key = self.key(params)
+        self.local.set(key, value)
+        if self.redis is None:
+            return
+        try:
+            self.redis.set(key, json.dumps(value), ex=self.ttl)
+        except redis.RedisError:
+            logger.warning("search cache: Redis set failed", exc_info=True)
+
+    def clear_local(self):
+        self.local.clear()
+
+
+_search_cache = None
+_search_cache_lock = threading.Lock()
+
+
+def get_search_cache(config):
+    """ Returns the process-wide SearchResultCache, configured on first use
+        from SEARCH_CACHE_SIZE, SEARCH_CACHE_TTL and (optionally) REDIS_URL.
+    """
+    global _search_cache
+    if _search_cache is None:
+        with _search_cache_lock:
+            if _search_cache is None:
+                redis_client = None
+                if config.get("REDIS_URL"):
+                    redis_client = redis.Redis.from_url(config["REDIS_URL"],
+                        socket_timeout=config["REDIS_SOCKET_TIMEOUT"])
+                _search_cache = SearchResultCache(
+                    LRUCache(config["SEARCH_CACHE_SIZE"], config["SEARCH_CACHE_TTL"]),
+                    redis_client, ttl=config["SEARCH_CACHE_TTL"])
+    return _search_cache
+
+
+@on_corpus_invalidated
+def clear_local_search_cache():
+    """ Drops the local tier when the corpus changes; the Redis tier is keyed
+        on the corpus version and simply stops being hit.
+    """
+    if _search_cache is not None:
+        _search_cache.clear_local()
@@ -0,0 +1,189 @@
+"""
+Full-text search backends: how the recipe ids matching a set of words are
+found, without building Recipe.<field>.like('%word%') trees.
+
+- "memory" (default): the process-wide corpus index.
+- "postgres": tsvector columns with GIN indexes (see the
+  add_recipes_full_text_search migration).
+- "sqlite": an FTS5 table over the recipes, for local and embedded runs
+  (created by the same migration on SQLite).
+
+The database backends match words on prefixes ("egg" matches "eggs" but not
+"veggie"), which is the closest a full-text index gets to LIKE '%word%'. Given
+a limit, they return only that many matches, best rated first, so the database
+does not send every matching id.
+"""
+import threading
+from sqlalchemy import column, func, literal_column, or_, select, table
+from app.database import read_query
+from app.irsystem.models import Recipe
+from app.irsystem.models.corpus_index import INDEXED_FIELDS, get_corpus_index
+from app.irsystem.models.helpers import tokenize
+from app.irsystem.models.postings import Postings, EMPTY
+
+# recipe fields covered by the database full-text indexes
+FULL_TEXT_FIELDS = ("title", "description", "ingredients", "directions", "categories")
+
+# the FTS5 table of the sqlite backend; its rowid is the recipe id
+recipes_fts = table("recipes_fts", column("rowid"))
+
+
+class SearchBackend(object):
+    """ Finds the recipes whose fields contain given words. Subclasses
+    implement match_any, and may answer match_terms in fewer round trips.
+    """
+
+    def match_any(self, field_name, terms):
+        """ Returns the ids of recipes whose field_name contains any of terms,
+            as Postings.
+        """
+        raise NotImplementedError
+
+    def match_terms(self, field_name, query_words_with_caps, omit_words_with_caps,
+        drink_included, limit=None):
+        """ Returns the ids of recipes that contain (in field_name) at least one
+            of query_words_with_caps and none of omit_words_with_caps, and that
+            are not categorized as "Drink" unless drink_included, as Postings.
+            Backends may stop at limit ids (None: no limit).
+        """
+        raise NotImplementedError
+
+
+class MemorySearchBackend(SearchBackend):
+    """ Answers from the corpus index. Fields outside the index (description,
+    directions) fall back to one LIKE query.
+    """
+
+    def match_any(self, field_name, terms):
+        if field_name in INDEXED_FIELDS:
+            return get_corpus_index().match_any(field_name, terms)
+        field = getattr(Recipe, field_name)
+        rows = read_query(Recipe.id)\
+            .filter(or_(*[field.like("%{}%".format(term)) for term in terms])).all()
+        return Postings([row[0] for row in rows])
+
+    def match_terms(self, field_name, query_words_with_caps, omit_words_with_caps,
+        drink_included, limit=None):
+        # the index answers with whole bitmaps; cutting them short saves nothing
+        corpus_index = get_corpus_index()
+        if len(query_words_with_caps) > 0:
+            recipe_ids = corpus_index.match_any(field_name, query_words_with_caps)
+        else:
+            recipe_ids = corpus_index.all_ids
+
+        # NOT LIKE never matches a NULL field, so excluding words from a field
+        # also excludes the recipes where that field is NULL
+        if len(omit_words_with_caps) > 0:
+            recipe_ids &= corpus_index.present(field_name)
+            recipe_ids -= corpus_index.match_any(field_name, omit_words_with_caps)
+        if not drink_included:
+            recipe_ids &= corpus_index.present("categories")
+            recipe_ids -= corpus_index.lookup("categories", "Drink")
+        return recipe_ids
+
+
+class FullTextSearchBackend(SearchBackend):
+    """ Answers with one statement per call against a database full-text
+    index. Subclasses build the dialect's match condition.
+    """
+
+    def matches(self, field_name, terms):
+        """ Returns the condition that field_name matches any of terms, or None
+            if none of terms has a word to search for.
+        """
+        raise NotImplementedError
+
+    def match_any(self, field_name, terms):
+        condition = self.matches(field_name, terms)
+        if condition is None:
+            return EMPTY
+        return Postings([row[0] for row in read_query(Recipe.id).filter(condition)])
+
+    def match_terms(self, field_name, query_words_with_caps, omit_words_with_caps,
+        drink_included, limit=None):
+        query = read_query(Recipe.id)
+        if len(query_words_with_caps) > 0:
+            condition = self.matches(field_name, query_words_with_caps)
+            if condition is None:
+                return EMPTY
+            query = query.filter(condition)
+        if len(omit_words_with_caps) > 0:
+            query = query.filter(getattr(Recipe, field_name).isnot(None))
+            condition = self.matches(field_name, omit_words_with_caps)
+            if condition is not None:
+                query = query.filter(~condition)
+        if not drink_included:
+            query = query.filter(Recipe.categories.isnot(None))\
+                .filter(~self.matches("categories", ["Drink"]))
+        if limit is not None:
+            # rating is the part of the score a query cannot change
+            query = query.order_by(Recipe.rating.is_(None), Recipe.rating.desc(),
+                Recipe.id).limit(limit)
+        return Postings([row[0] for row in query])
+
+
+def _phrases(terms):
+    """ Returns the distinct lowercase word lists of terms, skipping terms
+        without words.
+    """
+    phrases = []
+    for term in terms:
+        words = tokenize(term)
+        if words and words not in phrases:
+            phrases.append(words)
+    return phrases
+
+
+class PostgresSearchBackend(FullTextSearchBackend):
+    """ Matches against the recipes.<field>_tsv columns (GIN indexed), kept up
+    to date by a trigger.
+    """
+
+    def matches(self, field_name, terms):
+        phrases = _phrases(terms)
+        if not phrases:
+            return None
+        # tokens are [a-z]+, so they need no tsquery escaping
+        tsquery = " | ".join("(" + " <-> ".join(w + ":*" for w in words) + ")"
+            for words in phrases)
+        tsv = literal_column("recipes.{}_tsv".format(field_name))
+        return tsv.op("@@")(func.to_tsquery("simple", tsquery))
+
+
+class SQLiteSearchBackend(FullTextSearchBackend):
+    """ Matches against the recipes_fts FTS5 table, whose rowid is the
+    recipe id.
+    """
+
+    def matches(self, field_name, terms):
+        phrases = _phrases(terms)
+        if not phrases:
+            return None
+        match = "{} : ({})".format(field_name, " OR ".join(
+            '"{}" *'.format(" ".join(words)) for words in phrases))
+        fts_ids = select([recipes_fts.c.rowid])\
+            .where(literal_column("recipes_fts").op("MATCH")(match))
+        return Recipe.id.in_(fts_ids)
+
+
+SEARCH_BACKENDS = {
+    "memory": MemorySearchBackend,
+    "postgres": PostgresSearchBackend,
+    "sqlite": SQLiteSearchBackend,
+}
+
+_search_backend = None
+_search_backend_lock = threading.Lock()
+
+
+def get_search_backend(config):
+    """ Returns the process-wide SearchBackend named by SEARCH_BACKEND. """
+    global _search_backend
+    if _search_backend is None:
+        with _search_backend_lock:
+            if _search_backend is None:
+                name = config["SEARCH_BACKEND"]
+                if name not in SEARCH_BACKENDS:
+                    raise ValueError("unknown SEARCH_BACKEND: {}".format(name))
+                _search_backend = SEARCH_BACKENDS[name]()
+    return _search_backend
@@ -0,0 +1,63 @@
+"""
+Plans the candidate retrieval of a search: the per-field term matches come
+from the search backend as the ranking stages need them, and the per-meal
+filters from the nutrition store. Only ids are handled; no recipe rows are
+fetched.
+"""
+import threading
+from app.instrumentation import span
+from app.irsystem.models.nutrition_store import get_nutrition_store
+from app.irsystem.models.search_backend import MemorySearchBackend
+
+# fields searched by the main search, in the order final_search consults them
+SEARCH_FIELDS = ("title", "ingredients")
+
+
+class SearchPlan(object):
+    """ The candidate recipes of one search, for each selected meal type and
+    each searched field.
+
+    candidate_ids(m_type, field_name) returns the matching ids as Postings.
+    The term matching of a field is done by backend (see search_backend;
+    default: the in-memory corpus index) the first time one of its candidates
+    is asked for, so a field no stage needs costs nothing. A database backend
+    returns at most limit ids per field (default: all).
+    """
+
+    def __init__(self, meal_types, query_words_with_caps, omit_words_with_caps,
+        cal_limit, fat_limit, sodium_limit, drink_included, allergy_mask,
+        fields=SEARCH_FIELDS, backend=None, limit=None):
+        self.meal_types = list(meal_types)
+        self.fields = list(fields)
+        self.query_words_with_caps = query_words_with_caps
+        self.omit_words_with_caps = omit_words_with_caps
+        self.limits = {"cal_limit": cal_limit, "fat_limit": fat_limit,
+            "sodium_limit": sodium_limit, "allergy_mask": allergy_mask}
+        self.drink_included = drink_included
+        self.backend = backend or MemorySearchBackend()
+        self.limit = limit
+        self._field_ids = {}
+        self._candidates = {}
+        # meals are ranked concurrently, but each field is matched once
+        self._lock = threading.Lock()
+
+    def field_ids(self, field_name):
+        """ Returns the ids whose field_name matches the search terms, for
+        any meal type.
+        """
+        with self._lock:
+            if field_name not in self._field_ids:
+                with span("match"):
+                    self._field_ids[field_name] = self.backend.match_terms(field_name,
+                        self.query_words_with_caps, self.omit_words_with_caps,
+                        self.drink_included, limit=self.limit)
+            return self._field_ids[field_name]
+
+    def candidate_ids(self, m_type, field_name):
+        """ Returns the ids of the candidates of m_type on field_name. """
+        key = (m_type, field_name)
+        if key not in self._candidates:
+            # a NULL nutrition value or allergen mask never passes, as in SQL
+            self._candidates[key] = get_nutrition_store().filter(
+                self.field_ids(field_name), m_type=m_type, **self.limits)
+        return self._candidates[key]
@@ -0,0 +1,205 @@
+"""
+Vector-space ranking (TF-IDF cosine similarity and BM25) over a sparse
+doc-term matrix of the whole corpus.
+
+The matrix is built once per process from the corpus index postings, so
+scoring a query is one sparse matrix-vector product followed by an
+argpartition over the candidates. Query words are expanded over the
+vocabulary like the corpus index expands them ("egg" also scores "eggs"), so
+every candidate a query matches can score.
+"""
+import threading
+from collections import Counter
+import numpy as np
+from scipy import sparse
+from app.irsystem.models.corpus_index import EXPANSION_CACHE_SIZE, get_corpus_index
+from app.irsystem.models.corpus_stats import on_corpus_invalidated
+from app.irsystem.models.helpers import tokenize
+from app.irsystem.models.multi_pattern import PatternMatcher
+from app.instrumentation import span
+
+# ranking modes accepted by search(), besides the default "boolean"
+RANKING_MODES = ("cosine", "bm25")
+
+# recipe fields whose words make up a document
+VECTOR_FIELDS = ("title", "ingredients")
+
+
+def build_doc_term_matrix(corpus_index, fields=VECTOR_FIELDS):
+    """ Returns (doc_term, vocab): the CSR matrix of term counts with one row
+        per corpus_index.all_ids and one column per term, summed over fields,
+        and the dict of term to column.
+    """
+    doc_ids = corpus_index.all_ids.ids
+    vocab = {}
+    rows, cols, counts = [], [], []
+    for field in fields:
+        term_counts = corpus_index.term_counts[field]
+        for term, postings in corpus_index.inverted_index(field).items():
+            col = vocab.setdefault(term, len(vocab))
+            rows.append(np.searchsorted(doc_ids, postings.ids))
+            cols.append(np.full(len(postings), col, dtype=np.int32))
+            counts.append(term_counts[term])
+    if len(rows) == 0:
+        return sparse.csr_matrix((len(doc_ids), 0), dtype=np.float64), vocab
+    # duplicate (row, col) pairs from different fields are summed
+    doc_term = sparse.coo_matrix(
+        (np.concatenate(counts).astype(np.float64), (np.concatenate(rows), np.concatenate(cols))),
+        shape=(len(doc_ids), len(vocab))).tocsr()
+    doc_term.sum_duplicates()
+    return doc_term, vocab
+
+
+def compute_idf(df, n_docs, min_df=1, max_df_ratio=1.0):
+    """ Returns the idf, log2(n_docs / (1 + df)), of each term given its
+        document frequency array df. Terms in fewer than min_df documents
+        or in more than max_df_ratio of them get an idf of 0.
+    """
+    idf = np.log2(n_docs / (1.0 + df))
+    idf[(df < min_df) | (df > max_df_ratio * n_docs)] = 0
+    return np.maximum(idf, 0)
+
+
+def compute_norms(doc_vectors):
+    """ Returns the euclidean norm of each row of a sparse matrix. """
+    return np.sqrt(np.asarray(doc_vectors.multiply(doc_vectors).sum(axis=1)).ravel())
+
+
+class VectorSpaceModel(object):
+    """ TF-IDF and BM25 weights of every recipe, as CSR matrices whose rows
+    are aligned with doc_ids.
+    """
+
+    def __init__(self, corpus_index, min_df=1, max_df_ratio=0.9, k1=1.2, b=0.75):
+        self.doc_ids = corpus_index.all_ids.ids
+        doc_term, self.vocab = build_doc_term_matrix(corpus_index)
+        n_docs = max(len(self.doc_ids), 1)
+        df = np.bincount(doc_term.indices, minlength=len(self.vocab))
+
+        # tf-idf, for cosine similarity
+        self.idf = compute_idf(df, n_docs, min_df, max_df_ratio)
+        self.tfidf = sparse.csr_matrix(doc_term.multiply(self.idf.reshape(1, -1)))
+        self.norms = compute_norms(self.tfidf)
+
+        # bm25: idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * dl / avgdl))
+        doc_lengths = np.asarray(doc_term.sum(axis=1)).ravel()
+        avgdl = doc_lengths.mean() if len(doc_lengths) > 0 else 0
+        bm25_idf = np.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+        self.bm25 = doc_term.copy()
+        row_lengths = np.repeat(doc_lengths, np.diff(doc_term.indptr))
+        tf = self.bm25.data
+        self.bm25.data = bm25_idf[doc_term.indices] * tf * (k1 + 1) / \
+            (tf + k1 * (1 - b + b * row_lengths / max(avgdl, 1e-9)))
+        self._expansions = {}
+
+    def expand(self, words):
+        """ Returns the columns of the vocabulary terms containing each of
+            words, as a dict of word to array, matching all words not expanded
+            yet against the vocabulary in a single pass.
+        """
+        missing = set(w for w in words if w not in self._expansions)
+        if missing:
+            if len(self._expansions) + len(missing) > EXPANSION_CACHE_SIZE:
+                self._expansions = {}
+            matcher = PatternMatcher(missing)
+            matches = {word: [] for word in missing}
+            for term, col in self.vocab.items():
+                for word in matcher.findall(term):
+                    matches[word].append(col)
+            for word, cols in matches.items():
+                self._expansions[word] = np.array(sorted(cols), dtype=np.int64)
+        return {word: self._expansions[word] for word in words}
+
+    def query_vector(self, query_words):
+        """ Returns the term counts of the query words as a dense vector, each
+            word counting for every vocabulary term containing it (see
+            CorpusIndex.lookup). Words no term contains are ignored.
+        """
+        vector = np.zeros(len(self.vocab))
+        counts = Counter(w for word in query_words for w in tokenize(word))
+        for word, cols in self.expand(list(counts)).items():
+            vector[cols] += counts[word]
+        return vector
+
+    def cosine_sim(self, query_words):
+        """ Returns the cosine similarity of the query with every document,
+            aligned with doc_ids.
+        """
+        query = self.query_vector(query_words) * self.idf
+        query_norm = np.linalg.norm(query)
+        if query_norm == 0:
+            return np.zeros(len(self.doc_ids))
+        scores = self.tfidf.dot(query)
+        denominators = self.norms * query_norm
+        return np.divide(scores, denominators, out=np.zeros_like(scores),
+            where=denominators > 0)
+
+    def bm25_scores(self, query_words):
+        """ Returns the BM25 score of the query for every document, aligned
+            with doc_ids.
+        """
+        return self.bm25.dot(self.query_vector(query_words))
+
+    def scores(self, mode, query_words):
+        """ Returns the scores of the given ranking mode (see RANKING_MODES). """
+        if mode == "bm25":
+            return self.bm25_scores(query_words)
+        return self.cosine_sim(query_words)
+
+    def score_ids(self, mode, query_words, recipe_ids):
+        """ Returns the scores of the given ranking mode for recipe_ids, as a
+            list aligned with them (0 for ids not in the model).
+        """
+        scores = self.scores(mode, query_words)
+        recipe_ids = np.asarray(recipe_ids, dtype=self.doc_ids.dtype)
+        positions = np.searchsorted(self.doc_ids, recipe_ids)
+        in_store = positions < len(self.doc_ids)
+        in_store[in_store] = self.doc_ids[positions[in_store]] == recipe_ids[in_store]
+        result = np.zeros(len(recipe_ids))
+        result[in_store] = scores[positions[in_store]]
+        return result.tolist()
+
+    def top_k(self, scores, k, candidates=None):
+        """ Returns the ids of the k best scoring documents, best first, among
+            candidates (Postings; default: all). Ties go to the smaller id.
+        """
+        if k <= 0:
+            return []
+        positions = np.arange(len(self.doc_ids))
+        if candidates is not None:
+            positions = np.searchsorted(self.doc_ids, candidates.ids)
+            in_store = positions < len(self.doc_ids)
+            in_store[in_store] = self.doc_ids[positions[in_store]] == candidates.ids[in_store]
+            positions = positions[in_store]
+        if len(positions) > k:
+            best = np.argpartition(-scores[positions], k - 1)[:k]
+            # keep every candidate tied with the k-th score, so ties are
+            # broken by id rather than by argpartition's arbitrary order
+            threshold = scores[positions[best]].min()
+            positions = positions[scores[positions] >= threshold]
+        order = np.lexsort((self.doc_ids[positions], -scores[positions]))[:k]
+        return self.doc_ids[positions[order]].tolist()
+
+
+_vector_space_model = None
+_vector_space_model_lock = threading.Lock()
+
+
+def get_vector_space_model():
+    """ Returns the process-wide VectorSpaceModel, building it on first use. """
+    global _vector_space_model
+    if _vector_space_model is None:
+        with _vector_space_model_lock:
+            if _vector_space_model is None:
+                corpus_index = get_corpus_index()
+                with span("build_vector_space_model"):
+                    _vector_space_model = VectorSpaceModel(corpus_index)
+    return _vector_space_model
+
+
+@on_corpus_invalidated
+def invalidate_vector_space_model():
+    """ Drops the process-wide VectorSpaceModel so it is rebuilt on next use. """
+    global _vector_space_model
+    with _vector_space_model_lock:
+        _vector_space_model = None
@@ -9,9 +9,54 @@ class Config(object):
   CSRF_SESSION_KEY = "secret"
   SECRET_KEY = "not_this"
   SQLALCHEMY_DATABASE_URI = os.environ['DATABASE_URL']
+  # read-only search queries go to this replica when set (see app/database.py)
+  SQLALCHEMY_REPLICA_URI = os.environ.get('DATABASE_REPLICA_URL')
+  # connection pool of each worker, per database
+  DB_POOL_SIZE = 5
+  DB_MAX_OVERFLOW = 10
+  # seconds to wait for a connection once all are in use
+  DB_POOL_TIMEOUT = 10
+  # seconds after which connections are replaced, and whether to test them
+  # on checkout, so connections dropped by the server are not handed out
+  DB_POOL_RECYCLE = 1800
+  DB_POOL_PRE_PING = True
+  # milliseconds any Postgres statement may run (0: no limit)
+  DB_STATEMENT_TIMEOUT = int(os.environ.get('DB_STATEMENT_TIMEOUT', 10000))
+  # make psycopg2 yield to other greenlets while it waits on the database
+  DB_GEVENT = True
+  # serve the pool stats at /api/db-pool; open to anyone, so off by default
+  DB_POOL_ENDPOINT_ENABLED = os.environ.get('DB_POOL_ENDPOINT_ENABLED') == '1'
+  # seconds between checks for recipe changes made by other processes
+  CORPUS_CHECK_INTERVAL = 60
+  # search result cache: per-worker LRU, backed by Redis when REDIS_URL is set
+  SEARCH_CACHE_SIZE = 1024
+  # ranked results kept per meal, i.e. how many pages can be served
+  SEARCH_MAX_RESULTS = 100
+  SEARCH_CACHE_TTL = 300
+  REDIS_URL = os.environ.get('REDIS_URL')
+  REDIS_SOCKET_TIMEOUT = 0.1
+  # full-text search backend: "memory", "postgres" or "sqlite" (see search_backend)
+  SEARCH_BACKEND = os.environ.get('SEARCH_BACKEND', 'memory')
+  # candidates a database backend returns per field, per ranked result
+  SEARCH_CANDIDATES_PER_RESULT = 50
+  # meals of a search are retrieved concurrently, on a pool of at most this
+  # many greenlets per worker
+  SEARCH_POOL_SIZE = 30
+  # seconds a search waits for its meals; slower ones are left out. Checked
+  # while a meal waits on the database or between its ranking stages, not
+  # in the middle of one
+  SEARCH_TIMEOUT = 5
+  # send the results page a meal at a time, as each is ranked
+  SEARCH_STREAMING = True
+  # time requests and search stages and count SQL
+  METRICS_ENABLED = True
+  # serve them at /metrics; open to anyone, so off by default
+  METRICS_ENDPOINT_ENABLED = os.environ.get('METRICS_ENDPOINT_ENABLED') == '1'
 
 class ProductionConfig(Config):
   DEBUG = False
+  DB_POOL_SIZE = 10
+  DB_MAX_OVERFLOW = 20
 
 class StagingConfig(Config):
   DEVELOPMENT = True
@@ -20,6 +65,8 @@ class StagingConfig(Config):
 class DevelopmentConfig(Config):
   DEVELOPMENT = True
   DEBUG = True
+  DB_POOL_SIZE = 2
 
 class TestingConfig(Config):
   TESTING = True
+  DB_POOL_SIZE = 2
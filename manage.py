@@ -1,4 +1,6 @@
 import os
+# maintenance commands run long statements, so they are not timed out
+os.environ.setdefault("DB_STATEMENT_TIMEOUT", "0")
 from flask_script import Manager
 from flask_migrate import Migrate, MigrateCommand
 from app import app, db
@@ -8,5 +10,40 @@ manager = Manager(app)
 
 manager.add_command("db", MigrateCommand)
 
+
+@manager.command
+def populate_db():
+  """Load app/full_format_recipes.json into an empty recipes table"""
+  from app.db_manage2 import populate_db
+  populate_db()
+
+
+@manager.command
+def load_recipes():
+  """Load the recipe and review datasets in one pass, resuming if interrupted"""
+  from app.db_manage2 import load_recipes
+  load_recipes()
+
+
+@manager.command
+def classify_new_recipes():
+  """Set the meal type of recipes without one, with the latest saved model"""
+  from app.db_manage2 import classify_new_recipes
+  classify_new_recipes()
+
+
+@manager.command
+def backfill_content_hashes():
+  """Set the content hash of recipes loaded before it existed, resuming if interrupted"""
+  from app.db_manage2 import backfill_content_hashes
+  backfill_content_hashes()
+
+
+@manager.command
+def recompute_allergen_masks():
+  """Recompute recipes.allergen_mask, e.g. after allergy_map changes"""
+  from app.db_manage2 import recompute_allergen_masks
+  recompute_allergen_masks()
+
 if __name__ == "__main__":
   manager.run()
@@ -0,0 +1,81 @@
+"""create the original schema
+
+Revision ID: 0d5e8a3c1f42
+Revises: 
+Create Date: 2026-10-17 21:48:03.551207
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0d5e8a3c1f42'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def timestamps():
+    return [sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True)]
+
+
+def upgrade():
+    # tables made by db.create_all() before migrations existed are kept as they are
+    existing = set(sa.inspect(op.get_bind()).get_table_names())
+    if 'users' not in existing:
+        op.create_table('users', *timestamps(),
+            sa.Column('email', sa.String(length=128), nullable=False),
+            sa.Column('fname', sa.String(length=128), nullable=False),
+            sa.Column('lname', sa.String(length=128), nullable=False),
+            sa.Column('password_digest', sa.String(length=192), nullable=False),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('email'))
+    if 'sessions' not in existing:
+        op.create_table('sessions', *timestamps(),
+            sa.Column('user_id', sa.Integer(), nullable=True),
+            sa.Column('session_token', sa.String(length=40), nullable=True),
+            sa.Column('update_token', sa.String(length=40), nullable=True),
+            sa.Column('expires_at', sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+            sa.PrimaryKeyConstraint('id'))
+        op.create_index(op.f('ix_sessions_user_id'), 'sessions', ['user_id'], unique=True)
+    if 'recipes' not in existing:
+        op.create_table('recipes', *timestamps(),
+            sa.Column('meal_type', sa.String(), nullable=True),
+            sa.Column('directions', sa.String(), nullable=True),
+            sa.Column('ingredients', sa.String(), nullable=True),
+            sa.Column('fat', sa.Float(), nullable=True),
+            sa.Column('date', sa.DateTime(), nullable=True),
+            sa.Column('calories', sa.Float(), nullable=True),
+            sa.Column('description', sa.String(), nullable=True),
+            sa.Column('protein', sa.Float(), nullable=True),
+            sa.Column('rating', sa.Float(), nullable=True),
+            sa.Column('title', sa.String(), nullable=True),
+            sa.Column('sodium', sa.Float(), nullable=True),
+            sa.Column('categories', sa.String(), nullable=True),
+            sa.Column('review', sa.String(), nullable=True),
+            sa.PrimaryKeyConstraint('id'))
+    if 'categories' not in existing:
+        op.create_table('categories', *timestamps(),
+            sa.Column('name', sa.String(length=40), nullable=True),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('name'))
+    if 'recipe_categorizations' not in existing:
+        op.create_table('recipe_categorizations', *timestamps(),
+            sa.Column('recipe_id', sa.Integer(), nullable=True),
+            sa.Column('category_id', sa.Integer(), nullable=True),
+            sa.ForeignKeyConstraint(['category_id'], ['categories.id']),
+            sa.ForeignKeyConstraint(['recipe_id'], ['recipes.id']),
+            sa.PrimaryKeyConstraint('id'))
+
+
+def downgrade():
+    op.drop_table('recipe_categorizations')
+    op.drop_table('categories')
+    op.drop_table('recipes')
+    op.drop_index(op.f('ix_sessions_user_id'), table_name='sessions')
+    op.drop_table('sessions')
+    op.drop_table('users')
@@ -0,0 +1,83 @@
+"""add recipes.allergen_mask
+
+Revision ID: 3f1c2a9b7d10
+Revises: 0d5e8a3c1f42
+Create Date: 2026-10-17 21:50:12.418305
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1c2a9b7d10'
+down_revision = '0d5e8a3c1f42'
+branch_labels = None
+depends_on = None
+
+# the foods of each allergy and its bit, as in allergens.py when this revision
+# was written; frozen so later edits there do not change what it backfills
+ALLERGEN_FOODS = (
+    (1 << 0, ("brie", "Brie", "butter", "Butter", "cheddar", "Cheddar", "cheese",
+        "Cheese", "cream", "Cream", "custard", "Custard", "feta", "Feta", "milk",
+        "Milk", "mozzarella", "Mozzarella", "parmesan", "Parmesan", "Parmigiano",
+        "parmigiano", "provolone", "Provolone", "ricotta", "Ricotta", "whey",
+        "yogurt", "Yogurt")),
+    (1 << 1, ("egg", "Egg")),
+    (1 << 2, ("albacore", "anchov", "Anchov", "carp", "Carp", "cod", "Cod", "fish",
+        "Fish", "herring", "mackerel", "pollock", "salmon", "Salmon", "sardine",
+        "tilapia", "trout", "tuna", "Tuna", "yellowfin", "yellowtail")),
+    (1 << 3, ("peanut", "Peanut")),
+    (1 << 4, ("clam", "Clam", "crab", "Crab", "crawfish", "Crawfish", "crayfish",
+        "lobster", "mussel", "oyster", "Oyster", "prawn", "scallop", "shrimp", "Shrimp",
+        "squid")),
+    (1 << 5, ("soy", "Soy", "soybean", "Soybean", "soy bean")),
+    (1 << 6, ("almond", "Almond", "cashew", "Cashew", "chestnut", "Chestnut",
+        "hazelnut", "Hazelnut", "hickory", "macadamia", "pecan", "Pecan", "pine",
+        "Pine", "pistachio", "Pistachio", "walnut", "Walnut")),
+    (1 << 7, ("wheat", "Wheat")),
+)
+
+
+def allergen_mask(ingredients):
+    """ Returns the allergen bitmask of an ingredients text (None for None):
+        the bit of each allergy with a food occurring in it (case-sensitive).
+    """
+    if ingredients is None:
+        return None
+    mask = 0
+    for bit, foods in ALLERGEN_FOODS:
+        if any(food in ingredients for food in foods):
+            mask |= bit
+    return mask
+
+
+def upgrade():
+    op.add_column('recipes', sa.Column('allergen_mask', sa.Integer(), nullable=True))
+    op.create_index(op.f('ix_recipes_allergen_mask'), 'recipes', ['allergen_mask'], unique=False)
+    backfill_allergen_masks()
+
+
+def backfill_allergen_masks(batch_size=1000):
+    """ Sets the allergen mask of the existing recipes, so the allergy filter
+        does not drop them. Recipes without ingredients keep a NULL mask.
+    """
+    conn = op.get_bind()
+    recipes = sa.table('recipes', sa.column('id', sa.Integer),
+        sa.column('ingredients', sa.String), sa.column('allergen_mask', sa.Integer))
+    update = recipes.update().where(recipes.c.id == sa.bindparam('recipe_id')) \
+        .values(allergen_mask=sa.bindparam('mask'))
+    last_id = 0
+    while True:
+        rows = conn.execute(sa.select([recipes.c.id, recipes.c.ingredients])
+            .where(recipes.c.id > last_id).order_by(recipes.c.id).limit(batch_size)).fetchall()
+        if not rows:
+            break
+        conn.execute(update, [{'recipe_id': row.id, 'mask': allergen_mask(row.ingredients)}
+            for row in rows])
+        last_id = rows[-1].id
+
+
+def downgrade():
+    op.drop_index(op.f('ix_recipes_allergen_mask'), table_name='recipes')
+    op.drop_column('recipes', 'allergen_mask')
@@ -0,0 +1,85 @@
+"""add full-text search indexes on recipes
+
+Revision ID: 8b4e6d2f1a57
+Revises: 3f1c2a9b7d10
+Create Date: 2026-10-17 23:04:37.162940
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '8b4e6d2f1a57'
+down_revision = '3f1c2a9b7d10'
+branch_labels = None
+depends_on = None
+
+# must match search_backend.FULL_TEXT_FIELDS
+FIELDS = ('title', 'description', 'ingredients', 'directions', 'categories')
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        for field in FIELDS:
+            op.add_column('recipes', sa.Column(field + '_tsv', postgresql.TSVECTOR(), nullable=True))
+        op.execute("""
+            CREATE FUNCTION recipes_tsv_update() RETURNS trigger AS $$
+            BEGIN
+            {}
+              RETURN NEW;
+            END
+            $$ LANGUAGE plpgsql
+        """.format("\n".join(
+            "  NEW.{0}_tsv := to_tsvector('simple', coalesce(NEW.{0}, ''));".format(field)
+            for field in FIELDS)))
+        op.execute("""
+            CREATE TRIGGER recipes_tsv_update BEFORE INSERT OR UPDATE ON recipes
+            FOR EACH ROW EXECUTE PROCEDURE recipes_tsv_update()
+        """)
+        op.execute("UPDATE recipes SET {}".format(", ".join(
+            "{0}_tsv = to_tsvector('simple', coalesce({0}, ''))".format(field)
+            for field in FIELDS)))
+        for field in FIELDS:
+            op.create_index('ix_recipes_{}_tsv'.format(field), 'recipes', [field + '_tsv'],
+                unique=False, postgresql_using='gin')
+    elif dialect == 'sqlite':
+        columns = ", ".join(FIELDS)
+        new_values = ", ".join("new." + field for field in FIELDS)
+        old_values = ", ".join("old." + field for field in FIELDS)
+        op.execute("CREATE VIRTUAL TABLE recipes_fts USING fts5({}, content='recipes', "
+            "content_rowid='id')".format(columns))
+        op.execute("""
+            CREATE TRIGGER recipes_fts_insert AFTER INSERT ON recipes BEGIN
+              INSERT INTO recipes_fts(rowid, {0}) VALUES (new.id, {1});
+            END
+        """.format(columns, new_values))
+        op.execute("""
+            CREATE TRIGGER recipes_fts_delete AFTER DELETE ON recipes BEGIN
+              INSERT INTO recipes_fts(recipes_fts, rowid, {0}) VALUES ('delete', old.id, {1});
+            END
+        """.format(columns, old_values))
+        op.execute("""
+            CREATE TRIGGER recipes_fts_update AFTER UPDATE ON recipes BEGIN
+              INSERT INTO recipes_fts(recipes_fts, rowid, {0}) VALUES ('delete', old.id, {1});
+              INSERT INTO recipes_fts(rowid, {0}) VALUES (new.id, {2});
+            END
+        """.format(columns, old_values, new_values))
+        op.execute("INSERT INTO recipes_fts(recipes_fts) VALUES ('rebuild')")
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        for field in FIELDS:
+            op.drop_index('ix_recipes_{}_tsv'.format(field), table_name='recipes')
+        op.execute("DROP TRIGGER recipes_tsv_update ON recipes")
+        op.execute("DROP FUNCTION recipes_tsv_update()")
+        for field in FIELDS:
+            op.drop_column('recipes', field + '_tsv')
+    elif dialect == 'sqlite':
+        for trigger in ('recipes_fts_insert', 'recipes_fts_delete', 'recipes_fts_update'):
+            op.execute("DROP TRIGGER {}".format(trigger))
+        op.execute("DROP TABLE recipes_fts")
@@ -0,0 +1,33 @@
+"""add job_progress
+
+Revision ID: c5a93e0d7b21
+Revises: 8b4e6d2f1a57
+Create Date: 2026-10-18 00:12:48.530716
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5a93e0d7b21'
+down_revision = '8b4e6d2f1a57'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('job_progress',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.Column('name', sa.String(length=80), nullable=True),
+    sa.Column('last_id', sa.Integer(), nullable=True),
+    sa.Column('rows_done', sa.Integer(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('name')
+    )
+
+
+def downgrade():
+    op.drop_table('job_progress')
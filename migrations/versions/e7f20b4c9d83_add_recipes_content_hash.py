@@ -0,0 +1,26 @@
+"""add recipes.content_hash
+
+Revision ID: e7f20b4c9d83
+Revises: c5a93e0d7b21
+Create Date: 2026-10-18 00:41:09.287154
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7f20b4c9d83'
+down_revision = 'c5a93e0d7b21'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('recipes', sa.Column('content_hash', sa.String(length=40), nullable=True))
+    op.create_index(op.f('ix_recipes_content_hash'), 'recipes', ['content_hash'], unique=True)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_recipes_content_hash'), table_name='recipes')
+    op.drop_column('recipes', 'content_hash')
@@ -0,0 +1,22 @@
+import os
+import sys
+import pytest
+
+# the app reads its settings from the environment when first imported
+os.environ.setdefault("APP_SETTINGS", "config.TestingConfig")
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def client():
+  """A test client of the app, on an empty database."""
+  from app import app, db
+  from app.irsystem.models.corpus_stats import invalidate_corpus_caches
+  with app.app_context():
+    db.create_all()
+  yield app.test_client()
+  with app.app_context():
+    db.session.remove()
+    db.drop_all()
+  invalidate_corpus_caches()
@@ -0,0 +1,38 @@
+import pytest
+from app.irsystem.controllers.api_controller import decode_cursor, encode_cursor
+
+SEARCH_PARAMS = {"fav_foods": "egg", "omit_foods": "", "cal_limit": "500",
+  "fat_limit": "30", "sodium_limit": "2000", "meal_types": ["breakfast", "lunch"],
+  "drink_included": False, "allergies": ["Peanut"], "ranking": "boolean"}
+
+
+def forged(**changes):
+  search_params = dict(SEARCH_PARAMS, **changes)
+  return encode_cursor(search_params, 10)
+
+
+def test_cursor_round_trip():
+  assert decode_cursor(encode_cursor(SEARCH_PARAMS, 10)) == (SEARCH_PARAMS, 10)
+
+
+@pytest.mark.parametrize("changes", [
+  {"cal_limit": "zz"}, {"fat_limit": "-1"}, {"sodium_limit": "inf"}, {"cal_limit": 500},
+  {"fav_foods": ["egg"]}, {"omit_foods": None},
+  {"meal_types": "breakfast"}, {"meal_types": []}, {"meal_types": ["brunch"]},
+  {"meal_types": ["lunch", "lunch"]},
+  {"drink_included": "yes"},
+  {"allergies": "Peanut"}, {"allergies": ["arsenic"]}, {"allergies": [1]},
+  {"ranking": "pagerank"}, {"ranking": None},
+])
+def test_forged_cursor_is_rejected(client, changes):
+  with pytest.raises(ValueError):
+    decode_cursor(forged(**changes))
+  response = client.get("/api/search", query_string={"cursor": forged(**changes)})
+  assert response.status_code == 400
+
+
+@pytest.mark.parametrize("cursor", ["not base64!", encode_cursor(SEARCH_PARAMS, -1),
+  encode_cursor(SEARCH_PARAMS, True), encode_cursor(["egg"], 0)])
+def test_malformed_cursor_is_rejected(cursor):
+  with pytest.raises(ValueError):
+    decode_cursor(cursor)
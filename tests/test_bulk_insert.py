@@ -0,0 +1,21 @@
+import datetime
+from app.db_manage2 import copy_csv
+
+
+def test_copy_csv_writes_none_as_null_marker():
+  rows = [{"id": 1, "title": "Egg Onion", "calories": None, "rating": 4.5, "review": None},
+    {"id": 2, "title": None, "calories": 120.0, "rating": None, "review": ""}]
+  columns = ["id", "title", "calories", "rating", "review"]
+  assert copy_csv(rows, columns).read() == (
+    '1,"Egg Onion",\\N,4.5,\\N\n'
+    '2,\\N,120.0,\\N,""\n')
+
+
+def test_copy_csv_quotes_strings_that_look_like_null():
+  rows = [{"title": "\\N", "description": 'say "hi",\nbye'}]
+  assert copy_csv(rows, ["title", "description"]).read() == '"\\N","say ""hi"",\nbye"\n'
+
+
+def test_copy_csv_writes_dates_as_quoted_text():
+  now = datetime.datetime(2020, 4, 1, 12, 30)
+  assert copy_csv([{"created_at": now}], ["created_at"]).read() == '"2020-04-01 12:30:00"\n'
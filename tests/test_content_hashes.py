@@ -0,0 +1,58 @@
+import json
+from app import app, db
+from app.db_manage2 import backfill_content_hashes, update_table
+from app.irsystem.models import Recipe
+from app.irsystem.models.helpers import recipe_content_hash
+
+
+def record(title, ingredients, directions):
+  return {"title": title, "ingredients": ingredients, "directions": directions,
+    "categories": [], "desc": None, "date": None, "fat": None, "calories": None,
+    "protein": None, "rating": None, "sodium": None}
+
+
+def test_backfill_hashes_legacy_rows_however_their_lists_are_joined(client, tmp_path):
+  toast = record("Egg Toast", ["1 egg", "1 slice bread"], ["Toast the bread.", "Add the egg."])
+  soup = record("Onion Soup", ["2 onions", "1 qt stock"], ["Slice the onions.", "Simmer."])
+  path = tmp_path / "recipes.json"
+  path.write_text(json.dumps([toast, soup]))
+  with app.app_context():
+    db.session.add_all([
+      # as loaded by populate_db and update_table
+      Recipe(id=1, title=toast["title"], ingredients=" ".join(toast["ingredients"]),
+        directions=" ".join(toast["directions"])),
+      # as left by delimitDatabaseLists
+      Recipe(id=2, title=soup["title"], ingredients=";;;".join(soup["ingredients"]),
+        directions=";;;".join(soup["directions"])),
+      # not in the dataset
+      Recipe(id=3, title="Tea", ingredients="1 tea bag;;;water", directions="Steep."),
+      # a duplicate keeps a NULL hash
+      Recipe(id=4, title=toast["title"], ingredients=";;;".join(toast["ingredients"]),
+        directions=";;;".join(toast["directions"]))])
+    db.session.commit()
+    backfill_content_hashes(path=str(path))
+    hashes = dict(db.session.query(Recipe.id, Recipe.content_hash))
+  assert hashes == {
+    1: recipe_content_hash(toast["title"], toast["ingredients"], toast["directions"]),
+    2: recipe_content_hash(soup["title"], soup["ingredients"], soup["directions"]),
+    3: recipe_content_hash("Tea", ["1 tea bag", "water"], ["Steep."]),
+    4: None}
+
+
+def test_update_table_matches_records_by_content_hash(client, tmp_path):
+  toast = record("Egg Toast", ["1 egg", "1 slice bread"], ["Toast the bread.", "Add the egg."])
+  soup = record("Onion Soup", ["2 onions", "1 qt stock"], ["Slice the onions.", "Simmer."])
+  toast["categories"] = ["Breakfast"]
+  soup["categories"] = ["Soup", "Dinner"]
+  path = tmp_path / "recipes.json"
+  # the duplicate toast record moves soup off its file position
+  path.write_text(json.dumps([toast, toast, soup]))
+  with app.app_context():
+    for recipe_id, d in ((1, toast), (2, soup)):
+      db.session.add(Recipe(id=recipe_id, title=d["title"].lower(),
+        content_hash=recipe_content_hash(d["title"], d["ingredients"], d["directions"])))
+    db.session.commit()
+    update_table(path=str(path))
+    rows = {r.id: (r.title, r.categories, r.ingredients) for r in db.session.query(Recipe)}
+  assert rows == {1: ("Egg Toast", "Breakfast", "1 egg 1 slice bread"),
+    2: ("Onion Soup", "Soup Dinner", "2 onions 1 qt stock")}
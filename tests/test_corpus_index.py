@@ -0,0 +1,40 @@
+from app.irsystem.models.corpus_index import CorpusIndex
+
+ROWS = [
+  (1, "Scrambled Eggs", "3 eggs;;;butter", "Breakfast", "breakfast"),
+  (2, "Onion Soup", "2 onions;;;1 qt stock;;;soy bean paste", "Soup", "dinner"),
+  (3, "Egg Salad", "4 eggs;;;mayonnaise;;;anchovies", "Lunch;;;Salad", "lunch"),
+  (4, "Veggie Omelet", "2 eggs;;;1 pepper", None, "breakfast"),
+  (5, "Eggnog", None, "Drink", None),
+  (7, "Tomato Salad", "2 tomatoes;;;olive oil;;;soybean oil", "Lunch", "lunch"),
+]
+
+
+def naive_like(field, term):
+  """ The ids a LIKE '%term%' on field finds, ignoring case. """
+  position = {"title": 1, "ingredients": 2, "categories": 3}[field]
+  return [row[0] for row in ROWS if row[position] is not None
+    and term.lower() in row[position].lower()]
+
+
+def test_lookup_matches_like():
+  index = CorpusIndex(ROWS)
+  for field, term in [("title", "egg"), ("title", "EGG"), ("title", "salad"),
+    ("ingredients", "anchov"), ("ingredients", "soy bean"), ("ingredients", "oil"),
+    ("ingredients", "eggs;;;b"), ("categories", "drink"), ("title", "pizza")]:
+    assert index.lookup(field, term).tolist() == naive_like(field, term), (field, term)
+
+
+def test_match_any_is_the_union_of_lookups():
+  index = CorpusIndex(ROWS)
+  assert index.match_any("title", ["salad", "soup"]).tolist() == [2, 3, 7]
+  assert index.match_any("ingredients", ["soy", "pepper"]).tolist() == [2, 4, 7]
+  assert index.match_any("ingredients", []).tolist() == []
+
+
+def test_null_fields_and_meal_types():
+  index = CorpusIndex(ROWS)
+  assert index.present("ingredients").tolist() == [1, 2, 3, 4, 7]
+  assert index.meal_type_ids("Lunch").tolist() == [3, 7]
+  assert index.tokens("title", 3) == {"egg", "salad"}
+  assert index.tokens("ingredients", 5) == set()
@@ -0,0 +1,39 @@
+from flask import Flask
+from flask_sqlalchemy import SQLAlchemy
+from app import database
+
+
+def test_read_query_reads_from_the_replica(tmp_path, monkeypatch):
+  app = Flask(__name__)
+  app.config.from_object("config.TestingConfig")
+  app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///" + str(tmp_path / "primary.db")
+  app.config["SQLALCHEMY_REPLICA_URI"] = "sqlite:///" + str(tmp_path / "replica.db")
+  app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+  app.config["DB_GEVENT"] = False
+  database.configure_database(app)
+  db = SQLAlchemy(app)
+
+  class Recipe(db.Model):
+    __tablename__ = "recipes"
+    id = db.Column(db.Integer, primary_key=True)
+    title = db.Column(db.String())
+
+  monkeypatch.setattr(database, "_read_session", None)
+  database.init_read_session(app, db)
+  with app.app_context():
+    for bind, title in ((None, "Egg Onion"), (database.REPLICA_BIND, "REPLICA Egg Onion")):
+      engine = db.get_engine(app, bind=bind)
+      Recipe.__table__.create(engine)
+      engine.execute(Recipe.__table__.insert(), id=1, title=title)
+
+    assert [r.title for r in database.read_query(Recipe)] == ["REPLICA Egg Onion"]
+    assert [r.title for r in db.session.query(Recipe)] == ["Egg Onion"]
+
+
+def test_pool_endpoint_is_off_by_default(client, monkeypatch):
+  from app import app
+  assert client.get("/api/db-pool").status_code == 404
+  monkeypatch.setitem(app.config, "DB_POOL_ENDPOINT_ENABLED", True)
+  response = client.get("/api/db-pool")
+  assert response.status_code == 200
+  assert response.get_json()["data"] == {"pools": {}}
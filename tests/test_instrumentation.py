@@ -0,0 +1,28 @@
+import pytest
+import sqlalchemy as sa
+from app import app
+from app.instrumentation import STARTED_AT_KEY, current_request_stats, start_request
+
+
+def test_failed_statement_leaves_no_start_time(client):
+  engine = sa.create_engine("sqlite://")
+  with app.test_request_context("/"), engine.connect() as conn:
+    start_request()
+    with pytest.raises(sa.exc.OperationalError):
+      conn.execute("SELECT * FROM no_such_table")
+    assert conn.info[STARTED_AT_KEY] == {}
+    conn.execute("SELECT 1")
+    assert conn.info[STARTED_AT_KEY] == {}
+    stats = current_request_stats()
+    assert stats.sql_statements == 1
+
+
+def test_metrics_record_closed_requests(client, monkeypatch):
+  monkeypatch.setitem(app.config, "METRICS_ENDPOINT_ENABLED", True)
+  client.get("/metrics").close()
+  body = client.get("/metrics").get_data(as_text=True)
+  assert 'http_request_duration_seconds_count{endpoint="metrics",method="GET",status="200"}' in body
+
+
+def test_metrics_endpoint_is_off_by_default(client):
+  assert client.get("/metrics").status_code == 404
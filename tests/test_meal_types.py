@@ -0,0 +1,33 @@
+import datetime
+import numpy as np
+from app import app, db
+from app.db_manage2 import classify_meal_types, compute_idf, build_features
+from app.irsystem.models import Recipe, Category, RecipeCategorization
+
+
+class BrunchClassifier(object):
+  """Breakfast for recipes with the brunch category feature, else dinner."""
+  def __init__(self, brunch_col):
+    self.brunch_col = brunch_col
+
+  def predict(self, features):
+    return np.where(features[:, self.brunch_col].toarray().ravel() > 0, "0", "2")
+
+
+def test_classify_meal_types_reads_categorizations(client):
+  _, title_tf, category_tf, title_vocab, category_vocab = build_features(
+    [("egg toast", ["Brunch"]), ("roast", ["Dinner Party"])])
+  model = {"title_vocab": title_vocab, "category_vocab": category_vocab,
+    "category_cols": list(range(len(category_vocab))),
+    "title_idf": compute_idf(title_tf), "category_idf": compute_idf(category_tf),
+    "classifier": BrunchClassifier(len(title_vocab) + category_vocab["brunch"])}
+  now = datetime.datetime.now()
+  with app.app_context():
+    # as after populate_db: categorizations written, recipes.categories not yet
+    db.session.add_all([Recipe(id=1, title="Egg Toast"), Recipe(id=2, title="Egg Toast"),
+      Category(id=1, name="Brunch"),
+      RecipeCategorization(recipe_id=1, category_id=1, created_at=now)])
+    db.session.commit()
+    classify_meal_types(model)
+    meal_types = dict(db.session.query(Recipe.id, Recipe.meal_type))
+  assert meal_types == {1: "breakfast", 2: "dinner"}
@@ -0,0 +1,76 @@
+import importlib.util
+import os
+import sqlalchemy as sa
+from alembic.migration import MigrationContext
+from alembic.operations import Operations
+from flask import Flask
+from flask_migrate import Migrate, upgrade
+from flask_sqlalchemy import SQLAlchemy
+from app.irsystem.models.allergens import allergen_bits
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MIGRATIONS = os.path.join(ROOT, "migrations")
+VERSIONS = os.path.join(MIGRATIONS, "versions")
+
+
+def load_migration(filename):
+  spec = importlib.util.spec_from_file_location(filename[:-3], os.path.join(VERSIONS, filename))
+  module = importlib.util.module_from_spec(spec)
+  spec.loader.exec_module(module)
+  return module
+
+
+def upgrade_to_head(uri):
+  app = Flask(__name__)
+  app.config["SQLALCHEMY_DATABASE_URI"] = uri
+  app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+  Migrate(app, SQLAlchemy(app))
+  with app.app_context():
+    upgrade(directory=MIGRATIONS)
+
+
+def columns(engine, table):
+  return {column["name"] for column in sa.inspect(engine).get_columns(table)}
+
+
+def test_fresh_database_upgrades_to_head(tmp_path):
+  uri = "sqlite:///" + str(tmp_path / "fresh.db")
+  upgrade_to_head(uri)
+  engine = sa.create_engine(uri)
+  tables = set(sa.inspect(engine).get_table_names())
+  assert {"users", "sessions", "recipes", "categories", "recipe_categorizations",
+    "job_progress", "recipes_fts"} <= tables
+  assert {"allergen_mask", "content_hash"} <= columns(engine, "recipes")
+
+
+def test_original_create_all_database_upgrades_to_head(tmp_path):
+  uri = "sqlite:///" + str(tmp_path / "legacy.db")
+  engine = sa.create_engine(uri)
+  engine.execute("CREATE TABLE recipes (id INTEGER PRIMARY KEY, created_at DATETIME, "
+    "updated_at DATETIME, title VARCHAR, ingredients VARCHAR, directions VARCHAR, "
+    "description VARCHAR, categories VARCHAR)")
+  engine.execute("INSERT INTO recipes (id, title, ingredients) VALUES (1, 'Omelet', '2 eggs')")
+  upgrade_to_head(uri)
+  assert engine.execute("SELECT allergen_mask FROM recipes").scalar() == allergen_bits["Egg"]
+  assert "review" not in columns(engine, "recipes")
+
+
+def test_allergen_mask_migration_backfills_existing_recipes():
+  engine = sa.create_engine("sqlite://")
+  with engine.connect() as conn:
+    conn.execute("CREATE TABLE recipes (id INTEGER PRIMARY KEY, ingredients VARCHAR)")
+    conn.execute("INSERT INTO recipes (id, ingredients) VALUES "
+      "(1, '2 eggs;;;1 cup milk'), (2, '1 onion'), (3, NULL)")
+    migration = load_migration("3f1c2a9b7d10_add_recipes_allergen_mask.py")
+    with Operations.context(MigrationContext.configure(conn)):
+      migration.upgrade()
+    masks = dict(conn.execute("SELECT id, allergen_mask FROM recipes").fetchall())
+  assert masks == {1: allergen_bits["Egg"] | allergen_bits["Dairy"], 2: 0, 3: None}
+
+
+def test_allergen_mask_migration_uses_its_frozen_foods():
+  migration = load_migration("3f1c2a9b7d10_add_recipes_allergen_mask.py")
+  assert migration.allergen_mask("1 cup Milk;;;soy sauce") == (1 << 0) | (1 << 5)
+  assert migration.allergen_mask("pine nuts, tuna, shrimp") == (1 << 2) | (1 << 4) | (1 << 6)
+  assert migration.allergen_mask("peanut oil;;;whole wheat flour") == (1 << 3) | (1 << 7)
+  assert migration.allergen_mask("1 onion") == 0
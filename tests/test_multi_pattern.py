@@ -0,0 +1,36 @@
+import random
+import pytest
+from app.irsystem.models.multi_pattern import PatternMatcher
+
+
+def naive_scan(patterns, text):
+  return sorted((i + len(p), p) for p in set(patterns) if p
+    for i in range(len(text) - len(p) + 1) if text.startswith(p, i))
+
+
+@pytest.mark.parametrize("patterns, text", [
+  (["egg", "eggs", "gg", "veggie"], "veggies and eggs, eggplant"),
+  (["he", "she", "his", "hers"], "ushers ahishers"),
+  (["soy bean", "bean", "an"], "soy beans and a banana"),
+  (["aaa", "aa", "a"], "aaaaa"),
+  (["anchov", ""], "anchovies"),
+  ([], "anything"),
+])
+def test_scan_agrees_with_naive_search(patterns, text):
+  assert sorted(PatternMatcher(patterns).scan(text)) == naive_scan(patterns, text)
+
+
+def test_random_patterns_agree_with_naive_search():
+  rng = random.Random(11)
+  for _ in range(50):
+    patterns = ["".join(rng.choice("abc") for _ in range(rng.randint(1, 4)))
+      for _ in range(rng.randint(1, 8))]
+    text = "".join(rng.choice("abc ") for _ in range(rng.randint(0, 40)))
+    matcher = PatternMatcher(patterns)
+    assert sorted(matcher.scan(text)) == naive_scan(patterns, text)
+    assert matcher.findall(text) == {p for _, p in naive_scan(patterns, text)}
+
+
+def test_matching_is_case_sensitive():
+  assert PatternMatcher(["Egg"]).findall("egg Eggs") == {"Egg"}
+  assert len(PatternMatcher(["egg", "egg", ""])) == 1
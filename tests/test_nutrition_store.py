@@ -0,0 +1,46 @@
+import warnings
+import numpy as np
+from app.irsystem.models.nutrition_store import NutritionStore, clean_rating
+from app.irsystem.models.postings import Postings
+
+ROWS = [
+  (1, 300.0, 10.0, 500.0, 20.0, 4.5, "breakfast", 0),
+  (2, 900.0, 40.0, 1500.0, 35.0, 3.75, "dinner", 1 << 1),
+  (3, None, 5.0, 200.0, None, None, "lunch", None),
+  (4, 450.0, None, 700.0, 12.0, 12.0, None, 1 << 4),
+  (6, 250.0, 8.0, 300.0, 9.0, 4.0, "breakfast", 0),
+]
+ALL = Postings([1, 2, 3, 4, 6])
+
+
+def store():
+  return NutritionStore(ROWS)
+
+
+def test_limits_skip_null_values_without_warnings():
+  with warnings.catch_warnings():
+    warnings.simplefilter("error")
+    with np.errstate(invalid="warn"):
+      assert store().filter(ALL, cal_limit="500").tolist() == [1, 4, 6]
+      assert store().filter(ALL, fat_limit=10).tolist() == [1, 3, 6]
+      assert store().filter(ALL, cal_limit=1000, fat_limit=50,
+        sodium_limit=1000).tolist() == [1, 6]
+
+
+def test_meal_type_and_allergies():
+  assert store().filter(ALL, m_type="breakfast").tolist() == [1, 6]
+  assert store().filter(ALL, m_type="brunch").tolist() == []
+  # a recipe without a mask may contain anything
+  assert store().filter(ALL, allergy_mask=1 << 1).tolist() == [1, 4, 6]
+  assert store().filter(ALL, allergy_mask=0).tolist() == [1, 2, 3, 4, 6]
+
+
+def test_filter_ignores_ids_not_in_the_store():
+  assert store().filter(Postings([0, 2, 5, 6, 9])).tolist() == [2, 6]
+  assert NutritionStore([]).filter(ALL, cal_limit=100).tolist() == []
+
+
+def test_clean_ratings_align_with_the_ids_asked_for():
+  assert store().clean_ratings([6, 5, 1, 4, 3, 99]).tolist() == [4.0, 0.0, 4.5, 0.0, 0.0, 0.0]
+  assert NutritionStore([]).clean_ratings([1, 2]).tolist() == [0.0, 0.0]
+  assert [clean_rating(r) for r in (None, 3.5, 5, 5.5)] == [0, 3.5, 5, 0]
@@ -0,0 +1,42 @@
+import random
+import pytest
+from app.irsystem.models.postings import Postings, as_postings, difference, intersect, \
+  intersect_all, intersect_galloping, intersect_merge, union_all, EMPTY
+
+
+def random_ids(rng, size, universe=5000):
+  return set(rng.sample(range(universe), size))
+
+
+@pytest.mark.parametrize("sizes", [(0, 0), (0, 50), (1, 1), (5, 3000), (300, 400),
+  (2000, 2500), (40, 40)])
+def test_set_operations_agree_with_python_sets(sizes):
+  rng = random.Random(sum(sizes))
+  a, b = (random_ids(rng, size) for size in sizes)
+  p, q = Postings(a), Postings(b)
+  assert intersect_merge(p, q).tolist() == sorted(a & b)
+  assert intersect_galloping(p, q).tolist() == sorted(a & b)
+  assert intersect_galloping(q, p).tolist() == sorted(a & b)
+  assert intersect(p, q).tolist() == sorted(a & b)
+  assert (p & q).tolist() == sorted(a & b)
+  assert (p | q).tolist() == sorted(a | b)
+  assert difference(p, q).tolist() == sorted(a - b)
+  assert (q - p).tolist() == sorted(b - a)
+
+
+def test_k_way_operations_agree_with_python_sets():
+  rng = random.Random(7)
+  sets = [random_ids(rng, size, universe=800) for size in (600, 20, 350, 500, 0)]
+  assert union_all([Postings(s) for s in sets]).tolist() == sorted(set().union(*sets))
+  assert intersect_all([Postings(s) for s in sets[:4]]).tolist() == \
+    sorted(set.intersection(*sets[:4]))
+  assert intersect_all([Postings(s) for s in sets]) == EMPTY
+  assert union_all([]) == EMPTY and intersect_all([]) == EMPTY
+
+
+def test_postings_sort_and_deduplicate_their_input():
+  postings = Postings([5, 1, 3, 5, 1])
+  assert postings.tolist() == [1, 3, 5]
+  assert 3 in postings and 4 not in postings
+  assert as_postings([(3, 2), (1, 1)]).tolist() == [1, 3]
+  assert as_postings(postings) is postings
@@ -0,0 +1,93 @@
+import pytest
+from app.irsystem.models import corpus_stats, result_cache
+from app.irsystem.models.result_cache import LRUCache, SearchResultCache
+
+PARAMS = {"fav_foods": "egg", "meal_types": ["breakfast"]}
+RESULTS = {"breakfast": [3, 1, 2]}
+
+
+class Clock(object):
+  def __init__(self):
+    self.now = 1000.0
+
+  def time(self):
+    return self.now
+
+
+@pytest.fixture(autouse=True)
+def corpus_version(monkeypatch):
+  monkeypatch.setattr(corpus_stats, "_corpus_version", (100, "2020-04-01 12:00:00"))
+
+
+@pytest.fixture
+def fakeredis():
+  # only the Redis tier needs fakeredis (requirements-dev.txt)
+  return pytest.importorskip("fakeredis")
+
+
+@pytest.fixture
+def clock(monkeypatch):
+  clock = Clock()
+  monkeypatch.setattr(result_cache, "time", clock)
+  return clock
+
+
+def test_lru_evicts_least_recently_used():
+  cache = LRUCache(maxsize=2, ttl=60)
+  cache.set("a", 1)
+  cache.set("b", 2)
+  assert cache.get("a") == 1
+  cache.set("c", 3)
+  assert cache.get("b") is None
+  assert cache.get("a") == 1
+  assert cache.get("c") == 3
+  assert len(cache) == 2
+
+
+def test_lru_expires_entries_after_ttl(clock):
+  cache = LRUCache(maxsize=2, ttl=60)
+  cache.set("a", 1)
+  clock.now += 59
+  assert cache.get("a") == 1
+  clock.now += 2
+  assert cache.get("a") is None
+  assert len(cache) == 0
+
+
+def test_redis_round_trip(fakeredis):
+  server = fakeredis.FakeServer()
+  writer = SearchResultCache(LRUCache(8, 60), fakeredis.FakeStrictRedis(server=server), ttl=60)
+  reader = SearchResultCache(LRUCache(8, 60), fakeredis.FakeStrictRedis(server=server), ttl=60)
+  writer.set(PARAMS, RESULTS)
+  key = SearchResultCache.key(PARAMS)
+  assert 0 < writer.redis.ttl(key) <= 60
+  # another worker misses locally, hits Redis and fills its local tier
+  assert reader.get(PARAMS) == RESULTS
+  assert reader.local.get(key) == RESULTS
+
+
+def test_redis_errors_degrade_to_a_miss(fakeredis):
+  server = fakeredis.FakeServer()
+  server.connected = False
+  cache = SearchResultCache(LRUCache(8, 60), fakeredis.FakeStrictRedis(server=server), ttl=60)
+  cache.set(PARAMS, RESULTS)
+  assert cache.get(PARAMS) == RESULTS
+  cache.clear_local()
+  assert cache.get(PARAMS) is None
+
+
+def test_corpus_change_invalidates_entries(monkeypatch, fakeredis):
+  server = fakeredis.FakeServer()
+  cache = SearchResultCache(LRUCache(8, 60), fakeredis.FakeStrictRedis(server=server), ttl=60)
+  monkeypatch.setattr(result_cache, "_search_cache", cache)
+  monkeypatch.setattr(corpus_stats, "invalidate_corpus_index", lambda: None)
+  monkeypatch.setattr(corpus_stats, "invalidate_nutrition_store", lambda: None)
+  cache.set(PARAMS, RESULTS)
+
+  corpus_stats.invalidate_corpus_caches()
+  assert len(cache.local) == 0
+  # same corpus: the entry is still in Redis
+  assert cache.get(PARAMS) == RESULTS
+
+  monkeypatch.setattr(corpus_stats, "_corpus_version", (101, "2020-04-02 08:00:00"))
+  assert cache.get(PARAMS) is None
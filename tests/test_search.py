@@ -0,0 +1,36 @@
+from flask import request
+from app import app, db
+from app.irsystem.models import Recipe
+
+
+def test_version_2_search_with_drinks(client):
+  with app.app_context():
+    db.session.add(Recipe(id=1, title="Onion Soup", ingredients="2 onions;;;1 qt stock",
+      directions="Simmer.", categories="Soup", meal_type="dinner", calories=300.0,
+      fat=10.0, sodium=500.0, allergen_mask=0))
+    db.session.commit()
+  response = client.get("/", query_string={"version": "2", "fav-foods": "egg", "res-foods": "",
+    "breakfast": "on", "include-drink": "on"})
+  assert response.status_code == 200
+  assert b"No Results Found" in response.data
+
+
+def test_ranks_only_the_results_the_page_needs(client):
+  from app.irsystem.controllers.search_controller import get_ranked_ids, \
+    parse_search_args, ranked_count, search_params_of
+  from app.irsystem.models.result_cache import get_search_cache
+  with app.app_context():
+    for i in range(1, 31):
+      db.session.add(Recipe(id=i, title="Egg Dish {}".format(i), ingredients="1 egg",
+        categories="Breakfast", meal_type="breakfast", calories=300.0, fat=10.0,
+        sodium=500.0, allergen_mask=0))
+    db.session.commit()
+  with app.test_request_context(query_string={"fav-foods": "egg", "breakfast": "on"}):
+    search_params = search_params_of(parse_search_args(request.args))
+    assert len(get_ranked_ids(search_params, ranked_count(0, 10))["breakfast"]) == 11
+    assert get_search_cache(app.config).get(search_params)["max_results"] == 11
+    # a later page ranks again, further down
+    assert len(get_ranked_ids(search_params, ranked_count(10, 10))["breakfast"]) == 21
+    assert get_search_cache(app.config).get(search_params)["max_results"] == 21
+    # an earlier one is served from the cache
+    assert len(get_ranked_ids(search_params, ranked_count(0, 10))["breakfast"]) == 21
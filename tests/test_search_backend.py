@@ -0,0 +1,79 @@
+import importlib.util
+import os
+import pytest
+from alembic.migration import MigrationContext
+from alembic.operations import Operations
+from app import app, db
+from app.irsystem.models import Recipe
+from app.irsystem.models.search_backend import MemorySearchBackend, SQLiteSearchBackend
+
+FTS_MIGRATION = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+  "migrations", "versions", "8b4e6d2f1a57_add_recipes_full_text_search.py")
+
+RECIPES = [
+  (1, "Egg Toast", "1 egg;;;1 slice bread", "Breakfast", 3.0),
+  (2, "Scrambled Eggs", "3 eggs;;;butter", "Breakfast", 4.5),
+  (3, "Onion Soup", "2 onions;;;1 qt stock", "Soup", 5.0),
+  (4, "Eggnog", "2 eggs;;;1 cup milk", "Drink", 4.0),
+  (5, "Veggie Omelet", "2 eggs;;;1 pepper", "Breakfast", None),
+  (6, "Egg Salad", "4 eggs;;;mayonnaise", None, 4.5),
+]
+
+
+def run_fts_migration(step):
+  spec = importlib.util.spec_from_file_location("fts_migration", FTS_MIGRATION)
+  migration = importlib.util.module_from_spec(spec)
+  spec.loader.exec_module(migration)
+  with db.engine.connect() as conn:
+    with Operations.context(MigrationContext.configure(conn)):
+      getattr(migration, step)()
+
+
+@pytest.fixture
+def recipes(client):
+  with app.app_context():
+    run_fts_migration("upgrade")
+    for recipe_id, title, ingredients, categories, rating in RECIPES:
+      db.session.add(Recipe(id=recipe_id, title=title, ingredients=ingredients,
+        categories=categories, rating=rating))
+    db.session.commit()
+    yield
+    db.session.remove()
+    run_fts_migration("downgrade")
+
+
+@pytest.fixture
+def fts(recipes):
+  return SQLiteSearchBackend()
+
+
+@pytest.fixture(params=[MemorySearchBackend, SQLiteSearchBackend])
+def backend(request, recipes):
+  return request.param()
+
+
+def test_sqlite_match_terms_matches_prefixes_and_skips_drinks(fts):
+  assert fts.match_terms("title", ["egg"], [], False).tolist() == [1, 2]
+  assert fts.match_terms("title", ["egg"], [], True).tolist() == [1, 2, 4, 6]
+
+
+def test_sqlite_match_terms_stops_at_limit_best_rated_first(fts):
+  assert fts.match_terms("ingredients", ["eggs"], [], True, limit=2).tolist() == [2, 6]
+  # unrated recipes come last
+  assert fts.match_terms("ingredients", ["eggs"], [], True, limit=3).tolist() == [2, 4, 6]
+
+
+def test_backends_agree_on_omitted_words_and_nulls(backend):
+  assert backend.match_terms("ingredients", ["eggs"], ["milk"], True).tolist() == [2, 5, 6]
+  # recipe 6 has no categories, so it is not known not to be a drink
+  assert backend.match_terms("ingredients", ["eggs"], ["milk"], False).tolist() == [2, 5]
+  assert backend.match_terms("title", [], ["soup"], True).tolist() == [1, 2, 4, 5, 6]
+  assert backend.match_any("title", ["soup", "salad"]).tolist() == [3, 6]
+
+
+def test_memory_backend_matches_substrings(recipes):
+  backend = MemorySearchBackend()
+  assert backend.match_terms("title", ["egg"], [], False).tolist() == [1, 2, 5]
+  assert backend.match_terms("title", ["egg"], [], True).tolist() == [1, 2, 4, 5, 6]
+  # fields outside the corpus index fall back to LIKE
+  assert backend.match_any("directions", ["egg"]).tolist() == []
@@ -0,0 +1,46 @@
+import pytest
+from app import app, db
+from app.irsystem.models import Recipe
+
+
+@pytest.fixture
+def onion_recipes(client):
+  with app.app_context():
+    db.session.add_all([Recipe(id=i, title="Onion Soup {}".format(i),
+      ingredients="{} onions;;;1 qt stock".format(i), directions="Simmer.", categories="Soup",
+      meal_type="dinner", calories=300.0, fat=10.0, sodium=500.0, rating=4.0, allergen_mask=0)
+      for i in range(1, 31)])
+    db.session.commit()
+  return client
+
+
+@pytest.mark.parametrize("streaming", [True, False])
+def test_ranking_is_kept_on_results_and_page_links(onion_recipes, streaming, monkeypatch):
+  monkeypatch.setitem(app.config, "SEARCH_STREAMING", streaming)
+  response = onion_recipes.get("/", query_string={"fav-foods": "onion", "ranking": "bm25",
+    "dinner": "on"})
+  page = response.get_data(as_text=True)
+  assert response.status_code == 200
+  assert '<option selected value="bm25">' in page
+  assert "Onion Soup" in page
+  assert "Next page" in page and "Previous page" not in page
+  next_url = [part.split('"', 1)[0] for part in page.split('href="')
+    if "page=2" in part.split('"', 1)[0]]
+  assert len(next_url) == 1
+  assert "ranking=bm25" in next_url[0] and "fav-foods=onion" in next_url[0]
+
+  second = onion_recipes.get(next_url[0].replace("&amp;", "&")).get_data(as_text=True)
+  assert '<option selected value="bm25">' in second
+  assert "Previous page" in second
+
+
+@pytest.mark.parametrize("streaming", [True, False])
+def test_ranks_continue_across_pages(onion_recipes, streaming, monkeypatch):
+  monkeypatch.setitem(app.config, "SEARCH_STREAMING", streaming)
+  query = {"fav-foods": "onion", "dinner": "on"}
+  first = onion_recipes.get("/", query_string=query).get_data(as_text=True)
+  second = onion_recipes.get("/", query_string=dict(query, page="2")).get_data(as_text=True)
+  assert '"normal-title">1. ' in first and '"normal-title">10. ' in first
+  assert '"normal-title">11. ' not in first
+  assert '"normal-title">11. ' in second and '"normal-title">20. ' in second
+  assert '"normal-title">1. ' not in second
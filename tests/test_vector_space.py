@@ -0,0 +1,31 @@
+import pytest
+from app.irsystem.models.corpus_index import CorpusIndex
+from app.irsystem.models.vector_space import VectorSpaceModel
+
+ROWS = [
+  (1, "Scrambled Eggs", "3 eggs;;;butter", "Breakfast", "breakfast"),
+  (2, "Onion Soup", "2 onions;;;1 qt stock", "Soup", "dinner"),
+  (3, "Egg Salad", "4 eggs;;;mayonnaise", "Lunch", "lunch"),
+  (4, "Tomato Salad", "2 tomatoes;;;olive oil", "Lunch", "lunch"),
+]
+
+
+@pytest.fixture
+def model():
+  return VectorSpaceModel(CorpusIndex(ROWS), max_df_ratio=1.0)
+
+
+@pytest.mark.parametrize("mode", ["cosine", "bm25"])
+def test_query_words_score_their_plurals(model, mode):
+  # only "eggs" is in recipe 1; the query asks for "egg"
+  scores = model.score_ids(mode, ["egg"], [1, 2, 3, 4])
+  assert scores[0] > 0 and scores[2] > 0
+  assert scores[1] == 0 and scores[3] == 0
+  assert model.top_k(model.scores(mode, ["egg"]), 2) == [3, 1]
+
+
+def test_query_vector_counts_each_expanded_term(model):
+  vector = model.query_vector(["egg", "onion"])
+  assert {term for term, col in model.vocab.items() if vector[col] > 0} == \
+    {"egg", "eggs", "onion", "onions"}
+  assert model.query_vector(["anchovy"]).sum() == 0